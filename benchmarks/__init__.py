@@ -0,0 +1 @@
+"""Generador de datos sintéticos y benchmarks del sugeridor de materiales."""
@@ -0,0 +1,250 @@
+"""
+Benchmarks de escalamiento del sugeridor de materiales.
+
+Genera datos sintéticos a distintas escalas y mide el tiempo de cada etapa del
+pipeline. Los resultados se guardan como JSON para comparar corridas entre
+versiones.
+
+Ejemplo (desde la raíz del repositorio):
+    python -m benchmarks.ejecutar --escalas 1000 10000 --repeticiones 3
+    python -m benchmarks.ejecutar --escalas 1000 --excel   # incluye lectura de libros
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import motor
+from benchmarks.generador import escribir_libros, generar_conjunto
+
+logger = logging.getLogger("benchmarks")
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(__file__), "resultados")
+
+
+def _commit_actual() -> str:
+    """Commit de git del árbol medido (vacío si no hay git)."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return ""
+
+
+def _cronometrar(funcion: Callable, repeticiones: int):
+    """Ejecuta la función `repeticiones` veces; retorna (último resultado, tiempos)."""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, tiempos
+
+
+def _ingesta(conjunto: Dict[str, object]) -> Dict[str, object]:
+    """Normaliza copias de los DataFrames crudos, como lo hace la carga de libros."""
+    return {
+        "pedidos": motor.procesar_hoja_pedidos(conjunto["pedidos"].copy()),
+        "inventario": motor.procesar_hoja_inventario_ajustada(
+            conjunto["inventario"].copy(), avisar=logger.debug
+        ),
+        "externas": {
+            nombre: motor.procesar_hoja_externa(hoja.copy(), nombre)
+            for nombre, hoja in conjunto["externas"].items()
+        },
+        "facturacion": motor.procesar_datos_facturacion(conjunto["facturacion"].copy()),
+    }
+
+
+def _lectura_excel(rutas: Dict[str, str]) -> Dict[str, object]:
+    """Lee y normaliza los cuatro libros como lo hace la interfaz."""
+    return {
+        "pedidos": motor.cargar_pedidos(rutas["pedidos"]),
+        "inventario": motor.cargar_inventario(rutas["inventario"], avisar=logger.debug),
+        "externas": motor.cargar_hojas_externas(rutas["externas"], avisar=logger.debug),
+        "facturacion": motor.cargar_facturacion(
+            rutas["facturacion"], avisar=logger.debug
+        ),
+    }
+
+
+def medir_escala(
+    filas: int,
+    semilla: int = 0,
+    repeticiones: int = 1,
+    incluir_excel: bool = False,
+    etapas: Optional[List[str]] = None,
+) -> Dict[str, object]:
+    """Mide todas las etapas para una escala; retorna el registro para el JSON."""
+    conjunto = generar_conjunto(filas, semilla)
+    registro = {
+        "filas": filas,
+        "filas_por_hoja": {
+            "pedidos": len(conjunto["pedidos"]),
+            "inventario": len(conjunto["inventario"]),
+            "facturacion": len(conjunto["facturacion"]),
+            **{
+                f"externa:{nombre}": len(hoja)
+                for nombre, hoja in conjunto["externas"].items()
+            },
+        },
+        "etapas": {},
+    }
+
+    def registrar(nombre: str, tiempos: List[float], **extra) -> None:
+        registro["etapas"][nombre] = {
+            "segundos": min(tiempos),
+            "mediana": float(np.median(tiempos)),
+            "repeticiones": len(tiempos),
+            **extra,
+        }
+        logger.info(f"[{filas:>9,}] {nombre:<28} {min(tiempos):9.3f} s")
+
+    def activa(nombre: str) -> bool:
+        return etapas is None or nombre in etapas
+
+    if incluir_excel and activa("lectura_excel"):
+        with tempfile.TemporaryDirectory() as directorio:
+            rutas = escribir_libros(conjunto, directorio)
+            _, tiempos = _cronometrar(lambda: _lectura_excel(rutas), repeticiones)
+        registrar("lectura_excel", tiempos)
+
+    datos, tiempos = _cronometrar(lambda: _ingesta(conjunto), repeticiones)
+    if activa("ingesta"):
+        registrar("ingesta", tiempos)
+
+    fuentes = motor.FUENTES_DISPONIBLES
+    sugerencias, tiempos = _cronometrar(
+        lambda: motor.generar_todas_sugerencias(
+            datos["pedidos"], datos["externas"], fuentes, datos["inventario"]
+        ),
+        repeticiones if activa("generar_todas_sugerencias") else 1,
+    )
+    if activa("generar_todas_sugerencias"):
+        registrar("generar_todas_sugerencias", tiempos, filas_salida=len(sugerencias))
+
+    if activa("resumen"):
+        resumen, tiempos = _cronometrar(
+            lambda: motor.generar_resumen_sin_sugerencias_optimizado(
+                sugerencias,
+                datos["inventario"],
+                sugerencias,
+                datos["facturacion"].copy(),
+            ),
+            repeticiones,
+        )
+        registrar("resumen", tiempos, filas_salida=len(resumen))
+    else:
+        resumen = pd.DataFrame()
+
+    if activa("reporte_consumo"):
+        consumo, tiempos = _cronometrar(
+            lambda: motor.generar_reporte_consumo(datos["facturacion"]),
+            repeticiones,
+        )
+        registrar("reporte_consumo", tiempos, filas_salida=len(consumo))
+    else:
+        consumo = pd.DataFrame()
+
+    if activa("exportacion"):
+        archivo, tiempos = _cronometrar(
+            lambda: motor.exportar_a_excel(sugerencias, resumen, consumo),
+            repeticiones,
+        )
+        registrar("exportacion", tiempos, bytes=len(archivo))
+
+    return registro
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--escalas",
+        nargs="+",
+        type=int,
+        default=[1000, 10000],
+        help="Número de filas de pedidos/facturación (1000 a 1000000)",
+    )
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument(
+        "--etapas",
+        nargs="+",
+        default=None,
+        help="Medir solo estas etapas (ingesta, generar_todas_sugerencias, "
+        "resumen, reporte_consumo, exportacion, lectura_excel)",
+    )
+    parser.add_argument(
+        "--excel",
+        action="store_true",
+        help="Incluir escritura/lectura de libros de Excel (lento a gran escala)",
+    )
+    parser.add_argument(
+        "-o",
+        "--salida",
+        default=None,
+        help="Archivo JSON de resultados (por defecto benchmarks/resultados/<fecha>.json)",
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = construir_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("motor").setLevel(logging.WARNING)
+
+    inicio = datetime.datetime.now()
+    resultados = {
+        "fecha": inicio.isoformat(timespec="seconds"),
+        "commit": _commit_actual(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "semilla": args.semilla,
+        "escalas": [],
+    }
+
+    for filas in args.escalas:
+        resultados["escalas"].append(
+            medir_escala(
+                filas,
+                semilla=args.semilla,
+                repeticiones=args.repeticiones,
+                incluir_excel=args.excel,
+                etapas=args.etapas,
+            )
+        )
+
+    salida = args.salida
+    if salida is None:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        nombre = inicio.strftime("%Y%m%d-%H%M%S")
+        if resultados["commit"]:
+            nombre += f"-{resultados['commit']}"
+        salida = os.path.join(DIRECTORIO_RESULTADOS, f"{nombre}.json")
+
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    logger.info(f"Resultados guardados en {salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Generador de datos sintéticos con la forma de los reportes de SAP.
+
+Produce, con una semilla fija, los mismos DataFrames "crudos" que se leen de los
+cuatro libros de Excel (Seg pedidos, Inventario, hojas externas y Facturación),
+con los nombres de columna, tipos (IDs numéricos leídos como float, fechas como
+texto dd/mm/aaaa) y duplicados que traen las descargas reales.
+
+El parámetro `filas` controla el tamaño: es el número de líneas de pedido y de
+registros de facturación; el inventario y las hojas externas escalan en
+proporción.
+"""
+
+import os
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+CENTROS = [1001, 1003, 1004, 1017, 1018, 1022, 1031, 1036]
+ALMACENES = [1030, 1031, 1032, 1060]
+
+# Proporción de cada hoja externa respecto al número de filas de pedidos
+PROPORCION_EXTERNAS = {
+    "Corta caducidad": 0.10,
+    "Cosmopark": 0.05,
+    "PNC": 0.02,
+    "Caduco": 0.02,
+}
+
+
+def _materiales(rng: np.random.Generator, filas: int) -> np.ndarray:
+    """Catálogo de materiales (un material por cada ~5 líneas de pedido)."""
+    num_materiales = max(50, filas // 5)
+    return np.sort(rng.choice(np.arange(100000, 9999999), num_materiales, False))
+
+
+def _fechas_texto(fechas: pd.DatetimeIndex) -> np.ndarray:
+    return np.asarray(fechas.strftime("%d/%m/%Y"), dtype=object)
+
+
+def generar_pedidos(
+    rng: np.random.Generator, materiales: np.ndarray, filas: int
+) -> pd.DataFrame:
+    """Hoja 'Seg pedidos': ~5 líneas por pedido, algunos con bloqueo."""
+    num_pedidos = max(1, filas // 5)
+    pedidos = rng.integers(40000000, 40000000 + num_pedidos * 10, filas)
+    solicitantes = rng.integers(100000, 100000 + max(10, filas // 50), filas)
+    fecha_base = pd.Timestamp("2026-01-01")
+    return pd.DataFrame(
+        {
+            "Gpo. Cte.": rng.choice(["01", "02", "05"], filas),
+            "Fecha": fecha_base + pd.to_timedelta(rng.integers(0, 270, filas), "D"),
+            "Pedido": pedidos,
+            "Gpo. Vdor.": rng.choice(["V01", "V02", "V03", np.nan], filas),
+            "Solicitante": solicitantes,
+            "Destinatario": solicitantes + rng.integers(0, 3, filas),
+            "Razón Social": [f"CLIENTE {s}" for s in solicitantes],
+            "Centro": rng.choice(CENTROS[:-2] + [1036], filas),
+            "Almacen": rng.choice(ALMACENES[:3], filas),
+            # Excel entrega los IDs numéricos como float
+            "Material": rng.choice(materiales, filas).astype(float),
+            "Texto Material": rng.choice(["TABLETA 10MG", "JARABE 120ML"], filas),
+            "Cantidad": rng.integers(1, 500, filas),
+            "Pendiente": rng.integers(0, 500, filas),
+            "Precio": rng.uniform(5, 2000, filas).round(2),
+            "Sts. Créd.": rng.choice(["", "A", "B"], filas, p=[0.6, 0.3, 0.1]),
+            "Bloqueo Ent.": rng.choice([np.nan, "", "Z1"], filas, p=[0.7, 0.2, 0.1]),
+        }
+    )
+
+
+def generar_inventario(
+    rng: np.random.Generator, materiales: np.ndarray, filas: int
+) -> pd.DataFrame:
+    """Hoja 'Inventario' con duplicados por lote/stock especial."""
+    n = max(100, filas)
+    return pd.DataFrame(
+        {
+            "Centro": rng.choice(CENTROS, n),
+            "Material": rng.choice(materiales, n).astype(float),
+            "Almacen": rng.choice(ALMACENES, n),
+            "Texto breve de material": rng.choice(
+                ["TABLETA 10MG", "JARABE 120ML", ""], n
+            ),
+            "Libre utilización": rng.integers(0, 5000, n).astype(float),
+            "Cant. en tránsito": rng.integers(0, 200, n).astype(float),
+            "Entrega a cliente": rng.integers(0, 100, n).astype(float),
+            "Unidad medida base": "PZ",
+            "Bloqueado": rng.integers(0, 10, n),
+        }
+    )
+
+
+def generar_hojas_externas(
+    rng: np.random.Generator, materiales: np.ndarray, filas: int
+) -> Dict[str, pd.DataFrame]:
+    """Hojas externas con lotes y fechas de caducidad."""
+    hojas = {}
+    hoy = pd.Timestamp("2026-10-01")
+    for nombre, proporcion in PROPORCION_EXTERNAS.items():
+        n = max(10, int(filas * proporcion))
+        caducidad = hoy + pd.to_timedelta(rng.integers(-60, 540, n), "D")
+        hoja = pd.DataFrame(
+            {
+                "Material": rng.choice(materiales, n).astype(float),
+                "Centro": rng.choice(CENTROS, n),
+                "Almacén": rng.choice(ALMACENES[:3], n),
+                "Cantidad": rng.integers(1, 1000, n),
+                "Descripción": rng.choice(["TABLETA 10MG", "JARABE 120ML"], n),
+                "Lote": [f"L{v:07d}" for v in rng.integers(0, 10**7, n)],
+                "Fecha caducidad": _fechas_texto(pd.DatetimeIndex(caducidad)),
+            }
+        )
+        if nombre == "Cosmopark":
+            hoja = hoja.drop(columns=["Almacén"])
+        hojas[nombre] = hoja
+
+    n = max(10, filas // 20)
+    hojas["Lento mov"] = pd.DataFrame(
+        {
+            "Material": rng.choice(materiales, n, replace=False).astype(float),
+            "Texto breve": rng.choice(["TABLETA 10MG", "JARABE 120ML"], n),
+        }
+    )
+    n = max(10, filas // 50)
+    hojas["Sustituto"] = pd.DataFrame(
+        {
+            "Material": rng.choice(materiales, n).astype(float),
+            "Material sustituto": rng.choice(materiales, n).astype(float),
+            "Texto material sustituto": rng.choice(["GENÉRICO A", "GENÉRICO B"], n),
+        }
+    )
+    return hojas
+
+
+def generar_facturacion(
+    rng: np.random.Generator, materiales: np.ndarray, filas: int
+) -> pd.DataFrame:
+    """Hoja 'Facturacion' de 18 meses con ~2% de filas duplicadas."""
+    n = max(100, filas)
+    solicitantes = rng.integers(100000, 100000 + max(10, n // 50), n)
+    fechas = pd.Timestamp("2025-04-01") + pd.to_timedelta(rng.integers(0, 548, n), "D")
+    cantidad = rng.integers(1, 300, n)
+    df = pd.DataFrame(
+        {
+            "Solicitante": solicitantes,
+            "Razón Social": [f"CLIENTE {s}" for s in solicitantes],
+            "Destinatario": solicitantes + rng.integers(0, 3, n),
+            "Fecha": _fechas_texto(pd.DatetimeIndex(fechas)),
+            "Factura": rng.integers(90000000, 99999999, n),
+            "Doc. Comerc. Ant": rng.integers(80000000, 89999999, n),
+            "Material": rng.choice(materiales, n).astype(float),
+            "Texto Material": rng.choice(["TABLETA 10MG", "JARABE 120ML"], n),
+            "Cantidad": cantidad,
+            "UM": "PZ",
+            "Importe": (cantidad * rng.uniform(5, 2000, n)).round(2),
+            "Centro": rng.choice(CENTROS, n),
+            "Almacén": rng.choice(ALMACENES[:3], n),
+            "Doc. Ventas": rng.integers(40000000, 49999999, n),
+            "Gpo. Vdor.": rng.choice(["V01", "V02", "V03"], n),
+            "Grp. Cliente": rng.choice(["01", "02", "05"], n),
+        }
+    )
+    duplicados = df.sample(frac=0.02, random_state=int(rng.integers(0, 2**31)))
+    return pd.concat([df, duplicados], ignore_index=True)
+
+
+def generar_conjunto(filas: int, semilla: int = 0) -> Dict[str, object]:
+    """
+    Genera un conjunto completo de datos crudos.
+    Retorna {"pedidos", "inventario", "externas" (dict de hojas), "facturacion"}.
+    """
+    rng = np.random.default_rng(semilla)
+    materiales = _materiales(rng, filas)
+    return {
+        "pedidos": generar_pedidos(rng, materiales, filas),
+        "inventario": generar_inventario(rng, materiales, filas),
+        "externas": generar_hojas_externas(rng, materiales, filas),
+        "facturacion": generar_facturacion(rng, materiales, filas),
+    }
+
+
+def escribir_libros(conjunto: Dict[str, object], directorio: str) -> Dict[str, str]:
+    """Escribe el conjunto como los cuatro libros de Excel que recibe la app."""
+    os.makedirs(directorio, exist_ok=True)
+    rutas = {
+        "pedidos": os.path.join(directorio, "pedidos.xlsx"),
+        "inventario": os.path.join(directorio, "inventario.xlsx"),
+        "externas": os.path.join(directorio, "externas.xlsx"),
+        "facturacion": os.path.join(directorio, "facturacion.xlsx"),
+    }
+    with pd.ExcelWriter(rutas["pedidos"]) as writer:
+        conjunto["pedidos"].to_excel(writer, sheet_name="Seg pedidos", index=False)
+    with pd.ExcelWriter(rutas["inventario"]) as writer:
+        conjunto["inventario"].to_excel(writer, sheet_name="Inventario", index=False)
+    with pd.ExcelWriter(rutas["externas"]) as writer:
+        for nombre, hoja in conjunto["externas"].items():
+            hoja.to_excel(writer, sheet_name=nombre, index=False)
+    with pd.ExcelWriter(rutas["facturacion"]) as writer:
+        conjunto["facturacion"].to_excel(writer, sheet_name="Facturacion", index=False)
+    return rutas
@@ -0,0 +1,233 @@
+"""
+Caché compartida por todo el proceso.
+
+Varios usuarios suelen cargar los mismos libros del día (inventario, hojas
+externas). Sin compartir, cada sesión de Streamlit los lee y normaliza por su
+cuenta. `CacheCompartido` guarda los DataFrames normalizados y los índices
+construidos sobre ellos, identificados por la huella del contenido, con un
+presupuesto global de bytes: al excederlo se descartan las entradas usadas hace
+más tiempo (LRU).
+
+Los valores guardados son inmutables por contrato: cada consumidor recibe una
+copia superficial (`vista_lectura`), de modo que agregar o reemplazar columnas
+no afecta a las demás sesiones y los datos no se duplican en memoria. El motor
+nunca escribe celdas en su lugar sobre los DataFrames de entrada.
+
+Si varias sesiones piden la misma clave a la vez, solo una la calcula y las
+demás esperan el resultado.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PRESUPUESTO_MB_POR_DEFECTO = 1024
+
+
+def huella_contenido(contenido: bytes, *partes) -> str:
+    """Huella del contenido de un archivo más partes adicionales (opciones)."""
+    h = hashlib.blake2b(contenido, digest_size=16)
+    for parte in partes:
+        h.update(b"\x00")
+        h.update(repr(parte).encode("utf-8"))
+    return h.hexdigest()
+
+
+def huella_dataframe(df: Optional[pd.DataFrame]) -> str:
+    """Huella del contenido de un DataFrame (columnas, índice y valores)."""
+    h = hashlib.blake2b(digest_size=16)
+    if df is None:
+        return h.hexdigest()
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def huella_entradas(*frames) -> str:
+    """Huella combinada de varios DataFrames (o dicts de DataFrames por nombre)."""
+    h = hashlib.blake2b(digest_size=16)
+    for frame in frames:
+        if isinstance(frame, dict):
+            for nombre in sorted(frame):
+                h.update(nombre.encode("utf-8"))
+                h.update(huella_dataframe(frame[nombre]).encode("ascii"))
+        else:
+            h.update(huella_dataframe(frame).encode("ascii"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def medir_bytes(valor) -> int:
+    """Memoria aproximada de un valor cacheado (DataFrames, dicts, arreglos)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    if isinstance(valor, dict):
+        return sum(medir_bytes(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(medir_bytes(v) for v in valor)
+    return 64
+
+
+def vista_lectura(valor):
+    """Copia superficial para entregar a un consumidor (comparte los datos)."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy(deep=False)
+    if isinstance(valor, dict):
+        return {k: vista_lectura(v) for k, v in valor.items()}
+    return valor
+
+
+class CacheCompartido:
+    """LRU con presupuesto de bytes, segura para varios hilos."""
+
+    def __init__(self, presupuesto_bytes: int):
+        self.presupuesto_bytes = presupuesto_bytes
+        self._entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._calculando: Dict[Hashable, threading.Lock] = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.descartes = 0
+
+    def obtener(self, clave: Hashable):
+        """Valor guardado (sin copiar) o None; lo marca como usado recientemente."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada[0]
+
+    def guardar(self, clave: Hashable, valor, tamano: Optional[int] = None) -> None:
+        tamano = medir_bytes(valor) if tamano is None else tamano
+        if tamano > self.presupuesto_bytes:
+            logger.info(
+                f"Valor de {tamano / 1e6:,.1f} MB excede la caché; no se guarda"
+            )
+            return
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes += tamano
+            while self._bytes > self.presupuesto_bytes and self._entradas:
+                _, (_, tamano_descartado) = self._entradas.popitem(last=False)
+                self._bytes -= tamano_descartado
+                self.descartes += 1
+
+    def obtener_o_calcular(self, clave: Hashable, funcion: Callable[[], object]):
+        """
+        Retorna el valor de `clave`, calculándolo con `funcion()` si no existe.
+        Las llamadas concurrentes con la misma clave calculan una sola vez.
+        """
+        valor = self.obtener(clave)
+        if valor is not None:
+            with self._lock:
+                self.aciertos += 1
+            return valor
+
+        with self._lock:
+            candado = self._calculando.setdefault(clave, threading.Lock())
+        with candado:
+            # Otro hilo pudo haberlo calculado mientras se esperaba
+            valor = self.obtener(clave)
+            if valor is not None:
+                with self._lock:
+                    self.aciertos += 1
+                return valor
+            try:
+                valor = funcion()
+                with self._lock:
+                    self.fallos += 1
+                self.guardar(clave, valor)
+            finally:
+                with self._lock:
+                    self._calculando.pop(clave, None)
+        return valor
+
+    def estadisticas(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "MB usados": round(self._bytes / (1024 * 1024), 1),
+                "MB presupuesto": round(self.presupuesto_bytes / (1024 * 1024), 1),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "descartes": self.descartes,
+            }
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+
+_cache_global: Optional[CacheCompartido] = None
+_lock_global = threading.Lock()
+
+
+def cache_compartido() -> CacheCompartido:
+    """
+    Caché única del proceso (Streamlit comparte los módulos importados entre
+    sesiones). El presupuesto se toma de SUGERIDOR_CACHE_MB.
+    """
+    global _cache_global
+    with _lock_global:
+        if _cache_global is None:
+            megas = float(
+                os.environ.get("SUGERIDOR_CACHE_MB", PRESUPUESTO_MB_POR_DEFECTO)
+            )
+            _cache_global = CacheCompartido(int(megas * 1024 * 1024))
+        return _cache_global
+
+
+# ------------------------------------------------------------------------------
+# Índices sobre DataFrames
+# ------------------------------------------------------------------------------
+class _Indice:
+    """Posiciones de fila por valor de una columna, ligado a un DataFrame."""
+
+    __slots__ = ("index", "valores", "posiciones")
+
+    def __init__(self, df: pd.DataFrame, columna: str):
+        self.index = df.index
+        self.valores = df[columna].to_numpy()
+        self.posiciones = df.groupby(columna, sort=False).indices
+
+    def corresponde(self, df: pd.DataFrame, columna: str) -> bool:
+        # Mismo eje de filas y la misma columna (no reemplazada en una copia)
+        return df.index is self.index and np.may_share_memory(
+            df[columna].to_numpy(), self.valores
+        )
+
+
+def indice_por_columna(df: pd.DataFrame, columna: str) -> Dict[object, np.ndarray]:
+    """
+    Diccionario valor -> posiciones de fila (ascendentes) de `df[columna]`.
+    Se comparte entre todas las copias superficiales del mismo DataFrame.
+    """
+    cache = cache_compartido()
+    clave = ("indice", columna, id(df.index))
+    indice = cache.obtener(clave)
+    if indice is None or not indice.corresponde(df, columna):
+        indice = _Indice(df, columna)
+        cache.guardar(
+            clave,
+            indice,
+            tamano=sum(p.nbytes for p in indice.posiciones.values()),
+        )
+    return indice.posiciones
@@ -0,0 +1,266 @@
+"""
+Ejecución por línea de comandos del sugeridor de materiales.
+
+Procesa los cuatro libros de Excel (pedidos, inventario, hojas externas y,
+opcionalmente, facturación) sin levantar la interfaz de Streamlit y escribe los
+reportes en un directorio de salida.
+
+Ejemplo:
+    python cli.py pedidos.xlsx inventario.xlsx externas.xlsx facturacion.xlsx \\
+        --salida reportes/ --combinado
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import List, Optional
+
+from motor import (
+    CRITERIOS_CANDIDATOS,
+    CentrosAlmacenes,
+    FUENTES_DISPONIBLES,
+    FacturacionCube,
+    PATRONES_FACTURACION,
+    actualizar_historial_facturacion,
+    cargar_facturacion,
+    cargar_hojas_externas,
+    cargar_inventario,
+    cargar_pedidos,
+    exportar_a_excel,
+    exportar_reporte_individual,
+    formato_ancho,
+    generar_reportes,
+)
+from rendimiento import RegistroRendimiento, sesion_rendimiento
+
+logger = logging.getLogger("sugeridor")
+
+# Nombre de archivo y de hoja de cada reporte (igual que en la interfaz)
+ARCHIVOS_REPORTES = {
+    "consumo": ("Reporte_Consumo.xlsx", "Reporte de Consumo"),
+    "sugerencias": ("Todas_Sugerencias.xlsx", "Todas las Sugerencias"),
+    "resumen": ("Resumen_Sin_Sugerencias_MODIFICADO.xlsx", "Resumen Sin Sugerencias"),
+}
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    """Define los argumentos de la línea de comandos."""
+    parser = argparse.ArgumentParser(
+        description="Genera los reportes del sugeridor de materiales sin interfaz."
+    )
+    parser.add_argument("pedidos", help="Archivo con hoja 'Seg pedidos' o 'sheets1'")
+    parser.add_argument("inventario", help="Archivo con pestaña 'Inventario'")
+    parser.add_argument("externas", help="Archivo con pestañas externas")
+    parser.add_argument(
+        "facturacion",
+        nargs="?",
+        default=None,
+        help="Archivo con pestaña 'Facturacion' (activa el reporte de consumo)",
+    )
+    parser.add_argument(
+        "-o", "--salida", default=".", help="Directorio donde escribir los reportes"
+    )
+    parser.add_argument(
+        "--fuentes",
+        nargs="+",
+        choices=FUENTES_DISPONIBLES,
+        default=FUENTES_DISPONIBLES,
+        help="Fuentes a considerar (por defecto todas)",
+    )
+    parser.add_argument(
+        "--sin-sugerencias",
+        action="store_true",
+        help="No generar 'Todas las Sugerencias' (tampoco el resumen)",
+    )
+    parser.add_argument(
+        "--sin-resumen",
+        action="store_true",
+        help="No generar 'Resumen Sin Sugerencias'",
+    )
+    parser.add_argument(
+        "--combinado",
+        action="store_true",
+        help="Escribir además un solo libro con todos los reportes",
+    )
+    parser.add_argument(
+        "--historial",
+        metavar="DIRECTORIO",
+        default=None,
+        help="Acumular la facturación por mes en este directorio (Parquet) y "
+        "calcular el reporte de consumo con todo el historial",
+    )
+    parser.add_argument(
+        "--fecha-corte",
+        metavar="AAAA-MM-DD",
+        default=None,
+        help="Mes actual del reporte de consumo y fin de la ventana de 12 meses "
+        "(por defecto hoy, y el último mes facturado para el resumen)",
+    )
+    parser.add_argument(
+        "--clave-dedup-facturacion",
+        nargs="+",
+        metavar="COLUMNA",
+        choices=list(PATRONES_FACTURACION),
+        default=None,
+        help="Columnas que identifican una línea de factura repetida "
+        "(por defecto SUGERIDOR_CLAVE_DEDUP_FACTURACION o "
+        "Factura Material Fecha Cantidad Importe)",
+    )
+    parser.add_argument(
+        "--max-candidatos",
+        metavar="N",
+        type=int,
+        default=None,
+        help="Conservar a lo sumo N sugerencias por línea de pedido y fuente",
+    )
+    parser.add_argument(
+        "--criterio-candidatos",
+        choices=CRITERIOS_CANDIDATOS,
+        default="caducidad",
+        help="Cuáles conservar con --max-candidatos: caducidad más próxima, "
+        "mayor disponible o el centro del pedido primero",
+    )
+    parser.add_argument(
+        "--centros",
+        nargs="+",
+        default=None,
+        help="Centros de las columnas 'Inv <centro>' y 'Pendiente <centro>' "
+        "(por defecto SUGERIDOR_CENTROS o los centros habituales)",
+    )
+    parser.add_argument(
+        "--almacenes",
+        nargs="+",
+        default=None,
+        help="Almacenes de las columnas 'Inv <almacén>' y de tránsito "
+        "(por defecto SUGERIDOR_ALMACENES o 1030 1031 1032)",
+    )
+    parser.add_argument(
+        "--inventario-agregado",
+        action="store_true",
+        help="Reducir el inventario a una fila por Centro/Material/Almacén "
+        "al cargarlo (el resumen suma las filas repetidas)",
+    )
+    parser.add_argument(
+        "--rendimiento",
+        metavar="ARCHIVO_JSON",
+        default=None,
+        help="Guardar tiempos y memoria por etapa en un archivo JSON",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Mostrar mensajes de depuración"
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = construir_parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+    registro = RegistroRendimiento(memoria=True) if args.rendimiento else None
+    with sesion_rendimiento(registro):
+        codigo = ejecutar(args)
+
+    if registro is not None:
+        with open(args.rendimiento, "w", encoding="utf-8") as f:
+            f.write(registro.a_json())
+        logger.info(f"Mediciones de rendimiento -> {args.rendimiento}")
+
+    return codigo
+
+
+def ejecutar(args: argparse.Namespace) -> int:
+    """Carga los libros, genera los reportes y los escribe en disco."""
+
+    def avisar(mensaje: str) -> None:
+        logger.info(mensaje)
+
+    def progreso(fraccion: float, texto: str) -> None:
+        logger.debug(f"{fraccion:6.1%} {texto}")
+
+    try:
+        pedidos_df = cargar_pedidos(args.pedidos)
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    avisar(f"Archivo principal procesado: {len(pedidos_df)} pedidos cargados")
+
+    inventario_df = cargar_inventario(
+        args.inventario, avisar=avisar, agregado=args.inventario_agregado
+    )
+    avisar(f"Inventario procesado: {len(inventario_df)} registros")
+
+    hojas_externas = {}
+    if not args.sin_sugerencias:
+        hojas_externas = cargar_hojas_externas(args.externas, avisar=avisar)
+    avisar(f"Archivo externo procesado: {len(hojas_externas)} hojas cargadas")
+
+    df_facturacion_procesado = None
+    if args.facturacion:
+        df_facturacion_procesado = cargar_facturacion(
+            args.facturacion, avisar=avisar, clave_dedup=args.clave_dedup_facturacion
+        )
+        avisar(f"Facturación procesada: {len(df_facturacion_procesado)} registros")
+
+    cubo_facturacion = None
+    if df_facturacion_procesado is not None and not df_facturacion_procesado.empty:
+        cubo_facturacion = FacturacionCube.desde_facturacion(df_facturacion_procesado)
+    if args.historial:
+        cubo_facturacion = actualizar_historial_facturacion(
+            args.historial, cubo_facturacion, avisar=avisar
+        )
+
+    reportes = generar_reportes(
+        pedidos_df,
+        inventario_df,
+        hojas_externas,
+        args.fuentes,
+        df_facturacion_procesado,
+        generar_sugerencias=not args.sin_sugerencias,
+        generar_resumen=not args.sin_resumen,
+        generar_consumo=args.facturacion is not None or args.historial is not None,
+        avisar=avisar,
+        progreso=progreso,
+        cubo_facturacion=cubo_facturacion,
+        fecha_corte=args.fecha_corte,
+        max_candidatos=args.max_candidatos,
+        criterio_candidatos=args.criterio_candidatos,
+        centros=CentrosAlmacenes.desde_entorno(
+            centros=args.centros, almacenes=args.almacenes
+        ),
+    )
+
+    if not reportes:
+        logger.warning("No se generaron datos para exportar")
+        return 1
+
+    os.makedirs(args.salida, exist_ok=True)
+    for clave, reporte in reportes.items():
+        df_reporte = formato_ancho(reporte)
+        nombre_archivo, nombre_hoja = ARCHIVOS_REPORTES[clave]
+        ruta = os.path.join(args.salida, nombre_archivo)
+        with open(ruta, "wb") as f:
+            f.write(exportar_reporte_individual(df_reporte, nombre_hoja))
+        avisar(f"{nombre_hoja}: {len(df_reporte)} filas -> {ruta}")
+
+    if args.combinado:
+        ruta = os.path.join(args.salida, "Reporte_Completo.xlsx")
+        with open(ruta, "wb") as f:
+            f.write(
+                exportar_a_excel(
+                    formato_ancho(reportes.get("sugerencias")),
+                    reportes.get("resumen"),
+                    reportes.get("consumo"),
+                )
+            )
+        avisar(f"Reporte combinado -> {ruta}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Resolución de esquemas de los libros de Excel.
+
+Para elegir la hoja de pedidos se leía cada hoja con `pd.read_excel(nrows=0)`
+y cada normalizador recorría todas las columnas contra todos sus patrones en
+cada carga. Los formatos de SAP casi nunca cambian, así que ese trabajo se
+repite con el mismo resultado:
+
+- `encabezados_libro` lee solo la primera fila con datos de cada hoja
+  directamente del XML del .xlsx, sin cargar las hojas completas.
+- `EsquemasLibros.resolver` memoriza el resultado de un cálculo (mapeo de
+  columnas de un normalizador, hoja de pedidos, ...) por firma: nombre del
+  cálculo, reglas (patrones) y encabezados. La memoria es común a todas las
+  sesiones del proceso y se guarda en un archivo JSON para las siguientes
+  ejecuciones (SUGERIDOR_ESQUEMAS; vacío para no guardar). Cambiar los
+  patrones en el código cambia la firma, así que no quedan mapeos obsoletos.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import zipfile
+from typing import Callable, Dict, List, Optional
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+RUTA_POR_DEFECTO = os.path.join(
+    os.path.expanduser("~"), ".cache", "sugeridor", "esquemas.json"
+)
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_RELACION = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_NS_PAQUETE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+# ------------------------------------------------------------------------------
+# Encabezados desde el XML del libro
+# ------------------------------------------------------------------------------
+def _indice_columna(referencia: str) -> int:
+    """Índice (desde 0) de la columna de una referencia de celda como 'AB1'."""
+    indice = 0
+    for caracter in referencia:
+        if not caracter.isalpha():
+            break
+        indice = indice * 26 + (ord(caracter.upper()) - ord("A") + 1)
+    return indice - 1
+
+
+def _texto(elemento: ElementTree.Element) -> str:
+    """Texto de un <si> o <is> (incluye los fragmentos con formato)."""
+    return "".join(t.text or "" for t in elemento.iter(f"{_NS}t"))
+
+
+def _primera_fila(archivo_hoja) -> Dict[int, tuple]:
+    """Celdas de la primera fila con datos: {columna: (tipo, valor)}."""
+    celdas = {}
+    for _, elemento in ElementTree.iterparse(archivo_hoja, events=("end",)):
+        if elemento.tag == f"{_NS}c":
+            referencia = elemento.get("r", "")
+            columna = _indice_columna(referencia) if referencia else len(celdas)
+            tipo = elemento.get("t", "n")
+            if tipo == "inlineStr":
+                interno = elemento.find(f"{_NS}is")
+                valor = _texto(interno) if interno is not None else None
+            else:
+                v = elemento.find(f"{_NS}v")
+                valor = v.text if v is not None else None
+            if valor not in (None, ""):
+                celdas[columna] = (tipo, valor)
+        elif elemento.tag == f"{_NS}row":
+            if celdas:
+                break
+            elemento.clear()
+    return celdas
+
+
+def _cadenas_compartidas(zf: zipfile.ZipFile, necesarias: set) -> Dict[int, str]:
+    """Lee sharedStrings.xml solo hasta la última cadena que se necesita."""
+    if not necesarias or "xl/sharedStrings.xml" not in zf.namelist():
+        return {}
+    ultima = max(necesarias)
+    cadenas = {}
+    posicion = 0
+    with zf.open("xl/sharedStrings.xml") as f:
+        for _, elemento in ElementTree.iterparse(f, events=("end",)):
+            if elemento.tag != f"{_NS}si":
+                continue
+            if posicion in necesarias:
+                cadenas[posicion] = _texto(elemento)
+            elemento.clear()
+            if posicion >= ultima:
+                break
+            posicion += 1
+    return cadenas
+
+
+def _valor(tipo: str, valor: str, cadenas: Dict[int, str]):
+    """Valor de una celda de encabezado como lo leería pandas."""
+    if tipo == "s":
+        return cadenas.get(int(valor), "")
+    if tipo == "b":
+        return valor == "1"
+    if tipo in ("str", "inlineStr", "e", "d"):
+        return valor
+    try:
+        numero = float(valor)
+    except ValueError:
+        return valor
+    return int(numero) if numero.is_integer() else numero
+
+
+def encabezados_libro(archivo) -> Optional[Dict[str, list]]:
+    """
+    Encabezados (primera fila con datos) de cada hoja de un .xlsx, en el orden
+    del libro, leídos del XML sin cargar las hojas. `archivo` puede ser una
+    ruta, bytes o un archivo abierto (se deja en la posición inicial).
+    Retorna None si el libro no es un .xlsx legible (p. ej. .xls).
+    """
+    origen = io.BytesIO(archivo) if isinstance(archivo, bytes) else archivo
+    try:
+        with zipfile.ZipFile(origen) as zf:
+            libro = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+            relaciones = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+            destinos = {
+                r.get("Id"): r.get("Target", "")
+                for r in relaciones.iter(f"{_NS_PAQUETE}Relationship")
+            }
+
+            filas = {}
+            for hoja in libro.iter(f"{_NS}sheet"):
+                destino = destinos.get(hoja.get(_NS_RELACION), "")
+                ruta = (
+                    destino.lstrip("/") if destino.startswith("/") else f"xl/{destino}"
+                )
+                with zf.open(ruta) as f:
+                    filas[hoja.get("name")] = _primera_fila(f)
+
+            necesarias = {
+                int(valor)
+                for celdas in filas.values()
+                for tipo, valor in celdas.values()
+                if tipo == "s"
+            }
+            cadenas = _cadenas_compartidas(zf, necesarias)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, ValueError) as e:
+        logger.debug(f"No se pudieron leer los encabezados del libro: {e}")
+        return None
+    finally:
+        if hasattr(origen, "seek"):
+            origen.seek(0)
+
+    encabezados = {}
+    for nombre, celdas in filas.items():
+        ancho = max(celdas) + 1 if celdas else 0
+        encabezados[nombre] = [
+            _valor(*celdas[i], cadenas) if i in celdas else f"Unnamed: {i}"
+            for i in range(ancho)
+        ]
+    return encabezados
+
+
+# ------------------------------------------------------------------------------
+# Resoluciones memorizadas por firma de encabezados
+# ------------------------------------------------------------------------------
+def firma_esquema(nombre: str, encabezados: List, reglas=None) -> str:
+    """Firma de un cálculo: nombre, reglas (JSON) y encabezados."""
+    texto = json.dumps(
+        [nombre, reglas, [str(col) for col in encabezados]],
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EsquemasLibros:
+    """
+    Resultados de resolución de esquemas por firma, en memoria y (si se indica
+    `ruta`) en un archivo JSON. Los resultados deben ser serializables a JSON.
+    """
+
+    def __init__(self, ruta: Optional[str] = None):
+        self.ruta = ruta or None
+        self._lock = threading.Lock()
+        self._resueltos: Optional[Dict[str, object]] = None
+        self.aciertos = 0
+        self.calculos = 0
+
+    def _leer_archivo(self) -> Dict[str, object]:
+        if not self.ruta or not os.path.exists(self.ruta):
+            return {}
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo leer {self.ruta}: {e}")
+            return {}
+
+    def _guardar(self) -> None:
+        if not self.ruta:
+            return
+        try:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            # Conservar lo que otros procesos hayan guardado mientras tanto
+            resueltos = {**self._leer_archivo(), **self._resueltos}
+            temporal = f"{self.ruta}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(resueltos, f, ensure_ascii=False)
+            os.replace(temporal, self.ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar {self.ruta}: {e}")
+
+    def resolver(
+        self, nombre: str, encabezados: List, reglas, calcular: Callable[[], object]
+    ):
+        """
+        Resultado de `calcular()` para esta firma; solo se calcula la primera
+        vez que aparece una combinación de reglas y encabezados.
+        """
+        clave = firma_esquema(nombre, encabezados, reglas)
+        with self._lock:
+            if self._resueltos is None:
+                self._resueltos = self._leer_archivo()
+            if clave in self._resueltos:
+                self.aciertos += 1
+                return self._resueltos[clave]
+
+        # JSON de ida y vuelta: el primer resultado es igual a los memorizados
+        resultado = json.loads(json.dumps(calcular(), ensure_ascii=False))
+        with self._lock:
+            self.calculos += 1
+            self._resueltos[clave] = resultado
+            self._guardar()
+        logger.debug(f"Esquema '{nombre}' resuelto y memorizado")
+        return resultado
+
+    def limpiar(self) -> None:
+        """Olvida los resultados en memoria (el archivo se vuelve a leer)."""
+        with self._lock:
+            self._resueltos = None
+
+
+_esquemas_global: Optional[EsquemasLibros] = None
+_lock_global = threading.Lock()
+
+
+def esquemas_compartidos() -> EsquemasLibros:
+    """
+    Memoria única del proceso (compartida entre sesiones de Streamlit). El
+    archivo se toma de SUGERIDOR_ESQUEMAS.
+    """
+    global _esquemas_global
+    with _lock_global:
+        if _esquemas_global is None:
+            _esquemas_global = EsquemasLibros(
+                os.environ.get("SUGERIDOR_ESQUEMAS", RUTA_POR_DEFECTO)
+            )
+        return _esquemas_global
@@ -0,0 +1,159 @@
+"""
+Historial persistente de facturación agregada por mes.
+
+Los meses pasados de facturación no cambian, pero los reportes de consumo se
+recalculaban siempre desde las filas crudas. `HistorialFacturacion` guarda en
+un directorio de Parquet las tablas mensuales de `motor.FacturacionCube` (por
+Solicitante/Destinatario/Material, por Destinatario y por
+Centro/Almacén/Material), particionadas por mes:
+
+    <ruta>/<tabla>/mes=AAAAMM/datos.parquet
+
+Cada archivo de facturación nuevo reescribe únicamente las particiones de los
+meses que contiene; el resto del historial se conserva, así que un año de
+historia no vuelve a leerse de Excel.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+# Nombre de cada tabla del resumen mensual -> subdirectorio del historial
+TABLAS = {
+    "cliente": "facturacion_cliente",
+    "destinatario": "facturacion_destinatario",
+    "almacen": "facturacion_almacen",
+}
+ARCHIVO_PARTICION = "datos.parquet"
+PREFIJO_PARTICION = "mes="
+
+# Un lock por directorio: cada llamada crea su propio HistorialFacturacion
+_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_de(ruta: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(ruta), threading.Lock())
+
+
+def _para_arrow(df: pd.DataFrame) -> pd.DataFrame:
+    """Las columnas de texto con valores de varios tipos se guardan como texto."""
+    for columna in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[columna], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df = df.assign(
+                **{
+                    columna: df[columna].where(
+                        df[columna].isna(), df[columna].astype(str)
+                    )
+                }
+            )
+    return df
+
+
+class HistorialFacturacion:
+    """Agregados mensuales de facturación persistidos en Parquet por mes."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = _lock_de(ruta)
+
+    def _directorio(self, tabla: str) -> str:
+        return os.path.join(self.ruta, tabla)
+
+    def _particiones(self, tabla: str) -> Dict[int, str]:
+        """Mes -> archivo de su partición."""
+        directorio = self._directorio(tabla)
+        if not os.path.isdir(directorio):
+            return {}
+        particiones = {}
+        for nombre in os.listdir(directorio):
+            ruta = os.path.join(directorio, nombre, ARCHIVO_PARTICION)
+            if nombre.startswith(PREFIJO_PARTICION) and os.path.exists(ruta):
+                particiones[int(nombre[len(PREFIJO_PARTICION) :])] = ruta
+        return particiones
+
+    def _escribir_particion(self, tabla: str, mes: int, df: pd.DataFrame) -> None:
+        """Escribe la partición en un directorio temporal y la reemplaza."""
+        final = os.path.join(self._directorio(tabla), f"{PREFIJO_PARTICION}{mes}")
+        temporal = f"{final}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(temporal)
+        _para_arrow(df.reset_index(drop=True)).to_parquet(
+            os.path.join(temporal, ARCHIVO_PARTICION), index=False
+        )
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(temporal, final)
+
+    def actualizar(
+        self, mensual: Dict[str, pd.DataFrame], meses: Optional[Iterable[int]] = None
+    ) -> List[int]:
+        """
+        Reemplaza en el historial los meses de `mensual` (o los indicados en
+        `meses`, p. ej. todos los meses presentes en el archivo original).
+        Retorna los meses reemplazados.
+        """
+        if meses is None:
+            meses = set()
+            for df in mensual.values():
+                if "mes" in df.columns:
+                    meses.update(df["mes"].unique().tolist())
+        meses = sorted(int(m) for m in meses)
+        if not meses:
+            return []
+
+        with self._lock:
+            for nombre, tabla in TABLAS.items():
+                df = mensual.get(nombre)
+                por_mes = {}
+                if df is not None and not df.empty:
+                    por_mes = {int(mes): grupo for mes, grupo in df.groupby("mes")}
+                for mes in meses:
+                    if mes in por_mes:
+                        self._escribir_particion(tabla, mes, por_mes[mes])
+                    else:
+                        shutil.rmtree(
+                            os.path.join(
+                                self._directorio(tabla), f"{PREFIJO_PARTICION}{mes}"
+                            ),
+                            ignore_errors=True,
+                        )
+
+        logger.info(f"Historial de facturación: {len(meses)} meses actualizados")
+        return meses
+
+    def leer(self) -> Dict[str, pd.DataFrame]:
+        """Todos los meses guardados, con el mismo formato que el resumen mensual."""
+        with self._lock:
+            tablas = {}
+            for nombre, tabla in TABLAS.items():
+                particiones = self._particiones(tabla)
+                tablas[nombre] = (
+                    pd.concat(
+                        [
+                            pd.read_parquet(particiones[mes])
+                            for mes in sorted(particiones)
+                        ],
+                        ignore_index=True,
+                    )
+                    if particiones
+                    else pd.DataFrame()
+                )
+            return tablas
+
+    def meses(self) -> List[int]:
+        """Meses (AAAAMM) presentes en el historial; 0 agrupa filas sin fecha."""
+        with self._lock:
+            meses = set()
+            for tabla in TABLAS.values():
+                meses.update(self._particiones(tabla))
+            return sorted(meses)
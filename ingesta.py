@@ -0,0 +1,459 @@
+"""
+Ingesta automática de una carpeta de entrada con artefactos precalculados.
+
+Cada mañana los mismos libros de SAP se cargan y procesan en el navegador
+mientras los usuarios esperan. `VigilanteIngesta` revisa una carpeta de
+entrada y, cuando llega un juego nuevo de libros (pedidos, inventario, hojas
+externas y, opcionalmente, facturación), los procesa en segundo plano y
+escribe una versión de artefactos:
+
+    <artefactos>/<AAAAMMDD-HHMMSS>/
+        manifiesto.json          libros de origen, filas, opciones y centros
+        pedidos.parquet          pedidos normalizados
+        inventario.parquet       inventario normalizado
+        externas/<fuente>.parquet
+        facturacion.parquet      (si hubo facturación)
+        consumo.parquet, resumen.parquet
+        sugerencias/{pedidos,inventario,candidatos}.parquet
+                                 modelo compacto (ver SugerenciasCompactas)
+
+Cada versión se escribe en un directorio temporal que se renombra al
+terminar, así que una versión con manifiesto siempre está completa. Los
+índices por material no se guardan: se reconstruyen al usarlos a partir de los
+DataFrames (indice_por_columna), lo que cuesta mucho menos que leer los libros.
+
+Un libro se procesa cuando su firma (ruta, tamaño y fecha) se mantiene entre
+dos revisiones, es decir, cuando terminó de copiarse. Un juego de libros que
+ya tiene versión no se vuelve a procesar.
+
+La interfaz ofrece "Cargar última instantánea" (cargar_artefactos) para
+mostrar los reportes de la última versión sin cargar libros.
+
+Ejemplo:
+    python ingesta.py entrada/ artefactos/ --intervalo 60
+    python ingesta.py entrada/ artefactos/ --una-vez   # p. ej. desde cron
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from motor import (
+    FUENTES_DISPONIBLES,
+    CentrosAlmacenes,
+    SugerenciasCompactas,
+    cargar_facturacion,
+    cargar_hojas_externas,
+    cargar_inventario,
+    cargar_pedidos,
+    generar_reportes,
+)
+from rendimiento import instrumentado
+from servicio import firma_libros, libros_directorio
+
+logger = logging.getLogger("sugeridor.ingesta")
+
+# Tipo de libro -> texto que debe contener el nombre del archivo
+PATRONES_INGESTA = {
+    "pedidos": "pedido",
+    "inventario": "inventario",
+    "externas": "extern",
+    "facturacion": "factur",
+}
+LIBROS_REQUERIDOS = ["pedidos", "inventario", "externas"]
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+FORMATO_VERSION = "%Y%m%d-%H%M%S"
+PARTES_SUGERENCIAS = ["pedidos", "inventario", "candidatos"]
+
+
+# ------------------------------------------------------------------------------
+# Parquet
+# ------------------------------------------------------------------------------
+def guardar_parquet(df: pd.DataFrame, ruta: str) -> List[str]:
+    """
+    Escribe `df` en Parquet. Las columnas de texto con valores de varios tipos
+    (p. ej. IDs numéricos y alfanuméricos) no tienen tipo Arrow: se guardan
+    como texto. Retorna los nombres de esas columnas.
+    """
+    como_texto = []
+    for columna in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[columna], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            como_texto.append(columna)
+    if como_texto:
+        df = df.assign(
+            **{
+                columna: df[columna].where(df[columna].isna(), df[columna].astype(str))
+                for columna in como_texto
+            }
+        )
+    df.to_parquet(ruta)
+    return como_texto
+
+
+# ------------------------------------------------------------------------------
+# Versiones de artefactos
+# ------------------------------------------------------------------------------
+def versiones(directorio: str) -> List[str]:
+    """Versiones completas (con manifiesto) del directorio, de la más antigua a la más reciente."""
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(
+        nombre
+        for nombre in os.listdir(directorio)
+        if os.path.exists(os.path.join(directorio, nombre, ARCHIVO_MANIFIESTO))
+    )
+
+
+def ultima_version(directorio: str) -> Optional[str]:
+    """Ruta de la versión más reciente, o None si no hay ninguna."""
+    disponibles = versiones(directorio)
+    return os.path.join(directorio, disponibles[-1]) if disponibles else None
+
+
+def leer_manifiesto(ruta_version: str) -> Dict[str, object]:
+    with open(os.path.join(ruta_version, ARCHIVO_MANIFIESTO), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def limpiar_versiones(directorio: str, conservar: int) -> List[str]:
+    """Elimina las versiones más antiguas y conserva las `conservar` más recientes."""
+    antiguas = versiones(directorio)[:-conservar] if conservar > 0 else []
+    for nombre in antiguas:
+        shutil.rmtree(os.path.join(directorio, nombre), ignore_errors=True)
+        logger.info(f"Versión {nombre} eliminada")
+    return antiguas
+
+
+# ------------------------------------------------------------------------------
+# Ingesta
+# ------------------------------------------------------------------------------
+def firma_json(firma: tuple) -> List[list]:
+    """Firma de libros como la guarda el manifiesto (listas JSON)."""
+    return [list(parte) for parte in firma]
+
+
+@instrumentado()
+def ingerir(
+    libros: Dict[str, str],
+    directorio: str,
+    inventario_agregado: bool = False,
+    centros: Optional[CentrosAlmacenes] = None,
+    avisar=None,
+) -> str:
+    """
+    Procesa un juego de libros (tipo -> ruta, ver PATRONES_INGESTA) y escribe
+    una versión nueva de artefactos en `directorio`. Retorna su ruta.
+    """
+    avisar = avisar or logger.info
+    centros = centros or CentrosAlmacenes.desde_entorno()
+    firma = firma_libros(libros)
+    inicio = time.perf_counter()
+
+    pedidos_df = cargar_pedidos(libros["pedidos"])
+    inventario_df = cargar_inventario(
+        libros["inventario"], avisar=avisar, agregado=inventario_agregado
+    )
+    hojas_externas = cargar_hojas_externas(libros["externas"], avisar=avisar)
+    df_facturacion = None
+    if "facturacion" in libros:
+        df_facturacion = cargar_facturacion(libros["facturacion"], avisar=avisar)
+
+    reportes = generar_reportes(
+        pedidos_df,
+        inventario_df,
+        hojas_externas,
+        FUENTES_DISPONIBLES,
+        df_facturacion,
+        generar_consumo=df_facturacion is not None,
+        avisar=avisar,
+        centros=centros,
+    )
+
+    # Se escribe en un directorio temporal y se renombra al terminar
+    os.makedirs(directorio, exist_ok=True)
+    version = time.strftime(FORMATO_VERSION)
+    while os.path.exists(os.path.join(directorio, version)):
+        time.sleep(1)
+        version = time.strftime(FORMATO_VERSION)
+    temporal = os.path.join(directorio, f".{version}.tmp")
+    os.makedirs(os.path.join(temporal, "externas"))
+
+    tablas = {
+        "pedidos.parquet": pedidos_df,
+        "inventario.parquet": inventario_df,
+        **{
+            os.path.join("externas", f"{fuente}.parquet"): df
+            for fuente, df in hojas_externas.items()
+        },
+    }
+    if df_facturacion is not None:
+        tablas["facturacion.parquet"] = df_facturacion
+    for clave in ("consumo", "resumen"):
+        if clave in reportes:
+            tablas[f"{clave}.parquet"] = reportes[clave]
+    sugerencias = reportes.get("sugerencias")
+    if sugerencias is not None:
+        os.makedirs(os.path.join(temporal, "sugerencias"))
+        for parte in PARTES_SUGERENCIAS:
+            tablas[os.path.join("sugerencias", f"{parte}.parquet")] = getattr(
+                sugerencias, parte
+            )
+
+    como_texto = {}
+    try:
+        for nombre, df in tablas.items():
+            columnas = guardar_parquet(df, os.path.join(temporal, nombre))
+            if columnas:
+                como_texto[nombre] = columnas
+
+        manifiesto = {
+            "version": version,
+            "creada": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "segundos": round(time.perf_counter() - inicio, 1),
+            "libros": {tipo: os.path.basename(r) for tipo, r in libros.items()},
+            "firma": firma_json(firma),
+            "filas": {nombre: len(df) for nombre, df in tablas.items()},
+            "fuentes": list(hojas_externas),
+            "reportes": list(reportes),
+            "inventario_agregado": inventario_agregado,
+            "centros": vars(centros),
+            "columnas_como_texto": como_texto,
+        }
+        with open(
+            os.path.join(temporal, ARCHIVO_MANIFIESTO), "w", encoding="utf-8"
+        ) as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+        ruta = os.path.join(directorio, version)
+        os.replace(temporal, ruta)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+    avisar(
+        f"Versión {version} escrita en {manifiesto['segundos']:,.1f} s: "
+        f"{', '.join(f'{k} {len(v)}' for k, v in tablas.items() if k.count(os.sep) == 0)}"
+    )
+    return ruta
+
+
+# ------------------------------------------------------------------------------
+# Carga de artefactos
+# ------------------------------------------------------------------------------
+class Artefactos:
+    """DataFrames y reportes de una versión de artefactos."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.manifiesto = leer_manifiesto(ruta)
+        self.version = self.manifiesto["version"]
+
+        def leer(nombre: str) -> Optional[pd.DataFrame]:
+            archivo = os.path.join(ruta, nombre)
+            return pd.read_parquet(archivo) if os.path.exists(archivo) else None
+
+        self.pedidos_df = leer("pedidos.parquet")
+        self.inventario_df = leer("inventario.parquet")
+        self.hojas_externas = {
+            fuente: leer(os.path.join("externas", f"{fuente}.parquet"))
+            for fuente in self.manifiesto["fuentes"]
+        }
+        self.facturacion_df = leer("facturacion.parquet")
+
+        self.reportes = {}
+        for clave in ("consumo", "resumen"):
+            df = leer(f"{clave}.parquet")
+            if df is not None:
+                self.reportes[clave] = df
+        if "sugerencias" in self.manifiesto["reportes"]:
+            partes = [
+                leer(os.path.join("sugerencias", f"{parte}.parquet"))
+                for parte in PARTES_SUGERENCIAS
+            ]
+            self.reportes["sugerencias"] = SugerenciasCompactas(
+                *partes, centros=CentrosAlmacenes(**self.manifiesto["centros"])
+            )
+
+
+@instrumentado()
+def cargar_artefactos(ruta: str) -> Artefactos:
+    """Lee una versión de artefactos (ver ultima_version)."""
+    return Artefactos(ruta)
+
+
+# ------------------------------------------------------------------------------
+# Vigilancia de la carpeta de entrada
+# ------------------------------------------------------------------------------
+class VigilanteIngesta:
+    """
+    Revisa `entrada` cada `intervalo` segundos y escribe una versión de
+    artefactos en `salida` por cada juego nuevo de libros. Conserva las
+    `conservar` versiones más recientes (0: todas). `centros` se resuelve una
+    sola vez (por defecto, CentrosAlmacenes.desde_entorno()).
+    """
+
+    def __init__(
+        self,
+        entrada: str,
+        salida: str,
+        intervalo: float = 60.0,
+        conservar: int = 7,
+        inventario_agregado: bool = False,
+        centros: Optional[CentrosAlmacenes] = None,
+    ):
+        self.entrada = entrada
+        self.salida = salida
+        self.intervalo = intervalo
+        self.conservar = conservar
+        self.inventario_agregado = inventario_agregado
+        self.centros = centros or CentrosAlmacenes.desde_entorno()
+        self._firma_pendiente: Optional[tuple] = None
+        self._firmas_procesadas = set()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+        # Los libros de la última versión ya están procesados
+        ultima = ultima_version(salida)
+        if ultima is not None:
+            firma = leer_manifiesto(ultima).get("firma", [])
+            self._firmas_procesadas.add(tuple(tuple(parte) for parte in firma))
+
+    def revisar(self, esperar_estable: bool = True) -> Optional[str]:
+        """
+        Procesa los libros de la entrada si forman un juego nuevo y completo
+        (y, con `esperar_estable`, su firma no varió desde la revisión
+        anterior). Retorna la ruta de la versión escrita, si la hubo.
+        """
+        try:
+            libros = libros_directorio(self.entrada, PATRONES_INGESTA)
+            firma = firma_libros(libros)
+        except OSError as e:
+            logger.warning(f"No se pudo revisar {self.entrada}: {e}")
+            return None
+
+        if firma in self._firmas_procesadas:
+            self._firma_pendiente = None
+            return None
+        faltantes = [tipo for tipo in LIBROS_REQUERIDOS if tipo not in libros]
+        if faltantes:
+            logger.debug(f"Faltan libros en {self.entrada}: {', '.join(faltantes)}")
+            return None
+        if esperar_estable and firma != self._firma_pendiente:
+            # Puede estar copiándose: esperar a la siguiente revisión
+            self._firma_pendiente = firma
+            return None
+
+        # Un juego que falla no se reintenta hasta que cambie algún libro
+        self._firmas_procesadas.add(firma)
+        self._firma_pendiente = None
+        try:
+            ruta = ingerir(
+                libros, self.salida, self.inventario_agregado, centros=self.centros
+            )
+        except Exception as e:
+            logger.error(f"No se pudieron procesar los libros: {e}", exc_info=True)
+            return None
+        limpiar_versiones(self.salida, self.conservar)
+        return ruta
+
+    def iniciar(self) -> None:
+        """Revisa la entrada en un hilo aparte."""
+        if self._hilo is not None:
+            return
+
+        def vigilar():
+            while True:
+                self.revisar()
+                if self._detener.wait(self.intervalo):
+                    break
+
+        self._hilo = threading.Thread(
+            target=vigilar, name="vigilancia-ingesta", daemon=True
+        )
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Procesa automáticamente los libros que llegan a una carpeta "
+        "y escribe versiones de artefactos en Parquet."
+    )
+    parser.add_argument(
+        "entrada",
+        help="Carpeta con los libros (nombres con 'pedido', 'inventario', "
+        "'extern' y, opcionalmente, 'factur')",
+    )
+    parser.add_argument("salida", help="Directorio de versiones de artefactos")
+    parser.add_argument(
+        "--intervalo",
+        type=float,
+        default=60.0,
+        help="Segundos entre revisiones de la carpeta",
+    )
+    parser.add_argument(
+        "--una-vez",
+        action="store_true",
+        help="Procesar los libros actuales (si son nuevos) y terminar",
+    )
+    parser.add_argument(
+        "--conservar",
+        type=int,
+        default=7,
+        help="Versiones a conservar (0: todas)",
+    )
+    parser.add_argument(
+        "--inventario-agregado",
+        action="store_true",
+        help="Reducir el inventario a una fila por Centro/Material/Almacén",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Mostrar mensajes de depuración"
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = construir_parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+    vigilante = VigilanteIngesta(
+        args.entrada,
+        args.salida,
+        intervalo=args.intervalo,
+        conservar=args.conservar,
+        inventario_agregado=args.inventario_agregado,
+    )
+    if args.una_vez:
+        ruta = vigilante.revisar(esperar_estable=False)
+        logger.info(f"Versión escrita: {ruta}" if ruta else "Sin libros nuevos")
+        return 0
+
+    logger.info(f"Vigilando {args.entrada} cada {args.intervalo:,.0f} s")
+    vigilante.iniciar()
+    try:
+        while vigilante._hilo.is_alive():
+            vigilante._hilo.join(1.0)
+    except KeyboardInterrupt:
+        vigilante.detener()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4442 @@
+"""
+Motor de sugerencias de materiales.
+
+Contiene toda la lógica de procesamiento (normalización de hojas, generación de
+sugerencias, resumen, reporte de consumo y exportación a Excel) sin depender de
+Streamlit, para poder usarse desde la interfaz web, la línea de comandos o
+scripts programados.
+
+Los mensajes para el usuario y el avance de los procesos largos se comunican
+mediante callbacks opcionales:
+    avisar(mensaje)              -> avisos informativos o advertencias
+    progreso(fraccion, texto)    -> avance entre 0.0 y 1.0
+Si no se proporcionan, los avisos se envían al logger del módulo. El progreso
+se reporta a través de progreso.ReporteProgreso, que limita la frecuencia de
+las actualizaciones.
+"""
+
+import datetime
+import functools
+import heapq
+import io
+import os
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Optional, Tuple
+import logging
+import warnings
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+from cache_compartido import (
+    cache_compartido,
+    huella_contenido,
+    huella_entradas,
+    indice_por_columna,
+    vista_lectura,
+)
+from esquemas import encabezados_libro, esquemas_compartidos
+from historial_facturacion import HistorialFacturacion
+from progreso import Progreso, ReporteProgreso
+from rendimiento import instrumentado
+
+# Configurar pandas para que no muestre advertencias de formato de fecha
+pd.options.mode.chained_assignment = None  # default='warn'
+
+# Suprimir advertencias específicas
+warnings.filterwarnings(
+    "ignore", category=UserWarning, message="Parsing dates in.*%d/%m/%Y.*"
+)
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+logger = logging.getLogger(__name__)
+
+# Tipo del callback de avisos (el de progreso se define en progreso.py)
+Aviso = Callable[[str], None]
+
+# Fuentes externas reconocidas (nombres de las pestañas del archivo externo)
+FUENTES_DISPONIBLES = [
+    "Corta caducidad",
+    "Lento mov",
+    "Cosmopark",
+    "Sustituto",
+    "PNC",
+    "Caduco",
+]
+
+
+def _aviso_por_defecto(mensaje: str) -> None:
+    """Envía el aviso al logger cuando no se inyecta un callback."""
+    logger.info(mensaje)
+
+
+# ------------------------------------------------------------------------------
+# Definición de columnas (en el orden solicitado) - SIN SIMILITUD
+# ------------------------------------------------------------------------------
+class Columnas:
+    GRUPO_CLIENTE = "Gpo. Cte."
+    FECHA = "Fecha"
+    PEDIDO = "Pedido"
+    GRUPO_VENDEDOR = "Gpo.Vdor."
+    SOLICITANTE = "Solicitante"
+    DESTINATARIO = "Destinatario"
+    RAZON_SOCIAL = "Razón Social"
+    CENTRO_PEDIDO = "Centro pedido"
+    ALMACEN = "Almacén"
+    MATERIAL_SOLICITADO = "Material solicitado"
+    MATERIAL_BASE = "Material base"
+    DESCRIPCION_SOLICITADA = "Descripción solicitada"
+    CANTIDAD_PEDIDO = "Cantidad pedido"
+    CANTIDAD_PENDIENTE = "Cantidad pendiente"
+    CANTIDAD_OFERTAR = "Cantidad a Ofertar"
+    PRECIO = "Precio"
+    FUENTE = "Fuente"
+    MATERIAL_SUGERIDO = "Material sugerido"  # NUEVA COLUMNA
+    DESCRIPCION_SUGERIDA = "Descripción sugerida"  # NUEVA COLUMNA
+    CENTRO_SUGERIDO = "Centro sugerido"
+    ALMACEN_SUGERIDO = "Almacén sugerido"
+    DISPONIBLE = "Disponible"
+    LOTE = "Lote"
+    FECHA_CADUCIDAD = "Fecha de Caducidad"
+    # SIMILITUD eliminado según solicitud
+    CENTRO_INV = "Centro (Inv)"
+    CANT_TRANSITO = "Cant. en Tránsito"
+    # Las columnas por centro/almacén ("Inv 1030", "Cant. en Tránsito 1031",
+    # "Disponible 1031-1030", ...) salen de CentrosAlmacenes
+    BLOQUEADO = "Bloqueado"
+
+
+# ------------------------------------------------------------------------------
+# Centros y almacenes de las columnas por centro/almacén
+# ------------------------------------------------------------------------------
+CENTROS_POR_DEFECTO = ["1001", "1003", "1004", "1017", "1018", "1022", "1036"]
+ALMACENES_POR_DEFECTO = ["1030", "1031", "1032"]
+ALMACENES_INV_CENTRO_POR_DEFECTO = ["1030", "1031", "1060"]
+CENTRO_DISPONIBLE_POR_DEFECTO = "1031"
+ALMACENES_DISPONIBLE_POR_DEFECTO = ["1030", "1032"]
+
+
+def _codigos_entorno(variable: str, por_defecto: List[str]) -> List[str]:
+    """Lista de códigos separados por comas de una variable de entorno."""
+    codigos = [c.strip() for c in os.environ.get(variable, "").split(",")]
+    return [c for c in codigos if c] or list(por_defecto)
+
+
+class CentrosAlmacenes:
+    """
+    Centros y almacenes de las columnas por centro/almacén de los reportes:
+    - `almacenes`: "Inv <almacén>" y "Cant. en Tránsito <almacén>" del
+      material en el centro del pedido
+    - `almacenes_inv_centro`: almacenes que suman en "Inv <centro>" y en el
+      disponible de Sustituto y Lento mov
+    - `centro_disponible` y `almacenes_disponible`: "Disponible <centro>-<almacén>"
+    - `centros`: "Inv <centro>" (sugerencias) y "Pendiente <centro>" (resumen)
+    Todas las columnas se calculan con una sola tabla dinámica del inventario,
+    así que abrir un centro o almacén solo requiere agregarlo aquí o en las
+    variables de entorno de `desde_entorno`.
+    """
+
+    def __init__(
+        self,
+        centros: Optional[List[str]] = None,
+        almacenes: Optional[List[str]] = None,
+        almacenes_inv_centro: Optional[List[str]] = None,
+        centro_disponible: str = CENTRO_DISPONIBLE_POR_DEFECTO,
+        almacenes_disponible: Optional[List[str]] = None,
+    ):
+        self.centros = [str(c) for c in (centros or CENTROS_POR_DEFECTO)]
+        self.almacenes = [str(a) for a in (almacenes or ALMACENES_POR_DEFECTO)]
+        self.almacenes_inv_centro = [
+            str(a) for a in (almacenes_inv_centro or ALMACENES_INV_CENTRO_POR_DEFECTO)
+        ]
+        self.centro_disponible = str(centro_disponible)
+        self.almacenes_disponible = [
+            str(a) for a in (almacenes_disponible or ALMACENES_DISPONIBLE_POR_DEFECTO)
+        ]
+
+    @classmethod
+    def desde_entorno(
+        cls,
+        centros: Optional[List[str]] = None,
+        almacenes: Optional[List[str]] = None,
+    ) -> "CentrosAlmacenes":
+        """
+        Configuración de SUGERIDOR_CENTROS, SUGERIDOR_ALMACENES,
+        SUGERIDOR_ALMACENES_INV_CENTRO, SUGERIDOR_CENTRO_DISPONIBLE y
+        SUGERIDOR_ALMACENES_DISPONIBLE (listas separadas por comas); `centros`
+        y `almacenes` tienen prioridad sobre las variables.
+        """
+        return cls(
+            centros=centros
+            or _codigos_entorno("SUGERIDOR_CENTROS", CENTROS_POR_DEFECTO),
+            almacenes=almacenes
+            or _codigos_entorno("SUGERIDOR_ALMACENES", ALMACENES_POR_DEFECTO),
+            almacenes_inv_centro=_codigos_entorno(
+                "SUGERIDOR_ALMACENES_INV_CENTRO", ALMACENES_INV_CENTRO_POR_DEFECTO
+            ),
+            centro_disponible=os.environ.get(
+                "SUGERIDOR_CENTRO_DISPONIBLE", CENTRO_DISPONIBLE_POR_DEFECTO
+            ).strip()
+            or CENTRO_DISPONIBLE_POR_DEFECTO,
+            almacenes_disponible=_codigos_entorno(
+                "SUGERIDOR_ALMACENES_DISPONIBLE", ALMACENES_DISPONIBLE_POR_DEFECTO
+            ),
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"CentrosAlmacenes(centros={self.centros}, almacenes={self.almacenes}, "
+            f"almacenes_inv_centro={self.almacenes_inv_centro}, "
+            f"centro_disponible={self.centro_disponible!r}, "
+            f"almacenes_disponible={self.almacenes_disponible})"
+        )
+
+    def columnas_inv_almacen(self) -> List[str]:
+        return [f"Inv {almacen}" for almacen in self.almacenes]
+
+    def columnas_transito_almacen(self) -> List[str]:
+        return [f"{Columnas.CANT_TRANSITO} {almacen}" for almacen in self.almacenes]
+
+    def columnas_disponible(self) -> List[str]:
+        return [
+            f"Disponible {self.centro_disponible}-{almacen}"
+            for almacen in self.almacenes_disponible
+        ]
+
+    def columnas_inv_centro(self) -> List[str]:
+        return [f"Inv {centro}" for centro in self.centros]
+
+    def columnas_pendiente(self) -> List[str]:
+        return [f"Pendiente {centro}" for centro in self.centros]
+
+    def columnas_inventario(self) -> List[str]:
+        """Columnas de inventario de "Todas las Sugerencias", en orden."""
+        return (
+            self.columnas_inv_almacen()
+            + [Columnas.CANT_TRANSITO]
+            + self.columnas_transito_almacen()
+            + self.columnas_disponible()
+            + self.columnas_inv_centro()
+        )
+
+
+# ------------------------------------------------------------------------------
+# Funciones auxiliares
+# ------------------------------------------------------------------------------
+# Hasta aquí los enteros son exactos en float64 y caben en int64
+LIMITE_ID_NUMERICO = 1e15
+# Sufijo ".0" de los IDs leídos como número (1001.0 -> 1001)
+PATRON_SUFIJO_CERO = r"\.0+$"
+
+
+def _ids_texto(serie: pd.Series) -> pd.Series:
+    """
+    `astype(str)`, quitar espacios y quitar el sufijo ".0", con los kernels de
+    texto de Arrow (mismo resultado que `str.strip()` y `str.replace` de
+    pandas, en menos de la mitad del tiempo). Si el texto no se puede pasar a
+    Arrow (p. ej. caracteres sustitutos sueltos) se usa pandas.
+    """
+    texto = serie.astype(str)
+    try:
+        arreglo = pa.array(texto, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, UnicodeEncodeError):
+        texto = texto.str.strip()
+        con_punto = texto.str.contains(".", regex=False)
+        if con_punto.any():
+            texto = texto.copy()
+            texto[con_punto] = texto[con_punto].str.replace(
+                PATRON_SUFIJO_CERO, "", regex=True
+            )
+        return texto
+    arreglo = pc.replace_substring_regex(
+        pc.utf8_trim_whitespace(arreglo), PATRON_SUFIJO_CERO, ""
+    )
+    return pd.Series(
+        arreglo.to_numpy(zero_copy_only=False), index=serie.index, name=serie.name
+    )
+
+
+def _ids_numericos(serie: pd.Series) -> Optional[pd.Series]:
+    """
+    Texto de IDs numéricos sin pasar por expresiones regulares: los enteros se
+    formatean directo y los flotantes enteros (p. ej. 1001.0 leído de Excel)
+    se convierten a int64 antes, también en float32/float16 (cuyo `str` usa
+    notación exponencial desde 1e8: "1.2345679e+08"). Los demás valores
+    flotantes (decimales, cero negativo, valores enormes) se formatean con
+    `_ids_texto`. Retorna None si la serie no es numérica.
+    """
+    if pd.api.types.is_bool_dtype(serie):
+        return None
+    if pd.api.types.is_integer_dtype(serie) and not isinstance(
+        serie.dtype, pd.api.extensions.ExtensionDtype
+    ):
+        return serie.astype(str)
+    if not pd.api.types.is_float_dtype(serie) or isinstance(
+        serie.dtype, pd.api.extensions.ExtensionDtype
+    ):
+        return None
+
+    valores = serie.to_numpy().astype(np.float64)
+    validos = ~np.isnan(valores)
+    enteros = (
+        validos
+        & (np.abs(np.where(validos, valores, 0)) < LIMITE_ID_NUMERICO)
+        & (valores == np.floor(valores))
+        & ~((valores == 0) & np.signbit(valores))
+    )
+
+    texto = np.full(len(valores), "nan", dtype=object)
+    texto[enteros] = valores[enteros].astype("int64").astype(str).astype(object)
+    otros = validos & ~enteros
+    if otros.any():
+        texto[otros] = _ids_texto(serie[otros]).to_numpy()
+    return pd.Series(texto, index=serie.index, name=serie.name)
+
+
+@instrumentado()
+def normalizar_ids(serie: pd.Series) -> pd.Series:
+    """
+    Normaliza IDs quitando espacios y sufijos .0
+    Las columnas numéricas se formatean sin expresiones regulares y las de
+    texto (o mezcla de tipos) con los kernels de texto de Arrow.
+    """
+    # Si es un string vacío, devolver serie vacía
+    if isinstance(serie, str):
+        return pd.Series([], dtype=str)
+
+    numericos = _ids_numericos(serie)
+    if numericos is not None:
+        return numericos
+    return _ids_texto(serie)
+
+
+def buscar_columna(columnas: List, patrones: List[str]) -> Optional[str]:
+    """Primera columna que contiene alguno de los patrones (case insensitive)."""
+    for col in columnas:
+        col_lower = col.lower()
+        for patron in patrones:
+            if patron.lower() in col_lower:
+                return col
+    return None
+
+
+def encontrar_columna_por_patron(
+    df: pd.DataFrame, patrones: List[str]
+) -> Optional[str]:
+    """Busca una columna que coincida con alguno de los patrones (case insensitive)."""
+    return buscar_columna(df.columns, patrones)
+
+
+def mapear_columnas(
+    columnas: List,
+    patrones: Dict[str, List[str]],
+    solo_faltantes: bool = False,
+    crear_faltantes: bool = False,
+) -> Dict[str, object]:
+    """
+    Mapeo {columna estándar: columna del archivo} según los patrones, en el
+    orden de `patrones`. Con `solo_faltantes` se omiten las columnas estándar
+    que ya existen; con `crear_faltantes` las no encontradas se listan en
+    "faltantes" y cuentan como existentes para las búsquedas siguientes
+    (igual que al crearlas vacías en el DataFrame durante la búsqueda).
+    """
+    columnas = list(columnas)
+    mapeo = {}
+    faltantes = []
+    for col_std, patrones_col in patrones.items():
+        if solo_faltantes and col_std in columnas:
+            continue
+        col_encontrada = buscar_columna(columnas, patrones_col)
+        if col_encontrada:
+            mapeo[col_std] = col_encontrada
+        elif crear_faltantes:
+            faltantes.append(col_std)
+            columnas.append(col_std)
+    return {"mapeo": mapeo, "faltantes": faltantes}
+
+
+def resolver_columnas(
+    nombre: str,
+    columnas: List,
+    patrones: Dict[str, List[str]],
+    solo_faltantes: bool = False,
+    crear_faltantes: bool = False,
+) -> Dict[str, object]:
+    """
+    `mapear_columnas` memorizado por firma de encabezados (esquemas.py): un
+    formato de archivo ya visto, en esta u otra sesión o ejecución, no vuelve
+    a recorrer columnas y patrones.
+    """
+    reglas = {
+        "patrones": patrones,
+        "solo_faltantes": solo_faltantes,
+        "crear_faltantes": crear_faltantes,
+    }
+    return esquemas_compartidos().resolver(
+        nombre,
+        list(columnas),
+        reglas,
+        lambda: mapear_columnas(columnas, patrones, solo_faltantes, crear_faltantes),
+    )
+
+
+def proyectar_columnas(
+    df: pd.DataFrame,
+    columnas: List[str],
+    mapeo: Dict[str, str],
+    por_defecto: Optional[Dict[str, object]] = None,
+) -> pd.DataFrame:
+    """
+    DataFrame nuevo solo con `columnas` (nombres estándar). Cada una se toma de
+    la columna con ese nombre o, si no existe, de su columna original según
+    `mapeo`; las que no aparecen se crean con su valor de `por_defecto` ("" si
+    no se indica). `df` no se modifica y sus demás columnas no se arrastran.
+    """
+    por_defecto = por_defecto or {}
+    datos = {}
+    for col in columnas:
+        origen = col if col in df.columns else mapeo.get(col)
+        if origen is not None and origen in df.columns:
+            datos[col] = df[origen]
+        else:
+            datos[col] = por_defecto.get(col, "")
+    return pd.DataFrame(datos, index=df.index)
+
+
+def normalizar_nombres_columnas(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia superficial con 'Almacen'/'Almaçen' escritos como 'Almacén'."""
+    df = df.copy(deep=False)
+    df.columns = [
+        col.replace("Almacen", "Almacén").replace("Almaçen", "Almacén")
+        for col in df.columns
+    ]
+    return df
+
+
+# ------------------------------------------------------------------------------
+# Normalización de fechas
+# ------------------------------------------------------------------------------
+# Las columnas de fecha se convierten una sola vez, al normalizar cada hoja, y
+# viajan como datetime64 por todo el proceso; el texto dd/mm/aaaa se genera
+# solo al exportar (ver COLUMNAS_FECHA_TEXTO).
+FORMATO_FECHA_SALIDA = "%d/%m/%Y"
+FORMATOS_FECHA = (
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%y",
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d",
+)
+TAMANO_MUESTRA_FECHAS = 200
+# Números de serie de Excel (días desde 1899-12-30) hasta el 31/12/9999
+ORIGEN_SERIAL_EXCEL = "1899-12-30"
+MAXIMO_SERIAL_EXCEL = 2_958_465
+
+
+@functools.lru_cache(maxsize=256)
+def detectar_formato_fecha(muestra: Tuple[str, ...]) -> Optional[str]:
+    """Primer formato de FORMATOS_FECHA que interpreta toda la muestra (o None)."""
+    for formato in FORMATOS_FECHA:
+        try:
+            pd.to_datetime(pd.Series(muestra, dtype=object), format=formato)
+            return formato
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def _fechas_desde_texto(serie: pd.Series, dayfirst: bool) -> pd.Series:
+    """Convierte texto con el formato detectado en una muestra de la columna."""
+    texto = serie.str.strip()
+    texto = texto.where(texto != "")
+    muestra = tuple(texto.dropna().drop_duplicates().head(TAMANO_MUESTRA_FECHAS))
+    if not muestra:
+        return pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+
+    formato = detectar_formato_fecha(muestra)
+    if formato is None:
+        return pd.to_datetime(texto, dayfirst=dayfirst, format="mixed", errors="coerce")
+
+    fechas = pd.to_datetime(texto, format=formato, errors="coerce")
+    # Filas fuera de la muestra con otro formato: interpretación general
+    faltantes = fechas.isna() & texto.notna()
+    if faltantes.any():
+        fechas[faltantes] = pd.to_datetime(
+            texto[faltantes], dayfirst=dayfirst, format="mixed", errors="coerce"
+        )
+    return fechas
+
+
+def _fechas_desde_numeros(numeros: pd.Series) -> pd.Series:
+    """Números de serie de Excel y enteros AAAAMMDD (el resto queda NaT)."""
+    fechas = pd.Series(pd.NaT, index=numeros.index, dtype="datetime64[ns]")
+    serial = numeros.between(1, MAXIMO_SERIAL_EXCEL)
+    if serial.any():
+        fechas[serial] = pd.to_datetime(
+            numeros[serial], unit="D", origin=ORIGEN_SERIAL_EXCEL
+        )
+    aaaammdd = numeros.between(19000101, 99991231) & (numeros % 1 == 0)
+    if aaaammdd.any():
+        fechas[aaaammdd] = pd.to_datetime(
+            numeros[aaaammdd].astype("int64").astype(str),
+            format="%Y%m%d",
+            errors="coerce",
+        )
+    return fechas
+
+
+@instrumentado()
+def normalizar_fechas(serie: pd.Series, dayfirst: bool = True) -> pd.Series:
+    """
+    Convierte una columna de fechas leída de Excel a datetime64 en una sola
+    pasada vectorizada. Según el contenido de la columna:
+    - fechas (datetime64 o objetos fecha): se conservan
+    - números: serie de Excel (o AAAAMMDD)
+    - texto: formato explícito detectado en una muestra; lo que no se
+      interprete con él se intenta con dayfirst
+    Las columnas mixtas se separan por tipo. Lo que no es fecha queda NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if pd.api.types.is_numeric_dtype(serie):
+        return _fechas_desde_numeros(pd.to_numeric(serie, errors="coerce"))
+
+    tipo = pd.api.types.infer_dtype(serie, skipna=True)
+    if tipo == "empty":
+        return pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    if tipo == "string":
+        return _fechas_desde_texto(serie, dayfirst)
+    if tipo in ("datetime", "datetime64", "date"):
+        return pd.to_datetime(serie, errors="coerce")
+
+    # Columna mixta: texto, números y fechas por separado
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    es_texto = serie.map(lambda valor: isinstance(valor, str))
+    if es_texto.any():
+        fechas[es_texto] = _fechas_desde_texto(serie[es_texto], dayfirst)
+    resto = serie[~es_texto & serie.notna()]
+    numeros = pd.to_numeric(resto, errors="coerce")
+    if numeros.notna().any():
+        fechas[numeros.index[numeros.notna()]] = _fechas_desde_numeros(numeros.dropna())
+    otros = resto[numeros.isna()]
+    if not otros.empty:
+        fechas[otros.index] = pd.to_datetime(otros, errors="coerce")
+    return fechas
+
+
+def fecha_escalar(valor) -> pd.Timestamp:
+    """Convierte un valor suelto a Timestamp (NaT si está vacío o no es fecha)."""
+    if isinstance(valor, pd.Timestamp):
+        return valor
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        return pd.NaT
+    if not isinstance(valor, str) and pd.isna(valor):
+        return pd.NaT
+    return normalizar_fechas(pd.Series([valor], dtype=object)).iloc[0]
+
+
+def formatear_fechas(
+    serie: pd.Series, formato: str = FORMATO_FECHA_SALIDA
+) -> pd.Series:
+    """Texto de una columna datetime64 (vacío donde no hay fecha)."""
+    return serie.dt.strftime(formato).fillna("")
+
+
+# Columnas requeridas del inventario y patrones para encontrarlas (en orden)
+PATRONES_INVENTARIO = {
+    "Centro": ["centro", "center"],
+    "Material": ["material", "mat", "artículo"],
+    "Almacén": ["almacén", "almacen", "almacen"],
+    "Libre Utilización": [
+        "libre utilización",
+        "libre utilizacion",
+        "disponible",
+        "stock",
+    ],
+    "Cant. en Tránsito": [
+        "tránsito",
+        "transito",
+        "en tránsito",
+        "en transito",
+        "cant. en tránsito",
+    ],
+    "Entrega a cliente": [
+        "entrega a cliente",
+        "entrega cliente",
+        "entregado",
+        "cantidad entregada",
+        "entregas",
+    ],
+    "Descripción": [
+        "descripción",
+        "descripcion",
+        "texto breve",
+        "texto material",
+        "nombre",
+        "texto",
+        "descr",
+        "artículo",
+    ],
+}
+
+
+@instrumentado()
+def procesar_hoja_inventario_ajustada(
+    df_inventario: pd.DataFrame,
+    avisar: Optional[Aviso] = None,
+    agregado: bool = False,
+) -> pd.DataFrame:
+    """
+    Procesa la hoja de inventario y realiza el cálculo: 'Libre Utilización' - 'Entrega a cliente'.
+    Con `agregado` retorna una fila por Centro/Material/Almacén (ver agregar_inventario).
+    """
+    avisar = avisar or _aviso_por_defecto
+    if df_inventario.empty:
+        return pd.DataFrame()
+
+    # Normalizar nombres de columnas (sin modificar el DataFrame recibido)
+    df_inventario = normalizar_nombres_columnas(df_inventario)
+
+    # Buscar columnas por patrones (memorizado por formato de archivo)
+    resolucion = resolver_columnas(
+        "inventario",
+        df_inventario.columns,
+        PATRONES_INVENTARIO,
+        solo_faltantes=True,
+        crear_faltantes=True,
+    )
+
+    # Proyectar a las columnas estándar: las encontradas se toman con su nombre
+    # estándar y las que no, se crean vacías para texto o en 0 para numéricas
+    df_inventario = proyectar_columnas(
+        df_inventario,
+        list(PATRONES_INVENTARIO),
+        resolucion["mapeo"],
+        por_defecto={
+            "Libre Utilización": 0,
+            "Cant. en Tránsito": 0,
+            "Entrega a cliente": 0,
+        },
+    )
+
+    # Normalizar IDs
+    for col in ["Centro", "Material", "Almacén"]:
+        if col in df_inventario.columns:
+            df_inventario[col] = normalizar_ids(df_inventario[col])
+
+    # Convertir numéricos (AGREGAR "Entrega a cliente")
+    columnas_numericas = ["Libre Utilización", "Cant. en Tránsito", "Entrega a cliente"]
+
+    for col in columnas_numericas:
+        if col in df_inventario.columns:
+            df_inventario[col] = pd.to_numeric(
+                df_inventario[col], errors="coerce"
+            ).fillna(0)
+
+    # ------------------------------------------------------------------
+    # REALIZAR EL CÁLCULO SOLICITADO: "Libre Utilización" - "Entrega a cliente"
+    # ------------------------------------------------------------------
+    if (
+        "Libre Utilización" in df_inventario.columns
+        and "Entrega a cliente" in df_inventario.columns
+    ):
+        avisar(
+            "⚠️ **Cálculo aplicado:** Se ha ajustado el inventario restando 'Entrega a cliente' de 'Libre Utilización'"
+        )
+
+        # Calcular el nuevo valor de Libre Utilización
+        df_inventario["Libre Utilización"] = (
+            df_inventario["Libre Utilización"] - df_inventario["Entrega a cliente"]
+        )
+
+        # Asegurar que no haya valores negativos
+        df_inventario["Libre Utilización"] = df_inventario["Libre Utilización"].clip(
+            lower=0
+        )
+
+        # Mostrar estadísticas del ajuste
+        total_ajuste = (df_inventario["Entrega a cliente"]).sum()
+        avisar(
+            f"**Ajuste aplicado:** {total_ajuste:,.0f} unidades restadas del inventario"
+        )
+
+    # Mantener columnas relevantes (AGREGAR "Descripción")
+    columnas_finales = [
+        "Centro",
+        "Material",
+        "Almacén",
+        "Descripción",  # NUEVA: Agregar descripción
+        "Libre Utilización",
+        "Cant. en Tránsito",
+    ]
+    columnas_finales = [col for col in columnas_finales if col in df_inventario.columns]
+    df_inventario = df_inventario[columnas_finales]
+
+    if agregado:
+        filas_detalle = len(df_inventario)
+        df_inventario = agregar_inventario(df_inventario)
+        avisar(
+            f"Inventario agregado por Centro/Material/Almacén: {filas_detalle} "
+            f"filas -> {len(df_inventario)}"
+        )
+
+    return df_inventario
+
+
+COLUMNAS_CLAVE_INVENTARIO = ["Centro", "Material", "Almacén"]
+
+
+@instrumentado()
+def agregar_inventario(df_inventario: pd.DataFrame) -> pd.DataFrame:
+    """
+    Inventario con una fila por (Centro, Material, Almacén), en el orden de
+    primera aparición: 'Libre Utilización' y 'Cant. en Tránsito' sumadas y la
+    primera 'Descripción' no vacía. Las filas por lote o stock especial del
+    mismo almacén se suman una sola vez aquí en lugar de en cada búsqueda.
+    """
+    if df_inventario.empty or not set(COLUMNAS_CLAVE_INVENTARIO) <= set(
+        df_inventario.columns
+    ):
+        return df_inventario
+
+    agregaciones = {
+        col: "sum"
+        for col in ["Libre Utilización", "Cant. en Tránsito"]
+        if col in df_inventario.columns
+    }
+    if "Descripción" in df_inventario.columns:
+        descripcion = df_inventario["Descripción"]
+        # "first" ignora los nulos: las descripciones vacías se vuelven nulas
+        df_inventario = df_inventario.assign(
+            **{
+                "Descripción": descripcion.mask(
+                    descripcion.fillna("").astype(str).str.strip() == ""
+                )
+            }
+        )
+        agregaciones["Descripción"] = "first"
+
+    agregado = (
+        df_inventario.groupby(COLUMNAS_CLAVE_INVENTARIO, sort=False)
+        .agg(agregaciones)
+        .reset_index()
+    )
+    if "Descripción" in agregado.columns:
+        agregado["Descripción"] = agregado["Descripción"].fillna("")
+    return agregado[list(df_inventario.columns)]
+
+
+# Columnas estándar de las hojas externas (las demás no se conservan)
+COLUMNAS_EXTERNAS = [
+    "Material",
+    "Centro",
+    "Almacén",
+    "CantidadDisp",
+    "Descripcion",
+    "Lote",
+    "FechaCaducidad",
+    "Material sustituto",
+    "Texto material sustituto",
+]
+
+
+# ------------------------------------------------------------------------------
+# MODIFICAR: procesar_hoja_externa para normalizar mejor las columnas
+# ------------------------------------------------------------------------------
+@instrumentado()
+def procesar_hoja_externa(df_externo: pd.DataFrame, nombre_hoja: str) -> pd.DataFrame:
+    """Procesa hojas externas (Corta caducidad, Lento mov, etc.)"""
+    if df_externo.empty:
+        return pd.DataFrame()
+
+    # Normalizar nombres de columnas (sin modificar el DataFrame recibido)
+    df_externo = normalizar_nombres_columnas(df_externo)
+
+    # Columnas base requeridas
+    columnas_base = ["Material", "Centro", "Almacén", "CantidadDisp"]
+
+    # Para cada hoja, buscar columnas por patrones
+    columnas_a_buscar = {}
+
+    if nombre_hoja == "Corta caducidad":
+        columnas_a_buscar = {
+            "Material": ["material", "mat", "artículo"],
+            "Centro": ["centro", "center"],
+            "Almacén": ["almacén", "almacen"],
+            "CantidadDisp": [
+                "cantidad",
+                "disp",
+                "disponible",
+                "stock",
+                "libre utilización",
+                "libre utilizacion",
+            ],
+            "Descripcion": ["descripción", "descripcion", "desc", "texto"],
+            "Lote": ["lote", "batch", "lote"],
+            "FechaCaducidad": [
+                "caducidad",
+                "fecha caducidad",
+                "vencimiento",
+                "expira",
+                "fecaduc/feprefercons",
+            ],
+        }
+    elif nombre_hoja == "Lento mov":
+        columnas_a_buscar = {
+            "Material": ["material", "mat", "artículo"],
+            "Descripcion": [
+                "descripción",
+                "descripcion",
+                "desc",
+                "texto",
+                "texto breve",
+            ],
+        }
+    elif nombre_hoja == "Cosmopark":
+        columnas_a_buscar = {
+            "Material": ["material", "mat", "artículo", "codigo"],
+            "Centro": ["centro", "center"],
+            "CantidadDisp": ["cantidad", "disp", "disponible", "stock"],
+            "Descripcion": [
+                "descripción",
+                "descripcion",
+                "desc",
+                "texto",
+                "texto material",
+            ],
+            "Lote": ["lote", "batch", "lote"],
+            "FechaCaducidad": ["caducidad", "fecha caducidad", "vencimiento", "expira"],
+        }
+    elif nombre_hoja == "Sustituto":
+        columnas_a_buscar = {
+            "Material": ["material", "mat", "artículo"],
+            "Material sustituto": ["material sustituto", "sustituto", "alternativo"],
+            "Texto material sustituto": [
+                "texto material sustituto",
+                "descripción sustituto",
+                "desc sustituto",
+            ],
+        }
+    elif nombre_hoja in ["PNC", "Caduco"]:
+        columnas_a_buscar = {
+            "Material": ["material", "mat", "artículo"],
+            "Centro": ["centro", "center"],
+            "Almacén": ["almacén", "almacen"],
+            "CantidadDisp": ["cantidad", "disp", "disponible", "stock"],
+            "Descripcion": ["descripción", "descripcion", "desc", "texto"],
+            "Lote": ["lote", "batch", "lote"],
+            "FechaCaducidad": ["caducidad", "fecha caducidad", "vencimiento", "expira"],
+        }
+    else:
+        columnas_a_buscar = {}
+
+    # Buscar y asignar columnas (memorizado por hoja y formato de archivo)
+    mapeo_encontrado = dict(
+        resolver_columnas(
+            f"externa:{nombre_hoja}", df_externo.columns, columnas_a_buscar
+        )["mapeo"]
+    )
+    if "Material" in columnas_a_buscar and "Material" not in mapeo_encontrado:
+        # Buscar material en cualquier columna numérica que pueda ser ID
+        # (depende de los datos, no solo de los encabezados)
+        for col in df_externo.columns:
+            if (
+                df_externo[col].dtype in ["int64", "float64"]
+                and df_externo[col].astype(str).str.match(r"^\d+$").any()
+            ):
+                mapeo_encontrado["Material"] = col
+                break
+
+    # Otra columna de cantidad por si la encontrada viene toda en 0
+    col_cantidad_alternativa = None
+    if nombre_hoja in ["Cosmopark", "PNC"]:
+        col_cantidad_alternativa = next(
+            (
+                col
+                for col in df_externo.columns
+                if any(term in col.lower() for term in ["cant", "qty", "quantity"])
+            ),
+            None,
+        )
+    cantidad_alternativa = (
+        df_externo[col_cantidad_alternativa] if col_cantidad_alternativa else None
+    )
+
+    # Proyectar a las columnas estándar encontradas más las requeridas (las
+    # columnas originales no se arrastran)
+    columnas = [
+        col
+        for col in COLUMNAS_EXTERNAS
+        if col in columnas_base or col in mapeo_encontrado or col in df_externo.columns
+    ]
+    df_externo = proyectar_columnas(
+        df_externo, columnas, mapeo_encontrado, por_defecto={"CantidadDisp": 0}
+    )
+
+    # Agregar nombre de la hoja como atributo
+    df_externo.attrs["nombre_hoja"] = nombre_hoja
+
+    # Normalizar IDs
+    for col in ["Centro", "Material", "Almacén"]:
+        if col in df_externo.columns:
+            df_externo[col] = normalizar_ids(df_externo[col])
+
+    # Convertir cantidades a numérico - IMPORTANTE: manejar diferentes formatos
+    if "CantidadDisp" in df_externo.columns:
+        df_externo["CantidadDisp"] = pd.to_numeric(
+            df_externo["CantidadDisp"], errors="coerce"
+        ).fillna(0)
+
+        # Si todos los valores son 0, intentar buscar otra columna de cantidad
+        if df_externo["CantidadDisp"].sum() == 0 and nombre_hoja in [
+            "Cosmopark",
+            "PNC",
+        ]:
+            if cantidad_alternativa is not None:
+                df_externo["CantidadDisp"] = pd.to_numeric(
+                    cantidad_alternativa, errors="coerce"
+                ).fillna(0)
+
+    # Procesar fecha de caducidad
+    if "FechaCaducidad" in df_externo.columns:
+        # Se conserva como datetime64; el texto dd/mm/aaaa se genera al exportar
+        df_externo["FechaCaducidad"] = normalizar_fechas(df_externo["FechaCaducidad"])
+
+    # DEPURACIÓN: Mostrar columnas encontradas
+    if nombre_hoja == "Lento mov":
+        logger.info(f"Columnas en hoja 'Lento mov': {df_externo.columns.tolist()}")
+        if "Material" in df_externo.columns:
+            logger.info(
+                f"Materiales en 'Lento mov': {df_externo['Material'].head().tolist()}"
+            )
+
+    return df_externo
+
+
+@instrumentado()
+def calcular_estadisticas_facturacion_por_almacen(
+    df_facturacion: pd.DataFrame,
+    avisar: Optional[Aviso] = None,
+    cubo: Optional["FacturacionCube"] = None,
+) -> pd.DataFrame:
+    """
+    Calcula estadísticas de facturación por Centro/Almacén/Material:
+    1. Última fecha de facturación (mm/aaaa) y suma total de ese mes
+    2. Penúltima fecha de facturación (mm/aaaa) y suma total de ese mes
+    3. Suma de cantidad facturada por mes
+
+    Se calcula sobre el cubo de facturación; si no se indica `cubo` se
+    construye a partir de `df_facturacion`.
+    """
+    avisar = avisar or _aviso_por_defecto
+
+    if cubo is None:
+        if df_facturacion is None or df_facturacion.empty:
+            return pd.DataFrame()
+
+        # Asegurar que tenemos las columnas necesarias
+        columnas_necesarias = [
+            "Centro",
+            "Material",
+            "Almacén",
+            "Fecha",
+            "Cantidad",
+            "Importe",
+        ]
+        for col in columnas_necesarias:
+            if col not in df_facturacion.columns:
+                avisar(f"Columna {col} no encontrada en datos de facturación")
+                return pd.DataFrame()
+
+    try:
+        if cubo is None:
+            cubo = FacturacionCube.desde_facturacion(df_facturacion)
+        df_mensual = cubo.almacen
+
+        if df_mensual.empty:
+            return pd.DataFrame()
+
+        # Solo meses con filas válidas (Cantidad e Importe positivos)
+        df_valido = df_mensual[df_mensual["precio_cuenta"] > 0]
+
+        if df_valido.empty:
+            return pd.DataFrame()
+
+        claves = ["Centro", "Almacén", "Material"]
+
+        # Para cada grupo (Centro/Almacén/Material), los 2 últimos meses
+        ultimo, penultimo = ultimos_meses(df_valido, claves)
+
+        return pd.DataFrame(
+            {
+                "Ultima_Fecha_Facturacion": texto_mes(ultimo["mes"]),
+                "Ultima_Cantidad_Facturada": ultimo["cantidad_con_importe"],
+                "Ultimo_Importe_Facturado": ultimo["importe_con_importe"],
+                # Si solo hay un mes, dejar penúltimas columnas vacías
+                "Penultima_Fecha_Facturacion": texto_mes(penultimo["mes"])
+                .reindex(ultimo.index)
+                .fillna(""),
+                "Penultima_Cantidad_Facturada": penultimo["cantidad_con_importe"]
+                .reindex(ultimo.index)
+                .fillna(0),
+                "Penultimo_Importe_Facturado": penultimo["importe_con_importe"]
+                .reindex(ultimo.index)
+                .fillna(0),
+            },
+            index=ultimo.index,
+        ).reset_index()
+
+    except Exception as e:
+        logger.error(f"Error al calcular estadísticas de facturación: {str(e)}")
+        return pd.DataFrame()
+
+
+# Columnas de facturación y patrones para encontrarlas (en orden)
+PATRONES_FACTURACION = {
+    "Solicitante": ["solicitante", "solicitud", "cliente solicitante"],
+    "Razón Social": ["razón social", "razon social", "nombre cliente"],
+    "Destinatario": ["destinatario", "cliente final", "destino"],
+    "Fecha": ["fecha", "fecha factura", "fecha documento"],
+    "Factura": ["factura", "no. factura", "documento"],
+    "Material": ["material", "artículo", "producto"],
+    "Texto Material": ["texto material", "descripción", "descripcion"],
+    "Cantidad": ["cantidad", "qty", "quantity"],
+    "UM": ["um", "unidad medida", "unidad"],
+    "Importe": ["importe", "valor", "monto", "total"],
+    "Centro": ["centro", "plant", "sede"],
+    "Almacén": ["almacén", "almacen", "warehouse"],
+    "Doc. Ventas": ["doc. ventas", "documento ventas", "pedido"],
+    "Gpo. Vdor.": ["gpo. vdor.", "grupo vendedor", "vendedor"],
+    "Grp. Cliente": ["grp. cliente", "grupo cliente", "tipo cliente"],
+}
+
+# Clave de negocio de una línea de factura: dos filas con la misma clave son
+# la misma línea repetida en el extracto
+CLAVE_DEDUP_FACTURACION = ["Factura", "Material", "Fecha", "Cantidad", "Importe"]
+
+
+def clave_dedup_facturacion(claves: Optional[List[str]] = None) -> List[str]:
+    """
+    Columnas de la clave de deduplicación: `claves`, o la variable
+    SUGERIDOR_CLAVE_DEDUP_FACTURACION (columnas estándar de PATRONES_FACTURACION
+    separadas por comas), o CLAVE_DEDUP_FACTURACION.
+    """
+    if claves:
+        return list(claves)
+    return _codigos_entorno(
+        "SUGERIDOR_CLAVE_DEDUP_FACTURACION", CLAVE_DEDUP_FACTURACION
+    )
+
+
+@instrumentado()
+def deduplicar_facturacion(
+    df_facturacion: pd.DataFrame, claves: Optional[List[str]] = None
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Quita las líneas de facturación repetidas según una clave de negocio
+    (ver clave_dedup_facturacion), con una huella vectorizada de solo
+    esas columnas en lugar de comparar la fila completa. Si alguna columna de
+    la clave no existe o viene vacía (p. ej. el extracto no trae Factura) se
+    usa la fila completa, para no juntar líneas distintas.
+    Retorna (DataFrame sin repetidas, cantidad de filas quitadas).
+    """
+    if df_facturacion is None or df_facturacion.empty:
+        return df_facturacion, 0
+
+    claves = clave_dedup_facturacion(claves)
+    clave_completa = all(
+        col in df_facturacion.columns and not df_facturacion[col].eq("").all()
+        for col in claves
+    )
+    columnas = claves if clave_completa else list(df_facturacion.columns)
+
+    huellas = pd.util.hash_pandas_object(df_facturacion[columnas], index=False)
+    repetidas = huellas.duplicated().to_numpy()
+    quitadas = int(repetidas.sum())
+    if quitadas:
+        df_facturacion = df_facturacion[~repetidas]
+    return df_facturacion, quitadas
+
+
+@instrumentado()
+def procesar_datos_facturacion(
+    df_facturacion: pd.DataFrame,
+    avisar: Optional[Aviso] = None,
+    clave_dedup: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Versión OPTIMIZADA del procesamiento de facturación.
+    Las líneas repetidas se quitan aquí, una sola vez al cargar
+    (deduplicar_facturacion con la clave `clave_dedup`).
+    """
+    avisar = avisar or _aviso_por_defecto
+    if df_facturacion.empty:
+        return pd.DataFrame()
+
+    # Normalizar nombres de columnas (sin modificar el DataFrame recibido)
+    df_facturacion = normalizar_nombres_columnas(df_facturacion)
+
+    # Buscar columnas por patrones (memorizado por formato de archivo)
+    resolucion = resolver_columnas(
+        "facturacion",
+        df_facturacion.columns,
+        PATRONES_FACTURACION,
+        solo_faltantes=True,
+        crear_faltantes=True,
+    )
+
+    # Proyectar a las columnas estándar (las no encontradas quedan vacías); los
+    # extractos de facturación traen muchas columnas que no se usan
+    df_facturacion = proyectar_columnas(
+        df_facturacion, list(PATRONES_FACTURACION), resolucion["mapeo"]
+    )
+
+    # Normalizar IDs - vectorizado
+    for col in ["Centro", "Material", "Almacén", "Destinatario", "Solicitante"]:
+        if col in df_facturacion.columns:
+            df_facturacion[col] = normalizar_ids(df_facturacion[col])
+
+    # Convertir fechas (formato detectado una vez para toda la columna)
+    if "Fecha" in df_facturacion.columns:
+        df_facturacion["Fecha"] = normalizar_fechas(df_facturacion["Fecha"])
+
+    # Convertir numéricos - vectorizado
+    for col in ["Cantidad", "Importe"]:
+        if col in df_facturacion.columns:
+            df_facturacion[col] = pd.to_numeric(
+                df_facturacion[col], errors="coerce"
+            ).fillna(0)
+
+    # Quitar líneas repetidas por clave de negocio
+    df_facturacion, quitadas = deduplicar_facturacion(df_facturacion, clave_dedup)
+    if quitadas:
+        avisar(f"Facturación: {quitadas:,} líneas repetidas descartadas")
+
+    return df_facturacion
+
+
+# =========================
+# RESUMEN MENSUAL DE FACTURACIÓN
+# =========================
+# Los reportes de consumo se calculan sobre agregados por mes (clave entera
+# AAAAMM; 0 agrupa las filas sin fecha) en lugar de las filas crudas. Así los
+# meses ya facturados se pueden conservar en el historial persistente
+# (historial_facturacion.py) y combinarse con los de archivos nuevos.
+CLAVE_CLIENTE = ["Solicitante", "Destinatario", "Material"]
+CLAVE_ALMACEN = ["Centro", "Almacén", "Material"]
+ATRIBUTOS_CLIENTE = [
+    "Razón Social",
+    "Texto Material",
+    "UM",
+    "Gpo. Vdor.",
+    "Grp. Cliente",
+]
+
+
+def clave_mes(fechas: pd.Series) -> pd.Series:
+    """Mes de cada fecha como entero AAAAMM (0 si no hay fecha)."""
+    fechas = pd.to_datetime(fechas, errors="coerce")
+    return (fechas.dt.year * 100 + fechas.dt.month).fillna(0).astype("int64")
+
+
+def texto_mes(meses: pd.Series) -> pd.Series:
+    """Formatea meses AAAAMM como MM/AAAA (los faltantes quedan NaN)."""
+    validos = meses.dropna().astype("int64")
+    texto = (
+        (validos % 100).astype(str).str.zfill(2) + "/" + (validos // 100).astype(str)
+    )
+    return texto.reindex(meses.index)
+
+
+def mes_de_fecha(fecha=None) -> int:
+    """
+    Mes AAAAMM de una fecha de corte (Timestamp, date, texto o un entero
+    AAAAMM); el mes en curso si no se indica.
+    """
+    if isinstance(fecha, (int, np.integer)):
+        return int(fecha)
+    fecha = pd.Timestamp.now() if fecha is None else pd.Timestamp(fecha)
+    return fecha.year * 100 + fecha.month
+
+
+def indice_mes(meses):
+    """Meses AAAAMM como número de meses corrido (para restar meses)."""
+    return (meses // 100) * 12 + meses % 100
+
+
+def ultimos_meses(
+    tabla: pd.DataFrame, claves: List[str], cantidad: int = 2
+) -> List[pd.DataFrame]:
+    """
+    Registros del último, penúltimo, ... mes (con fecha) de cada grupo de
+    `claves` en una tabla mensual, indexados por las claves.
+    """
+    con_fecha = tabla[tabla["mes"] > 0]
+    ordenado = con_fecha.sort_values(
+        claves + ["mes"], ascending=[True] * len(claves) + [False]
+    )
+    posicion = ordenado.groupby(claves).cumcount()
+    return [ordenado[posicion == n].set_index(claves) for n in range(cantidad)]
+
+
+@instrumentado()
+def resumir_facturacion_mensual(
+    df_facturacion: pd.DataFrame,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Agrega la facturación procesada por mes en tres tablas:
+    - "cliente": por Solicitante/Destinatario/Material, sobre las filas con
+      Cantidad e Importe positivos (criterio del reporte de consumo).
+      Cantidad, importe, facturas con fecha, min/max/suma/conteo del precio
+      unitario, primera fila del grupo y datos descriptivos más recientes.
+    - "destinatario": Centro de la factura más reciente de cada mes.
+    - "almacen": por Centro/Almacén/Material, sobre las filas con fecha y
+      Cantidad positiva (criterio de las estadísticas del resumen). Incluye
+      aparte los totales y precios de las filas con Importe positivo.
+    """
+    resultado = {
+        "cliente": pd.DataFrame(),
+        "destinatario": pd.DataFrame(),
+        "almacen": pd.DataFrame(),
+    }
+    if df_facturacion is None or df_facturacion.empty:
+        return resultado
+
+    columnas_cliente = CLAVE_CLIENTE + ["Centro", "Fecha", "Cantidad", "Importe"]
+    if all(col in df_facturacion.columns for col in columnas_cliente):
+        # Las líneas repetidas ya se quitaron al cargar (deduplicar_facturacion)
+        df_cliente = df_facturacion[
+            (df_facturacion["Cantidad"] > 0) & (df_facturacion["Importe"] > 0)
+        ]
+        df_cliente = df_cliente.assign(
+            Fecha=pd.to_datetime(df_cliente["Fecha"], errors="coerce"),
+            mes=clave_mes(df_cliente["Fecha"]),
+            precio=df_cliente["Importe"] / df_cliente["Cantidad"],
+            fila=np.arange(len(df_cliente)),
+        )
+
+        if not df_cliente.empty:
+            # Dentro de cada mes, los datos descriptivos de la factura más reciente
+            ordenado = df_cliente.sort_values(
+                CLAVE_CLIENTE + ["mes", "Fecha"],
+                ascending=[True, True, True, False, False],
+            )
+            atributos = {
+                col: (col, "first")
+                for col in ATRIBUTOS_CLIENTE
+                if col in ordenado.columns
+            }
+            resultado["cliente"] = (
+                ordenado.groupby(CLAVE_CLIENTE + ["mes"], sort=False)
+                .agg(
+                    cantidad=("Cantidad", "sum"),
+                    importe=("Importe", "sum"),
+                    filas=("Fecha", "count"),
+                    precio_min=("precio", "min"),
+                    precio_max=("precio", "max"),
+                    precio_suma=("precio", "sum"),
+                    precio_cuenta=("precio", "count"),
+                    primera_fila=("fila", "min"),
+                    **atributos,
+                )
+                .reset_index()
+            )
+
+            # Centro de la factura más reciente por Destinatario y mes
+            resultado["destinatario"] = (
+                df_cliente.sort_values(["Fecha", "fila"], ascending=[False, True])
+                .groupby(["Destinatario", "mes"], sort=False)
+                .agg(Centro=("Centro", "first"))
+                .reset_index()
+            )
+
+    columnas_almacen = CLAVE_ALMACEN + ["Fecha", "Cantidad", "Importe"]
+    if all(col in df_facturacion.columns for col in columnas_almacen):
+        fechas = pd.to_datetime(df_facturacion["Fecha"], errors="coerce")
+        df_almacen = df_facturacion[fechas.notna() & (df_facturacion["Cantidad"] > 0)]
+        con_importe = df_almacen["Importe"] > 0
+        df_almacen = df_almacen.assign(
+            mes=clave_mes(df_almacen["Fecha"]),
+            cantidad_con_importe=df_almacen["Cantidad"].where(con_importe, 0),
+            importe_con_importe=df_almacen["Importe"].where(con_importe, 0),
+            precio=(df_almacen["Importe"] / df_almacen["Cantidad"]).where(con_importe),
+        )
+
+        if not df_almacen.empty:
+            resultado["almacen"] = (
+                df_almacen.groupby(CLAVE_ALMACEN + ["mes"])
+                .agg(
+                    cantidad=("Cantidad", "sum"),
+                    importe=("Importe", "sum"),
+                    filas=("Cantidad", "size"),
+                    cantidad_con_importe=("cantidad_con_importe", "sum"),
+                    importe_con_importe=("importe_con_importe", "sum"),
+                    precio_min=("precio", "min"),
+                    precio_max=("precio", "max"),
+                    precio_suma=("precio", "sum"),
+                    precio_cuenta=("precio", "count"),
+                )
+                .reset_index()
+            )
+
+    return resultado
+
+
+class FacturacionCube:
+    """
+    Agregados mensuales de la facturación (tablas "cliente", "destinatario" y
+    "almacen" de `resumir_facturacion_mensual`) con claves de mes enteras.
+    Se construye una sola vez tras `procesar_datos_facturacion` (o desde el
+    historial) y lo comparten el reporte de consumo y las estadísticas por
+    almacén; ninguno modifica sus tablas.
+
+    `meses` son los meses presentes en la facturación de origen, incluidos
+    los que solo tienen filas no válidas: son los que reemplaza en el historial.
+    """
+
+    def __init__(
+        self, tablas: Dict[str, pd.DataFrame], meses: Optional[List[int]] = None
+    ):
+        self.cliente = tablas.get("cliente", pd.DataFrame())
+        self.destinatario = tablas.get("destinatario", pd.DataFrame())
+        self.almacen = tablas.get("almacen", pd.DataFrame())
+        if meses is None:
+            meses = set()
+            for df in self.tablas().values():
+                if "mes" in df.columns:
+                    meses.update(df["mes"].unique().tolist())
+        self.meses = sorted(int(mes) for mes in meses)
+
+    @classmethod
+    def desde_facturacion(cls, df_facturacion: pd.DataFrame) -> "FacturacionCube":
+        """Construye el cubo a partir de la facturación procesada."""
+        meses = []
+        if df_facturacion is not None and "Fecha" in df_facturacion.columns:
+            meses = clave_mes(df_facturacion["Fecha"]).unique().tolist()
+        return cls(resumir_facturacion_mensual(df_facturacion), meses)
+
+    def tablas(self) -> Dict[str, pd.DataFrame]:
+        return {
+            "cliente": self.cliente,
+            "destinatario": self.destinatario,
+            "almacen": self.almacen,
+        }
+
+    @property
+    def vacio(self) -> bool:
+        return all(df.empty for df in self.tablas().values())
+
+
+def actualizar_historial_facturacion(
+    ruta: str, cubo: Optional[FacturacionCube], avisar: Optional[Aviso] = None
+) -> FacturacionCube:
+    """
+    Reemplaza en el historial de `ruta` los meses del cubo (facturación recién
+    cargada) y retorna el cubo de todo el historial.
+    """
+    avisar = avisar or _aviso_por_defecto
+    historial = HistorialFacturacion(ruta)
+
+    if cubo is not None and cubo.meses:
+        reemplazados = historial.actualizar(cubo.tablas(), cubo.meses)
+        avisar(f"🗄️ Historial de facturación: {len(reemplazados)} meses actualizados")
+
+    cubo_historial = FacturacionCube(historial.leer())
+    avisar(
+        f"🗄️ Historial de facturación: {len(cubo_historial.meses)} meses disponibles"
+    )
+    return cubo_historial
+
+
+@instrumentado()
+def consumo_por_fechas_corte(
+    tabla: pd.DataFrame,
+    claves: List[str],
+    fechas_corte: List,
+    meses_ventana: int = 12,
+) -> pd.DataFrame:
+    """
+    Motor vectorizado de consumo para una o varias fechas de corte a la vez,
+    sobre una tabla mensual del cubo (un registro por grupo y mes). Con sumas
+    acumuladas por grupo y búsquedas por mes (merge_asof) obtiene, para cada
+    grupo y mes de corte:
+    - consumo_actual: cantidad del mes de corte
+    - cantidad_historico, meses_historico, filas_historico, mes_min_historico
+      y mes_max_historico: meses anteriores al de corte
+    - total_ventana, meses_ventana y promedio_ventana: los `meses_ventana`
+      meses calendario que terminan en el mes de corte
+    - ultimo_mes/penultimo_mes (hasta el corte) con su cantidad e importe
+    Los grupos sin meses hasta el corte se omiten.
+    """
+    columnas = (
+        claves
+        + ["mes_corte", "consumo_actual"]
+        + ["cantidad_historico", "meses_historico", "filas_historico"]
+        + ["mes_min_historico", "mes_max_historico"]
+        + ["total_ventana", "meses_ventana", "promedio_ventana"]
+        + ["ultimo_mes", "cantidad_ultimo", "importe_ultimo"]
+        + ["penultimo_mes", "cantidad_penultimo", "importe_penultimo"]
+    )
+    base = tabla[tabla["mes"] > 0]
+    if base.empty or not fechas_corte:
+        return pd.DataFrame(columns=columnas)
+
+    # Acumulados por grupo en orden de mes (un registro por mes)
+    base = base.sort_values(claves + ["mes"])
+    grupos = base.groupby(claves, sort=False)
+    base = pd.DataFrame(
+        {
+            **{col: base[col] for col in claves},
+            "indice": indice_mes(base["mes"]).astype("int64"),
+            "mes": base["mes"],
+            "cantidad": base["cantidad"],
+            "importe": base["importe"],
+            "acum_cantidad": grupos["cantidad"].cumsum(),
+            "acum_meses": grupos.cumcount() + 1,
+            "acum_filas": grupos["filas"].cumsum(),
+            "mes_primero": grupos["mes"].transform("first"),
+            "mes_anterior": grupos["mes"].shift(),
+            "cantidad_anterior": grupos["cantidad"].shift(),
+            "importe_anterior": grupos["importe"].shift(),
+        }
+    ).sort_values("indice", kind="stable")
+
+    # Una consulta por grupo y mes de corte
+    cortes = sorted({mes_de_fecha(fecha) for fecha in fechas_corte})
+    consultas = (
+        base[claves]
+        .drop_duplicates()
+        .merge(pd.DataFrame({"mes_corte": cortes}), how="cross")
+    )
+    consultas["indice"] = indice_mes(consultas["mes_corte"]).astype("int64")
+    consultas = consultas.sort_values("indice", kind="stable").reset_index(drop=True)
+
+    def hasta(meses_atras: int) -> pd.DataFrame:
+        """Último registro de cada grupo con mes <= mes de corte - meses_atras."""
+        buscadas = consultas.assign(indice=consultas["indice"] - meses_atras)
+        return pd.merge_asof(
+            buscadas,
+            base,
+            on="indice",
+            by=claves,
+            direction="backward",
+        )
+
+    actual = hasta(0)
+    historico = hasta(1)
+    inicio_ventana = hasta(meses_ventana)
+
+    total_ventana = actual["acum_cantidad"] - inicio_ventana["acum_cantidad"].fillna(0)
+    meses_en_ventana = actual["acum_meses"] - inicio_ventana["acum_meses"].fillna(0)
+
+    resultado = pd.DataFrame(
+        {
+            **{col: consultas[col] for col in claves},
+            "mes_corte": consultas["mes_corte"],
+            "consumo_actual": actual["cantidad"]
+            .where(actual["mes"] == consultas["mes_corte"], 0)
+            .fillna(0),
+            "cantidad_historico": historico["acum_cantidad"],
+            "meses_historico": historico["acum_meses"],
+            "filas_historico": historico["acum_filas"],
+            "mes_min_historico": historico["mes_primero"],
+            "mes_max_historico": historico["mes"],
+            "total_ventana": total_ventana,
+            "meses_ventana": meses_en_ventana,
+            "promedio_ventana": (total_ventana / meses_en_ventana).where(
+                meses_en_ventana > 0, 0
+            ),
+            "ultimo_mes": actual["mes"],
+            "cantidad_ultimo": actual["cantidad"],
+            "importe_ultimo": actual["importe"],
+            "penultimo_mes": actual["mes_anterior"],
+            "cantidad_penultimo": actual["cantidad_anterior"],
+            "importe_penultimo": actual["importe_anterior"],
+        }
+    )
+    resultado = resultado[actual["mes"].notna()]
+    return resultado.sort_values(claves + ["mes_corte"]).reset_index(drop=True)
+
+
+@instrumentado()
+def generar_reporte_consumo(
+    df_facturacion: pd.DataFrame,
+    progreso: Optional[Progreso] = None,
+    cubo: Optional[FacturacionCube] = None,
+    fecha_corte=None,
+) -> pd.DataFrame:
+    """
+    Versión OPTIMIZADA del reporte de consumo con columna de consumo actual.
+    Modificación: Asegura que el último mes y penúltimo mes sean diferentes.
+
+    Se calcula sobre el cubo de facturación; si no se indica `cubo` se
+    construye a partir de `df_facturacion`. `fecha_corte` fija el mes actual
+    (por defecto el mes en curso): solo se consideran los meses hasta el corte,
+    de modo que el resultado es reproducible.
+    """
+    if cubo is None and (df_facturacion is None or df_facturacion.empty):
+        return pd.DataFrame()
+
+    # Reportar avance de la generación del reporte
+    reporte_progreso = ReporteProgreso(progreso, total=1.0, unidad=None)
+    reporte_progreso.fijar(0.0, "Preparando datos de facturación...")
+
+    # Agregados por mes (sin duplicados y solo filas válidas)
+    if cubo is None:
+        cubo = FacturacionCube.desde_facturacion(df_facturacion)
+
+    # Mes actual (de corte): los meses posteriores no se consideran
+    mes_actual = mes_de_fecha(fecha_corte)
+    df_mensual = cubo.cliente
+    if not df_mensual.empty:
+        df_mensual = df_mensual[df_mensual["mes"] <= mes_actual]
+
+    if df_mensual.empty:
+        reporte_progreso.finalizar()
+        return pd.DataFrame()
+
+    claves = CLAVE_CLIENTE
+    atributos = [col for col in ATRIBUTOS_CLIENTE if col in df_mensual.columns]
+
+    # Preparar datos para cálculos vectorizados
+    reporte_progreso.fijar(0.1, "Agrupando datos...")
+
+    # Obtener el último centro y mes de compra por destinatario - UNA SOLA VEZ
+    df_destinatario = cubo.destinatario[cubo.destinatario["mes"] <= mes_actual]
+    df_ultimo_centro = df_destinatario.sort_values(
+        "mes", ascending=False, kind="stable"
+    ).drop_duplicates("Destinatario")
+    df_ultimo_centro["Ultima_compra_cliente"] = texto_mes(
+        df_ultimo_centro["mes"]
+    ).where(df_ultimo_centro["mes"] > 0)
+    ultimo_centro_dict = df_ultimo_centro.set_index("Destinatario")["Centro"].to_dict()
+    ultima_compra_dict = df_ultimo_centro.set_index("Destinatario")[
+        "Ultima_compra_cliente"
+    ].to_dict()
+
+    # Consumo actual, histórico y últimos dos meses (motor por fecha de corte)
+    reporte_progreso.fijar(0.2, "Calculando estadísticas por material...")
+    df_consumo = consumo_por_fechas_corte(df_mensual, claves, [mes_actual])
+
+    # Calcular precios por grupo (usando todos los datos)
+    df_precios_grouped = (
+        df_mensual.groupby(claves)
+        .agg(
+            precio_min=("precio_min", "min"),
+            precio_max=("precio_max", "max"),
+            precio_suma=("precio_suma", "sum"),
+            precio_cuenta=("precio_cuenta", "sum"),
+        )
+        .reset_index()
+    )
+    df_precios_grouped["precio_prom"] = (
+        df_precios_grouped["precio_suma"] / df_precios_grouped["precio_cuenta"]
+    )
+    df_precios_grouped = df_precios_grouped.drop(
+        columns=["precio_suma", "precio_cuenta"]
+    )
+
+    # ============================================================
+    # MODIFICACIÓN CRÍTICA: Obtener últimos dos MESES distintos (no facturas)
+    # ============================================================
+    reporte_progreso.fijar(0.5, "Obteniendo últimos meses facturados...")
+
+    # Hay un solo registro por mes, así que el último y el penúltimo mes
+    # siempre son distintos
+    df_consumo = df_consumo.rename(
+        columns={
+            "cantidad_historico": "cantidad_total_historico",
+            "meses_historico": "meses_con_factura",
+            "filas_historico": "count_facturas",
+            "cantidad_ultimo": "Cantidad_mes_1",
+            "importe_ultimo": "Importe_mes_1",
+            "cantidad_penultimo": "Cantidad_mes_2",
+            "importe_penultimo": "Importe_mes_2",
+        }
+    )
+    df_consumo["MesAno_str_1"] = texto_mes(df_consumo["ultimo_mes"])
+    df_consumo["MesAno_str_2"] = texto_mes(df_consumo["penultimo_mes"])
+
+    # Calcular el precio unitario para el último y penúltimo mes
+    df_consumo["PrecioUnitario_1"] = np.where(
+        df_consumo["Cantidad_mes_1"] > 0,
+        df_consumo["Importe_mes_1"] / df_consumo["Cantidad_mes_1"],
+        0,
+    )
+    df_consumo["PrecioUnitario_2"] = np.where(
+        df_consumo["Cantidad_mes_2"] > 0,
+        df_consumo["Importe_mes_2"] / df_consumo["Cantidad_mes_2"],
+        0,
+    )
+
+    # Obtener datos básicos por grupo (del mes más reciente que los tenga)
+    reporte_progreso.fijar(0.7, "Preparando datos básicos...")
+
+    df_basicos = (
+        df_mensual.sort_values(claves + ["mes"], ascending=[True, True, True, False])
+        .groupby(claves)[atributos]
+        .first()
+        .reset_index()
+    )
+
+    # Combinar todos los datos
+    reporte_progreso.fijar(0.8, "Combinando datos...")
+
+    # Crear DataFrame base con todos los grupos únicos (en orden de aparición)
+    grupos_unicos = (
+        df_mensual.groupby(claves, as_index=False)["primera_fila"]
+        .min()
+        .sort_values("primera_fila", kind="stable")[claves]
+    )
+
+    # Combinar todos los datos usando merge
+    reporte_final = grupos_unicos
+
+    # Combinar con datos básicos
+    reporte_final = pd.merge(
+        reporte_final,
+        df_basicos,
+        on=claves,
+        how="left",
+    )
+
+    # Combinar con consumo histórico, actual y de los últimos meses
+    reporte_final = pd.merge(
+        reporte_final,
+        df_consumo,
+        on=claves,
+        how="left",
+    )
+
+    # Combinar con datos de precios
+    reporte_final = pd.merge(
+        reporte_final,
+        df_precios_grouped,
+        on=claves,
+        how="left",
+    )
+
+    # Agregar centro del último pedido
+    reporte_final["Centro"] = reporte_final["Destinatario"].map(ultimo_centro_dict)
+    reporte_final["Ultima_compra_cliente"] = reporte_final["Destinatario"].map(
+        ultima_compra_dict
+    )
+
+    # ============================================================
+    # MODIFICACIÓN: Agregar última facturación por Destinatario
+    # ============================================================
+    reporte_final["Ultima_facturacion_destinatario"] = reporte_final[
+        "Ultima_compra_cliente"
+    ]
+
+    # Calcular campos derivados (vectorizado)
+    reporte_progreso.fijar(0.9, "Calculando campos finales...")
+
+    # Calcular meses diferencia históricos
+    reporte_final["meses_diff_historico"] = (
+        reporte_final["mes_max_historico"] // 100
+        - reporte_final["mes_min_historico"] // 100
+    ) * 12 + (
+        reporte_final["mes_max_historico"] % 100
+        - reporte_final["mes_min_historico"] % 100
+    )
+
+    # Asegurar mínimo 1 mes
+    reporte_final["meses_diff_historico"] = reporte_final["meses_diff_historico"].clip(
+        lower=1
+    )
+
+    # Calcular consumo promedio mensual (solo histórico)
+    reporte_final["Consumo_promedio_mensual"] = (
+        (
+            reporte_final["cantidad_total_historico"]
+            / reporte_final["meses_diff_historico"]
+        )
+        .fillna(0)
+        .astype(int)
+    )
+
+    # Calcular tendencia (solo histórico)
+    reporte_final["Tendencia"] = (
+        (reporte_final["meses_diff_historico"] / reporte_final["meses_con_factura"])
+        .fillna(0)
+        .round(2)
+    )
+
+    # Calcular tendencia de cantidad (solo histórico)
+    reporte_final["Tendencia de cantidad"] = (
+        (reporte_final["cantidad_total_historico"] / reporte_final["count_facturas"])
+        .fillna(0)
+        .round(2)
+    )
+
+    # Formatear fechas
+    reporte_final["Ultimo mes facturacion"] = reporte_final["MesAno_str_1"]
+    reporte_final["Penultima_fecha"] = reporte_final["MesAno_str_2"]
+
+    # Renombrar columnas para el formato final
+    reporte_final = reporte_final.rename(
+        columns={
+            "consumo_actual": "Consumo_actual",
+            "Cantidad_mes_1": "Cantidad ultima",
+            "Importe_mes_1": "Importe ultima",
+            "PrecioUnitario_1": "Precio_unitario_ultima",
+            "Cantidad_mes_2": "Cantidad_penultima",
+            "Importe_mes_2": "Importe_penultima",
+            "PrecioUnitario_2": "Precio_unitario_penultima",
+        }
+    )
+
+    # Rellenar valores nulos
+    for col in [
+        "Consumo_actual",
+        "Cantidad ultima",
+        "Importe ultima",
+        "Cantidad_penultima",
+        "Importe_penultima",
+        "cantidad_total_historico",
+        "meses_con_factura",
+        "count_facturas",
+        "Precio_unitario_ultima",
+        "Precio_unitario_penultima",
+    ]:
+        if col in reporte_final.columns:
+            reporte_final[col] = reporte_final[col].fillna(0)
+
+    for col in [
+        "Ultimo mes facturacion",
+        "Penultima_fecha",
+        "Ultima_compra_cliente",
+        "Ultima_facturacion_destinatario",  # Nueva columna
+        "Razón Social",
+        "Texto Material",
+        "UM",
+        "Gpo. Vdor.",
+        "Grp. Cliente",
+        "Centro",
+    ]:
+        if col in reporte_final.columns:
+            reporte_final[col] = reporte_final[col].fillna("")
+
+    # Ordenar columnas según lo solicitado (agregando la nueva columna)
+    columnas_orden = [
+        "Centro",
+        "Grp. Cliente",
+        "Gpo. Vdor.",
+        "Solicitante",
+        "Destinatario",
+        "Razón Social",
+        "Material",
+        "Texto Material",
+        "Ultima_compra_cliente",
+        "Ultima_facturacion_destinatario",  # Nueva columna
+        "Consumo_promedio_mensual",
+        "Consumo_actual",
+        "UM",
+        "Tendencia",
+        "Tendencia de cantidad",
+        "Ultimo mes facturacion",
+        "Cantidad ultima",
+        "Importe ultima",
+        "Precio_unitario_ultima",
+        "Penultima_fecha",
+        "Cantidad_penultima",
+        "Importe_penultima",
+        "Precio_unitario_penultima",
+        "precio_min",
+        "precio_max",
+        "precio_prom",
+    ]
+
+    # Crear columnas que puedan faltar
+    for col in columnas_orden:
+        if col not in reporte_final.columns:
+            if col in [
+                "Centro",
+                "Grp. Cliente",
+                "Gpo. Vdor.",
+                "Solicitante",
+                "Destinatario",
+                "Razón Social",
+                "Material",
+                "Texto Material",
+                "UM",
+                "Ultima_facturacion_destinatario",
+                "Ultima_compra_cliente",
+            ]:
+                reporte_final[col] = ""
+            elif col == "Consumo_actual":
+                reporte_final[col] = 0
+            else:
+                reporte_final[col] = 0
+
+    reporte_progreso.finalizar()
+
+    return reporte_final[columnas_orden]
+
+
+# =========================
+# MODIFICAR: Función obtener_disponible_por_fuente para manejar lotes específicos
+# =========================
+@instrumentado()
+def obtener_disponible_por_fuente(
+    fuente: str,
+    material: str,
+    centro: str,
+    almacen: str,
+    df_fuente: pd.DataFrame,
+    inventario_df: pd.DataFrame,
+    almacenes: List[str],
+    lote: str = "",
+) -> float:
+    """
+    Obtiene la cantidad disponible según el tipo de fuente y lote específico.
+    `almacenes` son los almacenes de inventario por centro (Lento mov y
+    Sustituto).
+    """
+
+    if fuente == "Corta caducidad":
+        # NOTA: El inventario general no tiene información de lote, así que usamos el valor de la hoja externa
+        # que ya tiene la cantidad por lote en "CantidadDisp". No depende del
+        # inventario: los pedidos reciben solo las filas de su material, que
+        # pueden no existir aunque el material esté en Corta caducidad.
+        if df_fuente is None or df_fuente.empty:
+            return 0.0
+
+        # Filtrar por material, centro, almacén y lote específico
+        filtro = (
+            (df_fuente["Material"] == material)
+            & (df_fuente["Centro"] == centro)
+            & (df_fuente["Almacén"] == almacen)
+            & (df_fuente["Lote"] == lote)
+        )
+
+        disponible = df_fuente[filtro]["CantidadDisp"].sum()
+        return float(disponible)
+
+    elif fuente in ["Cosmopark", "PNC", "Caduco"]:
+        # Para Cosmopark y PNC: usar "CantidadDisp" de la hoja externa por lote específico
+        if df_fuente is None or df_fuente.empty:
+            return 0.0
+
+        # Filtrar por material, centro, almacén y lote específico
+        filtro = (
+            (df_fuente["Material"] == material)
+            & (df_fuente["Centro"] == centro)
+            & (df_fuente["Almacén"] == almacen)
+        )
+
+        # Si hay lote, agregar filtro por lote
+        if lote:
+            filtro = filtro & (df_fuente["Lote"] == lote)
+
+        disponible = df_fuente[filtro]["CantidadDisp"].sum()
+        return float(disponible)
+
+    elif fuente in ["Lento mov", "Sustituto"]:
+        # Para Lento mov y Sustituto: usar inventario filtrado por almacenes (sin lote específico)
+        inventario_filtrado = get_inventory_by_all_centers_filtered(
+            inventario_df, material, almacenes
+        )
+        return sum(inventario_filtrado.values())
+
+    else:
+        return 0.0
+
+
+# =========================
+# Función para obtener inventario total de todos los centros
+# =========================
+@instrumentado()
+def get_inventory_by_all_centers(
+    inventario_df: pd.DataFrame, material: str
+) -> Dict[str, float]:
+    """Obtiene el inventario de un material en todos los centros disponibles."""
+    if inventario_df is None or inventario_df.empty:
+        return {}
+
+    try:
+        df_material = inventario_df[inventario_df["Material"] == material]
+        if df_material.empty:
+            return {}
+
+        inventory_by_center = (
+            df_material.groupby("Centro")["Libre Utilización"].sum().to_dict()
+        )
+        return {str(center): float(qty) for center, qty in inventory_by_center.items()}
+    except Exception as e:
+        logger.error(f"Error en get_inventory_by_all_centers: {str(e)}")
+        return {}
+
+
+# =========================
+# Nueva función: Obtener inventario por centro solo para los almacenes de
+# inventario por centro (1030/1031/1060 por defecto, ver CentrosAlmacenes)
+# =========================
+@instrumentado()
+def get_inventory_by_all_centers_filtered(
+    inventario_df: pd.DataFrame,
+    material: str,
+    almacenes: List[str],
+) -> Dict[str, float]:
+    """Obtiene el inventario de un material en todos los centros, sumando solo los almacenes de inventario por centro."""
+    if inventario_df is None or inventario_df.empty:
+        return {}
+
+    try:
+        # Filtrar por material y almacenes de inventario por centro
+        df_material = inventario_df[
+            (inventario_df["Material"] == material)
+            & (inventario_df["Almacén"].isin(almacenes))
+        ]
+
+        if df_material.empty:
+            return {}
+
+        # Agrupar por centro y sumar el inventario disponible
+        inventory_by_center = (
+            df_material.groupby("Centro")["Libre Utilización"].sum().to_dict()
+        )
+        return {str(center): float(qty) for center, qty in inventory_by_center.items()}
+    except Exception as e:
+        logger.error(f"Error en get_inventory_by_all_centers_filtered: {str(e)}")
+        return {}
+
+
+# =========================
+# Campos derivados de los pedidos
+# =========================
+# Estado de bloqueo, cantidades numéricas e IDs sin espacios de cada línea de
+# pedido. Se calculan una sola vez para todos los pedidos con operaciones
+# vectorizadas y los constructores de líneas solo los leen.
+CAMPOS_DERIVADOS_PEDIDO = [
+    "_centro",
+    "_material",
+    "_almacen",
+    "_pendiente",
+    "_precio",
+    "_bloqueado",
+]
+
+
+def _texto_pedido(pedidos_df: pd.DataFrame, columna: str) -> pd.Series:
+    """Texto de una columna del pedido ("" si no existe), como str(valor)."""
+    if columna not in pedidos_df.columns:
+        return pd.Series("", index=pedidos_df.index, dtype=object)
+    return pedidos_df[columna].astype(str)
+
+
+@instrumentado()
+def derivar_campos_pedidos(pedidos_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Campos derivados (CAMPOS_DERIVADOS_PEDIDO) de cada línea de pedido, con el
+    mismo índice que `pedidos_df`:
+    - _centro, _material, _almacen: IDs como texto sin espacios
+    - _pendiente: Pendiente como número (0 si no hay columna)
+    - _precio: Precio como número (se conserva el valor si no es numérico)
+    - _bloqueado: "Crédito" (Sts. Créd. = B), "Detenido" (con Bloqueo Ent.)
+      o "Detenido por ambos"
+    """
+    indice = pedidos_df.index
+
+    if "Pendiente" in pedidos_df.columns:
+        pendiente = pd.to_numeric(pedidos_df["Pendiente"], errors="coerce").astype(
+            float
+        )
+    else:
+        pendiente = pd.Series(0.0, index=indice)
+
+    if "Precio" in pedidos_df.columns:
+        precio_original = pedidos_df["Precio"]
+        precio = pd.to_numeric(precio_original, errors="coerce")
+        precio = precio.where(precio.notna() | precio_original.isna(), precio_original)
+    else:
+        precio = pd.Series(0, index=indice)
+
+    credito = pd.Series(False, index=indice)
+    if "Sts. Créd." in pedidos_df.columns:
+        credito = _texto_pedido(pedidos_df, "Sts. Créd.").str.strip() == "B"
+    detenido = pd.Series(False, index=indice)
+    if "Bloqueo Ent." in pedidos_df.columns:
+        detenido = (
+            ~_texto_pedido(pedidos_df, "Bloqueo Ent.").str.strip().isin(["", "nan"])
+        )
+    bloqueado = np.select(
+        [credito & detenido, credito, detenido],
+        ["Detenido por ambos", "Crédito", "Detenido"],
+        default="",
+    ).astype(object)
+
+    return pd.DataFrame(
+        {
+            "_centro": _texto_pedido(pedidos_df, "Centro").str.strip(),
+            "_material": _texto_pedido(pedidos_df, "Material").str.strip(),
+            "_almacen": _texto_pedido(pedidos_df, "Almacén").str.strip(),
+            "_pendiente": pendiente,
+            "_precio": precio,
+            "_bloqueado": bloqueado,
+        },
+        index=indice,
+    )
+
+
+def con_campos_derivados(pedidos_df: pd.DataFrame) -> pd.DataFrame:
+    """Copia superficial de los pedidos con los campos derivados agregados."""
+    derivados = derivar_campos_pedidos(pedidos_df)
+    pedidos_df = pedidos_df.copy(deep=False)
+    for col in CAMPOS_DERIVADOS_PEDIDO:
+        pedidos_df[col] = derivados[col]
+    return pedidos_df
+
+
+def campos_pedido(pedido: pd.Series) -> Dict[str, object]:
+    """
+    Campos derivados de una línea de pedido: los precalculados por
+    con_campos_derivados o, si el pedido no los trae, calculados al momento.
+    """
+    if "_bloqueado" in pedido.index:
+        return {col: pedido[col] for col in CAMPOS_DERIVADOS_PEDIDO}
+    return derivar_campos_pedidos(pedido.to_frame().T).iloc[0].to_dict()
+
+
+# =========================
+# Modelo compacto de sugerencias: pedidos, inventario y candidatos
+# =========================
+# Cada línea de "Todas las Sugerencias" repite los campos de su línea de pedido
+# y el inventario del material en el centro del pedido. El motor guarda por
+# separado:
+#   - pedidos: una fila por línea de pedido (COLUMNAS_SALIDA_PEDIDO)
+#   - inventario: una fila por (Centro, Material) (columnas_inventario() de
+#     CentrosAlmacenes)
+#   - candidatos: solo los campos de la fuente (COLUMNAS_SALIDA_CANDIDATO) y la
+#     posición de su pedido
+# y arma el formato ancho solo al mostrar o exportar.
+COLUMNAS_SALIDA_PEDIDO = [
+    Columnas.GRUPO_CLIENTE,
+    Columnas.FECHA,
+    Columnas.PEDIDO,
+    Columnas.GRUPO_VENDEDOR,
+    Columnas.SOLICITANTE,
+    Columnas.DESTINATARIO,
+    Columnas.RAZON_SOCIAL,
+    Columnas.CENTRO_PEDIDO,
+    Columnas.ALMACEN,
+    Columnas.MATERIAL_SOLICITADO,
+    Columnas.MATERIAL_BASE,
+    Columnas.DESCRIPCION_SOLICITADA,
+    Columnas.CANTIDAD_PEDIDO,
+    Columnas.CANTIDAD_PENDIENTE,
+    Columnas.PRECIO,
+    Columnas.CENTRO_INV,
+    Columnas.BLOQUEADO,
+]
+
+COLUMNAS_SALIDA_CANDIDATO = [
+    Columnas.CANTIDAD_OFERTAR,
+    Columnas.FUENTE,
+    Columnas.MATERIAL_SUGERIDO,
+    Columnas.DESCRIPCION_SUGERIDA,
+    Columnas.CENTRO_SUGERIDO,
+    Columnas.ALMACEN_SUGERIDO,
+    Columnas.DISPONIBLE,
+    Columnas.LOTE,
+    Columnas.FECHA_CADUCIDAD,
+]
+
+CATEGORIAS_CANDIDATO = [
+    Columnas.FUENTE,
+    Columnas.CENTRO_SUGERIDO,
+    Columnas.ALMACEN_SUGERIDO,
+]
+
+
+def columnas_sugerencias(centros: CentrosAlmacenes) -> List[str]:
+    """Orden de columnas de "Todas las Sugerencias"."""
+    return (
+        [
+            Columnas.GRUPO_CLIENTE,
+            Columnas.FECHA,
+            Columnas.PEDIDO,
+            Columnas.GRUPO_VENDEDOR,
+            Columnas.SOLICITANTE,
+            Columnas.DESTINATARIO,
+            Columnas.RAZON_SOCIAL,
+            Columnas.CENTRO_PEDIDO,
+            Columnas.ALMACEN,
+            Columnas.MATERIAL_SOLICITADO,
+            Columnas.MATERIAL_BASE,
+            Columnas.DESCRIPCION_SOLICITADA,
+            Columnas.CANTIDAD_PEDIDO,
+            Columnas.CANTIDAD_PENDIENTE,
+            Columnas.CANTIDAD_OFERTAR,
+            Columnas.PRECIO,
+            Columnas.FUENTE,
+            Columnas.MATERIAL_SUGERIDO,
+            Columnas.DESCRIPCION_SUGERIDA,
+            Columnas.CENTRO_SUGERIDO,
+            Columnas.ALMACEN_SUGERIDO,
+            Columnas.DISPONIBLE,
+            Columnas.LOTE,
+            Columnas.FECHA_CADUCIDAD,
+            Columnas.CENTRO_INV,
+        ]
+        + centros.columnas_inventario()
+        + [Columnas.BLOQUEADO]
+    )
+
+
+@instrumentado()
+def crear_candidato(
+    campos: Dict[str, object],
+    material_sugerido: str,
+    fuente: str,
+    centro_sugerido: str,
+    almacen_sugerido: str,
+    disponible: float,
+    lote: str = "",
+    fecha_caducidad=pd.NaT,
+    descripcion_sugerida: str = "",
+) -> Dict:
+    """
+    Campos propios de una sugerencia (COLUMNAS_SALIDA_CANDIDATO) para el
+    pedido con `campos` (ver campos_pedido). El inventario se toma del
+    material sugerido en el centro del pedido al armar el formato ancho.
+    """
+    # Calcular cantidad a ofertar (mínimo entre pendiente y disponible)
+    cantidad_pendiente = campos["_pendiente"]
+    cantidad_ofertar = (
+        min(cantidad_pendiente, disponible) if cantidad_pendiente > 0 else 0
+    )
+
+    return {
+        Columnas.CANTIDAD_OFERTAR: cantidad_ofertar,
+        Columnas.FUENTE: fuente,
+        Columnas.MATERIAL_SUGERIDO: material_sugerido,
+        Columnas.DESCRIPCION_SUGERIDA: descripcion_sugerida,
+        Columnas.CENTRO_SUGERIDO: centro_sugerido,
+        Columnas.ALMACEN_SUGERIDO: almacen_sugerido,
+        Columnas.DISPONIBLE: disponible,
+        Columnas.LOTE: lote,
+        # Fecha de caducidad como Timestamp (ya viene normalizada de la hoja externa)
+        Columnas.FECHA_CADUCIDAD: fecha_escalar(fecha_caducidad),
+    }
+
+
+def tabla_pedidos_salida(pedidos_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Campos de salida de cada línea de pedido (COLUMNAS_SALIDA_PEDIDO), con
+    índice por posición. `pedidos_df` debe traer los campos de
+    con_campos_derivados.
+    """
+
+    def original(columna: str) -> pd.Series:
+        if columna in pedidos_df.columns:
+            return pedidos_df[columna]
+        return pd.Series("", index=pedidos_df.index, dtype=object)
+
+    tabla = pd.DataFrame(
+        {
+            Columnas.GRUPO_CLIENTE: original("Gpo. Cte.").astype(str).str.strip(),
+            Columnas.FECHA: original("Fecha"),
+            Columnas.PEDIDO: original("Pedido"),
+            Columnas.GRUPO_VENDEDOR: original("Gpo.Vdor."),
+            Columnas.SOLICITANTE: original("Solicitante"),
+            Columnas.DESTINATARIO: original("Destinatario"),
+            Columnas.RAZON_SOCIAL: original("Razón Social").astype(str),
+            Columnas.CENTRO_PEDIDO: pedidos_df["_centro"],
+            Columnas.ALMACEN: pedidos_df["_almacen"],
+            Columnas.MATERIAL_SOLICITADO: pedidos_df["_material"],
+            Columnas.MATERIAL_BASE: pedidos_df["_material"],
+            Columnas.DESCRIPCION_SOLICITADA: original("Texto Material").astype(str),
+            Columnas.CANTIDAD_PEDIDO: original("Cantidad"),
+            Columnas.CANTIDAD_PENDIENTE: pedidos_df["_pendiente"],
+            Columnas.PRECIO: pedidos_df["_precio"],
+            Columnas.CENTRO_INV: pedidos_df["_centro"],
+            Columnas.BLOQUEADO: pedidos_df["_bloqueado"],
+        },
+        index=pedidos_df.index,
+    )
+    return tabla.reset_index(drop=True)
+
+
+@instrumentado()
+def instantanea_inventario(
+    inventario_df: pd.DataFrame,
+    pares: pd.MultiIndex,
+    centros: Optional[CentrosAlmacenes] = None,
+) -> pd.DataFrame:
+    """
+    Columnas de inventario (columnas_inventario() de `centros`) de cada par
+    (Centro, Material) de `pares`, con una sola tabla dinámica del inventario
+    por Centro/Material/Almacén:
+    - Inv y tránsito por almacén: el material en el centro (0 si el centro no
+      tiene filas del material)
+    - Disponible: el material en el centro de disponible, por almacén
+    - Inv por centro: el material por centro en los almacenes de inventario
+      por centro
+    """
+    centros = centros or CentrosAlmacenes.desde_entorno()
+    pares = pares.unique()
+
+    def ceros(valor=0) -> pd.Series:
+        return pd.Series(valor, index=pares, dtype=object)
+
+    inv_almacen = {almacen: ceros() for almacen in centros.almacenes}
+    transito = {almacen: ceros(0.0) for almacen in centros.almacenes}
+    disponible = {almacen: ceros() for almacen in centros.almacenes_disponible}
+    inv_centro = {centro: ceros() for centro in centros.centros}
+
+    # Solo las filas de los materiales buscados
+    inventario = None
+    if inventario_df is not None and not inventario_df.empty:
+        disponible = {almacen: ceros(0.0) for almacen in disponible}
+        materiales = pares.get_level_values(1).unique().tolist()
+        inventario = filas_por_material(
+            inventario_df, _indice_material(inventario_df), materiales
+        )
+
+    if inventario is not None and not inventario.empty:
+        por_almacen = inventario.pivot_table(
+            index=["Centro", "Material"],
+            columns="Almacén",
+            values=["Libre Utilización", "Cant. en Tránsito"],
+            aggfunc="sum",
+            fill_value=0.0,
+        )
+
+        def por_par(pares_buscados: pd.MultiIndex, columna: str, almacen: str):
+            """Suma por par y almacén (0.0 si no hay filas)."""
+            if (columna, almacen) not in por_almacen.columns:
+                return np.zeros(len(pares_buscados))
+            valores = por_almacen[(columna, almacen)].reindex(pares_buscados)
+            return valores.fillna(0.0).to_numpy(dtype=float)
+
+        # Pares con filas en el inventario: sumas por almacén (aunque sean 0)
+        con_filas = pares.isin(por_almacen.index)
+        for almacen in centros.almacenes:
+            inv_almacen[almacen] = inv_almacen[almacen].mask(
+                con_filas, por_par(pares, "Libre Utilización", almacen)
+            )
+            transito[almacen] = transito[almacen].mask(
+                con_filas, por_par(pares, "Cant. en Tránsito", almacen)
+            )
+
+        pares_disponible = pd.MultiIndex.from_arrays(
+            [[centros.centro_disponible] * len(pares), pares.get_level_values(1)]
+        )
+        for almacen in disponible:
+            disponible[almacen] = pd.Series(
+                por_par(pares_disponible, "Libre Utilización", almacen),
+                index=pares,
+                dtype=object,
+            )
+
+        por_centro = (
+            inventario[inventario["Almacén"].isin(centros.almacenes_inv_centro)]
+            .groupby(["Material", "Centro"])["Libre Utilización"]
+            .sum()
+            .unstack()
+            .reindex(pares.get_level_values(1))
+        )
+        for centro in centros.centros:
+            if centro in por_centro.columns:
+                valores = por_centro[centro].to_numpy()
+                inv_centro[centro] = pd.Series(
+                    valores, index=pares, dtype=object
+                ).where(~np.isnan(valores), 0)
+
+    transito_total = sum(transito.values(), ceros(0.0))
+
+    return pd.DataFrame(
+        dict(
+            zip(
+                centros.columnas_inventario(),
+                list(inv_almacen.values())
+                + [transito_total]
+                + list(transito.values())
+                + list(disponible.values())
+                + list(inv_centro.values()),
+            )
+        ),
+        index=pares,
+    ).infer_objects()
+
+
+class SugerenciasCompactas:
+    """
+    "Todas las Sugerencias" sin repetir datos (ver COLUMNAS_SALIDA_PEDIDO):
+    `pedidos` (una fila por línea de pedido), `inventario` (una fila por
+    Centro/Material) y `candidatos` (campos de la fuente y "_pedido", la
+    posición de su línea de pedido). Cada línea de pedido lleva en el formato
+    ancho su línea sin sugerencia seguida de sus candidatos. `centros` define
+    las columnas de inventario.
+    """
+
+    def __init__(
+        self,
+        pedidos: pd.DataFrame,
+        inventario: pd.DataFrame,
+        candidatos: pd.DataFrame,
+        centros: Optional[CentrosAlmacenes] = None,
+    ):
+        self.pedidos = pedidos
+        self.inventario = inventario
+        self.candidatos = candidatos
+        self.centros = centros or CentrosAlmacenes.desde_entorno()
+
+    @classmethod
+    def desde_candidatos(
+        cls,
+        pedidos_df: pd.DataFrame,
+        candidatos_por_pedido: List[List[Dict]],
+        inventario_df: pd.DataFrame,
+        centros: Optional[CentrosAlmacenes] = None,
+    ) -> "SugerenciasCompactas":
+        """
+        Construye el modelo con los pedidos (con o sin campos derivados), los
+        candidatos de cada uno (en el orden de los pedidos) y el inventario.
+        """
+        if "_bloqueado" not in pedidos_df.columns:
+            pedidos_df = con_campos_derivados(pedidos_df)
+        pedidos = tabla_pedidos_salida(pedidos_df)
+
+        cantidades = np.array([len(c) for c in candidatos_por_pedido], dtype=int)
+        candidatos = pd.DataFrame.from_records(
+            [linea for lineas in candidatos_por_pedido for linea in lineas],
+            columns=COLUMNAS_SALIDA_CANDIDATO,
+        )
+        candidatos.insert(0, "_pedido", np.repeat(np.arange(len(pedidos)), cantidades))
+        # Pocos valores distintos: como categorías
+        for columna in CATEGORIAS_CANDIDATO:
+            candidatos[columna] = candidatos[columna].astype("category")
+
+        # Inventario del material sugerido (o del solicitado, en la línea sin
+        # sugerencia) en el centro del pedido
+        pares = pd.MultiIndex.from_arrays(
+            [
+                np.concatenate(
+                    [
+                        pedidos[Columnas.CENTRO_PEDIDO].to_numpy(),
+                        pedidos[Columnas.CENTRO_PEDIDO].to_numpy()[
+                            candidatos["_pedido"].to_numpy()
+                        ],
+                    ]
+                ),
+                np.concatenate(
+                    [
+                        pedidos[Columnas.MATERIAL_SOLICITADO].to_numpy(),
+                        candidatos[Columnas.MATERIAL_SUGERIDO].to_numpy(),
+                    ]
+                ),
+            ]
+        )
+        centros = centros or CentrosAlmacenes.desde_entorno()
+        return cls(
+            pedidos,
+            instantanea_inventario(inventario_df, pares, centros),
+            candidatos,
+            centros,
+        )
+
+    def __len__(self) -> int:
+        """Filas del formato ancho."""
+        return len(self.pedidos) + len(self.candidatos)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.pedidos) == 0
+
+    def lineas_por_pedido(self) -> np.ndarray:
+        """Filas del formato ancho de cada pedido (su línea sin sugerencia y sus candidatos)."""
+        return 1 + np.bincount(
+            self.candidatos["_pedido"].to_numpy(), minlength=len(self.pedidos)
+        )
+
+    def lineas_sin_sugerencia(self) -> pd.DataFrame:
+        """
+        Campos de pedido de las líneas sin sugerencia (Fuente vacía), las que
+        usa el resumen, sin armar el formato ancho.
+        """
+        return self.pedidos.assign(**{Columnas.FUENTE: ""})
+
+    def memoria(self) -> int:
+        """Bytes ocupados por las tres tablas."""
+        return int(
+            sum(
+                df.memory_usage(deep=True).sum()
+                for df in (self.pedidos, self.inventario, self.candidatos)
+            )
+        )
+
+    @instrumentado()
+    def a_formato_ancho(self) -> pd.DataFrame:
+        """Une las tres tablas en el formato de "Todas las Sugerencias"."""
+        total_pedidos = len(self.pedidos)
+        if total_pedidos == 0:
+            return pd.DataFrame()
+
+        # Posición de cada fila en el resultado: la línea sin sugerencia del
+        # pedido y a continuación sus candidatos, en su orden
+        por_pedido = self.candidatos["_pedido"].to_numpy()
+        cantidades = np.bincount(por_pedido, minlength=total_pedidos)
+        inicio = np.arange(total_pedidos) + np.concatenate(
+            [[0], np.cumsum(cantidades)[:-1]]
+        )
+        orden_en_pedido = self.candidatos.groupby("_pedido").cumcount().to_numpy()
+        destinos = np.concatenate([inicio, inicio[por_pedido] + 1 + orden_en_pedido])
+        origen = np.empty(len(destinos), dtype=int)
+        origen[destinos] = np.arange(len(destinos))
+
+        sin_sugerencia = pd.DataFrame(
+            {
+                Columnas.CANTIDAD_OFERTAR: 0,
+                Columnas.FUENTE: "",
+                Columnas.MATERIAL_SUGERIDO: "",
+                Columnas.DESCRIPCION_SUGERIDA: "",
+                Columnas.CENTRO_SUGERIDO: "",
+                Columnas.ALMACEN_SUGERIDO: "",
+                Columnas.DISPONIBLE: 0,
+                Columnas.LOTE: "",
+                Columnas.FECHA_CADUCIDAD: pd.NaT,
+            },
+            index=range(total_pedidos),
+        )
+        candidatos = self.candidatos[COLUMNAS_SALIDA_CANDIDATO].astype(
+            {columna: object for columna in CATEGORIAS_CANDIDATO}
+        )
+        fuentes = pd.concat([sin_sugerencia, candidatos], ignore_index=True).take(
+            origen
+        )
+
+        posiciones = np.concatenate([np.arange(total_pedidos), por_pedido])[origen]
+        pedidos = self.pedidos.take(posiciones)
+        materiales_inventario = fuentes[Columnas.MATERIAL_SUGERIDO].where(
+            fuentes[Columnas.FUENTE] != "",
+            pedidos[Columnas.MATERIAL_SOLICITADO].to_numpy(),
+        )
+        inventario = self.inventario.reindex(
+            pd.MultiIndex.from_arrays(
+                [pedidos[Columnas.CENTRO_PEDIDO], materiales_inventario]
+            )
+        )
+
+        resultado = pd.concat(
+            [
+                pedidos.reset_index(drop=True),
+                fuentes.reset_index(drop=True),
+                inventario.reset_index(drop=True),
+            ],
+            axis=1,
+        )
+        return resultado[columnas_sugerencias(self.centros)].infer_objects()
+
+
+def formato_ancho(reporte) -> pd.DataFrame:
+    """El reporte como DataFrame (arma el formato ancho de SugerenciasCompactas)."""
+    if isinstance(reporte, SugerenciasCompactas):
+        return reporte.a_formato_ancho()
+    return reporte
+
+
+def lineas_sin_sugerencia(reporte) -> pd.DataFrame:
+    """
+    Líneas sin sugerencia de "Todas las Sugerencias" (formato ancho o
+    SugerenciasCompactas, sin armar su formato ancho).
+    """
+    if isinstance(reporte, SugerenciasCompactas):
+        return reporte.lineas_sin_sugerencia()
+    if reporte is None or reporte.empty:
+        return reporte
+    return reporte[reporte[Columnas.FUENTE] == ""]
+
+
+# =========================
+# Fragmentos de sugerencias por fuente
+# =========================
+# Las sugerencias de un pedido se arman con fragmentos que no dependen de qué
+# fuentes están activas, identificados por la etiqueta de la columna Fuente
+# (cada sugerencia es un candidato, ver crear_candidato):
+#   "PNC", "Caduco"... -> coincidencias de una fuente simple
+#   "Sustituto/PNC"    -> coincidencias del sustituto en otra fuente (por sustituto)
+#   "Sustituto"        -> línea del sustituto solo (por sustituto)
+#   "Lento mov/PNC"    -> coincidencias del material en otra fuente
+#   "Lento mov"        -> línea de Lento mov sola (None si no está en Lento mov)
+# Cambiar las fuentes activas solo cambia qué fragmentos se combinan.
+FUENTES_COMBINABLES = ["Sustituto", "Lento mov"]
+
+
+def _fuente_utilizable(hojas_externas: Dict[str, pd.DataFrame], fuente: str) -> bool:
+    """La fuente existe, tiene columna 'Material' y no está vacía."""
+    if fuente not in hojas_externas:
+        return False
+    df_fuente = hojas_externas[fuente]
+    # VERIFICACIÓN DE SEGURIDAD: Asegurar que la columna Material existe
+    if "Material" not in df_fuente.columns:
+        logger.warning(f"La hoja '{fuente}' no tiene columna 'Material'. Se omitirá.")
+        return False
+    return not df_fuente.empty
+
+
+def claves_fragmentos(
+    hojas_externas: Dict[str, pd.DataFrame], fuentes_activas: List[str]
+) -> List[str]:
+    """Fragmentos necesarios para armar las sugerencias con las fuentes activas."""
+    claves = []
+    simples = [f for f in fuentes_activas if f not in FUENTES_COMBINABLES]
+    for fuente in fuentes_activas:
+        if not _fuente_utilizable(hojas_externas, fuente):
+            continue
+        claves.append(fuente)
+        if fuente in FUENTES_COMBINABLES:
+            claves += [f"{fuente}/{otra}" for otra in simples if otra in hojas_externas]
+    return claves
+
+
+def _sustitutos_de(df_sustituto: pd.DataFrame, material: str) -> List[tuple]:
+    """(material sustituto, descripción) de cada fila de Sustituto del material."""
+    sustitutos = []
+    for _, sustituto_row in df_sustituto[
+        df_sustituto["Material"] == material
+    ].iterrows():
+        material_sustituto = str(sustituto_row.get("Material sustituto", "")).strip()
+        if not material_sustituto:
+            continue
+        sustitutos.append(
+            (
+                material_sustituto,
+                str(sustituto_row.get("Texto material sustituto", "")),
+            )
+        )
+    return sustitutos
+
+
+@instrumentado()
+def lineas_fuente_simple(
+    pedido: pd.Series,
+    material_solicitado: str,
+    fuente: str,
+    df_fuente: pd.DataFrame,
+    inventario_df: pd.DataFrame,
+    almacenes: List[str],
+) -> List[Dict]:
+    """Líneas de una fuente simple (Corta caducidad, Cosmopark, PNC, Caduco)."""
+    sugerencias = []
+    campos = campos_pedido(pedido)
+    coincidencias = df_fuente[df_fuente["Material"] == material_solicitado]
+
+    for _, coincidencia in coincidencias.iterrows():
+        centro = str(coincidencia.get("Centro", "")).strip()
+        almacen = str(coincidencia.get("Almacén", "")).strip()
+        lote = str(coincidencia.get("Lote", "")).strip()
+        fecha_cad = coincidencia.get("FechaCaducidad", pd.NaT)
+
+        # Usar la nueva función para calcular el disponible según la fuente y lote específico
+        disponible_fuente = obtener_disponible_por_fuente(
+            fuente=fuente,
+            material=material_solicitado,
+            centro=centro,
+            almacen=almacen,
+            df_fuente=df_fuente,
+            inventario_df=inventario_df,
+            almacenes=almacenes,
+            lote=lote,  # Pasamos el lote específico
+        )
+
+        linea = crear_candidato(
+            campos,
+            material_sugerido=material_solicitado,
+            fuente=fuente,
+            centro_sugerido=centro,
+            almacen_sugerido=almacen,
+            disponible=disponible_fuente,
+            lote=lote,
+            fecha_caducidad=fecha_cad,
+        )
+        sugerencias.append(linea)
+
+    return sugerencias
+
+
+@instrumentado()
+def lineas_combinadas(
+    pedido: pd.Series,
+    fuente_combinada: str,
+    material_sugerido: str,
+    otra_fuente: str,
+    df_otra: pd.DataFrame,
+    inventario_df: pd.DataFrame,
+    almacenes: List[str],
+    descripcion_sugerida: str = "",
+) -> List[Dict]:
+    """Líneas 'Sustituto/<otra>' o 'Lento mov/<otra>': una por coincidencia en la otra fuente."""
+    sugerencias = []
+    campos = campos_pedido(pedido)
+    coincidencias = df_otra[df_otra["Material"] == material_sugerido]
+
+    # Crear una línea por cada coincidencia en esta otra fuente
+    for _, coincidencia in coincidencias.iterrows():
+        # Obtener detalles de la coincidencia
+        centro = str(coincidencia.get("Centro", "")).strip()
+        almacen = str(coincidencia.get("Almacén", "")).strip()
+        lote = str(coincidencia.get("Lote", "")).strip()
+        fecha_cad = coincidencia.get("FechaCaducidad", pd.NaT)
+
+        # Calcular disponible según el tipo de fuente combinada
+        disponible_fuente = obtener_disponible_por_fuente(
+            fuente=otra_fuente,
+            material=material_sugerido,
+            centro=centro,
+            almacen=almacen,
+            df_fuente=df_otra,
+            inventario_df=inventario_df,
+            almacenes=almacenes,
+            lote=lote,  # Pasamos el lote específico
+        )
+
+        linea = crear_candidato(
+            campos,
+            material_sugerido=material_sugerido,
+            fuente=fuente_combinada,
+            centro_sugerido=centro,
+            almacen_sugerido=almacen,
+            disponible=disponible_fuente,
+            lote=lote,
+            fecha_caducidad=fecha_cad,
+            descripcion_sugerida=descripcion_sugerida,
+        )
+        sugerencias.append(linea)
+
+    return sugerencias
+
+
+def linea_combinable_sola(
+    pedido: pd.Series,
+    fuente: str,
+    material_sugerido: str,
+    inventario_df: pd.DataFrame,
+    almacenes: List[str],
+    descripcion_sugerida: str = "",
+) -> Dict:
+    """Línea 'Sustituto' o 'Lento mov' cuando no hay coincidencia en otra fuente."""
+    # Usar inventario filtrado por los almacenes de inventario por centro
+    inventario_filtrado = get_inventory_by_all_centers_filtered(
+        inventario_df, material_sugerido, almacenes
+    )
+    disponible_fuente = sum(inventario_filtrado.values())
+
+    return crear_candidato(
+        campos_pedido(pedido),
+        material_sugerido=material_sugerido,
+        fuente=fuente,
+        centro_sugerido="",
+        almacen_sugerido="",
+        disponible=disponible_fuente,
+        descripcion_sugerida=descripcion_sugerida,
+    )
+
+
+@instrumentado()
+def calcular_fragmentos_pedido(
+    pedido: pd.Series,
+    claves: List[str],
+    hojas_externas: Dict[str, pd.DataFrame],
+    inventario_df: pd.DataFrame,
+    centros: CentrosAlmacenes,
+) -> Dict[str, object]:
+    """
+    Calcula los fragmentos `claves` de un pedido (ver FUENTES_COMBINABLES).
+    `centros` llega ya resuelto: se llama una vez por línea de pedido.
+    """
+    almacenes = centros.almacenes_inv_centro
+    fragmentos = {}
+    material_solicitado = campos_pedido(pedido)["_material"]
+
+    sustitutos = []
+    if material_solicitado and any(c.startswith("Sustituto") for c in claves):
+        sustitutos = _sustitutos_de(hojas_externas["Sustituto"], material_solicitado)
+    en_lento_mov = False
+    if material_solicitado and any(c.startswith("Lento mov") for c in claves):
+        df_lento = hojas_externas["Lento mov"]
+        en_lento_mov = (df_lento["Material"] == material_solicitado).any()
+
+    for clave in claves:
+        base, _, otra_fuente = clave.partition("/")
+        if not material_solicitado:
+            # Sin material no hay sugerencias
+            fragmentos[clave] = None if clave == "Lento mov" else []
+        elif base == "Sustituto" and otra_fuente:
+            fragmentos[clave] = [
+                lineas_combinadas(
+                    pedido,
+                    clave,
+                    material_sustituto,
+                    otra_fuente,
+                    hojas_externas[otra_fuente],
+                    inventario_df,
+                    almacenes,
+                    descripcion_sugerida=descripcion,
+                )
+                for material_sustituto, descripcion in sustitutos
+            ]
+        elif base == "Sustituto":
+            fragmentos[clave] = [
+                linea_combinable_sola(
+                    pedido,
+                    "Sustituto",
+                    material_sustituto,
+                    inventario_df,
+                    descripcion_sugerida=descripcion,
+                    almacenes=almacenes,
+                )
+                for material_sustituto, descripcion in sustitutos
+            ]
+        elif base == "Lento mov" and otra_fuente:
+            fragmentos[clave] = (
+                lineas_combinadas(
+                    pedido,
+                    clave,
+                    material_solicitado,
+                    otra_fuente,
+                    hojas_externas[otra_fuente],
+                    inventario_df,
+                    almacenes,
+                )
+                if en_lento_mov
+                else []
+            )
+        elif base == "Lento mov":
+            fragmentos[clave] = (
+                linea_combinable_sola(
+                    pedido,
+                    "Lento mov",
+                    material_solicitado,
+                    inventario_df,
+                    almacenes=almacenes,
+                )
+                if en_lento_mov
+                else None
+            )
+        else:
+            fragmentos[clave] = lineas_fuente_simple(
+                pedido,
+                material_solicitado,
+                clave,
+                hojas_externas[clave],
+                inventario_df,
+                almacenes,
+            )
+
+    return fragmentos
+
+
+# =========================
+# Límite de candidatos por línea de pedido y fuente
+# =========================
+CRITERIOS_CANDIDATOS = ["caducidad", "disponible", "centro"]
+
+
+def _clave_candidato(linea: Dict, criterio: str, centro_pedido: str = "") -> tuple:
+    """
+    Orden de preferencia de un candidato (menor es mejor):
+    - "caducidad": caducidad más próxima (sin fecha al final), luego mayor disponible
+    - "disponible": mayor disponible, luego caducidad más próxima
+    - "centro": el centro del pedido primero, luego caducidad y disponible
+    """
+    fecha = linea.get(Columnas.FECHA_CADUCIDAD, pd.NaT)
+    sin_fecha = pd.isna(fecha)
+    caducidad = (sin_fecha, 0 if sin_fecha else pd.Timestamp(fecha).value)
+    try:
+        disponible = -float(linea.get(Columnas.DISPONIBLE, 0) or 0)
+    except (TypeError, ValueError):
+        disponible = 0.0
+
+    if criterio == "disponible":
+        return (disponible, caducidad)
+    if criterio == "centro":
+        otro_centro = linea.get(Columnas.CENTRO_SUGERIDO) != centro_pedido
+        return (otro_centro, caducidad, disponible)
+    return (caducidad, disponible)
+
+
+def seleccionar_candidatos(
+    lineas: List[Dict],
+    maximo: Optional[int],
+    criterio: str = "caducidad",
+    centro_pedido: str = "",
+) -> Tuple[List[Dict], int]:
+    """
+    Las `maximo` mejores líneas según `criterio` (ver _clave_candidato),
+    seleccionadas con un heap sin ordenar toda la lista, y cuántas se
+    descartaron. Las elegidas conservan su orden original.
+    """
+    if maximo is None or len(lineas) <= maximo:
+        return lineas, 0
+    elegidas = heapq.nsmallest(
+        maximo,
+        range(len(lineas)),
+        key=lambda i: (_clave_candidato(lineas[i], criterio, centro_pedido), i),
+    )
+    return [lineas[i] for i in sorted(elegidas)], len(lineas) - maximo
+
+
+def ensamblar_sugerencias_pedido(
+    fragmentos: Dict[str, object],
+    hojas_externas: Dict[str, pd.DataFrame],
+    fuentes_activas: List[str],
+    max_candidatos: Optional[int] = None,
+    criterio_candidatos: str = "caducidad",
+    descartadas: Optional[Dict[str, int]] = None,
+    centro_pedido: str = "",
+) -> List[Dict]:
+    """
+    Arma los candidatos de un pedido con sus fragmentos, en el orden de
+    `fuentes_activas`. Sustituto y Lento mov se combinan con las demás fuentes
+    activas y, si no hay coincidencias, se usa su línea sola.
+    Con `max_candidatos` se conservan solo los mejores de cada fuente (por
+    sustituto en Sustituto/<otra>; `centro_pedido` es el del criterio
+    "centro"); los descartados se suman por fuente en `descartadas`.
+    """
+    sugerencias = []
+    simples = [f for f in fuentes_activas if f not in FUENTES_COMBINABLES]
+
+    def mejores(clave: str, lineas: List[Dict]) -> List[Dict]:
+        elegidas, descartes = seleccionar_candidatos(
+            lineas, max_candidatos, criterio_candidatos, centro_pedido
+        )
+        if descartes and descartadas is not None:
+            descartadas[clave] = descartadas.get(clave, 0) + descartes
+        return elegidas
+
+    for fuente in fuentes_activas:
+        if fuente not in fragmentos:
+            continue
+        if fuente not in FUENTES_COMBINABLES:
+            sugerencias.extend(mejores(fuente, fragmentos[fuente]))
+            continue
+
+        otras = [
+            (f"{fuente}/{otra}", fragmentos[f"{fuente}/{otra}"])
+            for otra in simples
+            if otra in hojas_externas
+        ]
+        if fuente == "Sustituto":
+            # Por cada sustituto: sus coincidencias en las otras fuentes
+            for i, linea_sola in enumerate(fragmentos[fuente]):
+                combinadas = [
+                    linea for clave, otra in otras for linea in mejores(clave, otra[i])
+                ]
+                sugerencias.extend(combinadas if combinadas else [linea_sola])
+        elif fragmentos[fuente] is not None:
+            # Lento mov: solo la primera otra fuente con coincidencias
+            for clave, combinadas in otras:
+                if combinadas:
+                    sugerencias.extend(mejores(clave, combinadas))
+                    break
+            else:
+                sugerencias.append(fragmentos[fuente])
+
+    return sugerencias
+
+
+# =========================
+# MODIFICAR: función buscar_sugerencias_exactas para manejar lotes específicos
+# =========================
+@instrumentado()
+def buscar_sugerencias_exactas(
+    pedido: pd.Series,
+    hojas_externas: Dict[str, pd.DataFrame],
+    fuentes_activas: List[str],
+    inventario_df: pd.DataFrame,
+    centros: CentrosAlmacenes,
+) -> List[Dict]:
+    """Busca sugerencias exactas (1:1) en las hojas externas según nuevas reglas."""
+    fragmentos = calcular_fragmentos_pedido(
+        pedido,
+        claves_fragmentos(hojas_externas, fuentes_activas),
+        hojas_externas,
+        inventario_df,
+        centros,
+    )
+    candidatos = ensamblar_sugerencias_pedido(
+        fragmentos,
+        hojas_externas,
+        fuentes_activas,
+        centro_pedido=campos_pedido(pedido)["_centro"],
+    )
+    # Formato ancho sin la línea sin sugerencia del pedido
+    sugerencias = SugerenciasCompactas.desde_candidatos(
+        pedido.to_frame().T, [candidatos], inventario_df, centros
+    ).a_formato_ancho()
+    return sugerencias.iloc[1:].to_dict("records")
+
+
+# =========================
+# Índices por material para generar_todas_sugerencias
+# =========================
+def _indice_material(df: Optional[pd.DataFrame]) -> Optional[Dict[str, np.ndarray]]:
+    """Posiciones de fila por material (None si el DataFrame no tiene 'Material')."""
+    if df is None or "Material" not in df.columns:
+        return None
+    return indice_por_columna(df, "Material")
+
+
+def filas_por_material(
+    df: pd.DataFrame,
+    indice: Optional[Dict[str, np.ndarray]],
+    materiales: List[str],
+) -> pd.DataFrame:
+    """
+    Filas de `df` cuyo 'Material' está en `materiales`, en el orden original.
+    Equivale a filtrar con `df["Material"].isin(materiales)` sin recorrer todo
+    el DataFrame. Sin índice retorna `df` completo.
+    """
+    if indice is None:
+        return df
+    posiciones = [indice[m] for m in dict.fromkeys(materiales) if m in indice]
+    if not posiciones:
+        return df.iloc[0:0]
+    if len(posiciones) == 1:
+        return df.iloc[posiciones[0]]
+    return df.iloc[np.sort(np.concatenate(posiciones))]
+
+
+def materiales_en_fuentes(
+    claves: List[str], indices_externas: Dict[str, Optional[Dict[str, np.ndarray]]]
+) -> Optional[set]:
+    """
+    Materiales que pueden tener algún fragmento de `claves` distinto de la
+    línea sin sugerencia: los de las fuentes simples, Sustituto y Lento mov
+    usadas (las combinaciones "X/otra" requieren el material en X). Retorna
+    None si alguna fuente no tiene índice por material.
+    """
+    materiales = set()
+    for base in {clave.partition("/")[0] for clave in claves if clave}:
+        indice = indices_externas.get(base)
+        if indice is None:
+            return None
+        materiales.update(indice)
+    return materiales
+
+
+@instrumentado()
+def _calcular_fragmentos(
+    pedidos_df: pd.DataFrame,
+    hojas_externas: Dict[str, pd.DataFrame],
+    inventario_df: pd.DataFrame,
+    claves: List[str],
+    centros: CentrosAlmacenes,
+    progreso: Optional[Progreso] = None,
+) -> Dict[str, list]:
+    """
+    Calcula los fragmentos `claves` de todos los pedidos (una lista por clave).
+    Solo se recorren los pedidos cuyo material está en alguna fuente usada; los
+    demás reciben de una vez fragmentos vacíos (solo llevan la línea sin
+    sugerencia).
+    """
+    total_pedidos = len(pedidos_df)
+
+    # Índices por material (compartidos entre sesiones): cada pedido trabaja
+    # solo con las filas de su material y de sus sustitutos
+    indice_inventario = _indice_material(inventario_df)
+    indices_externas = {
+        fuente: _indice_material(df_fuente)
+        for fuente, df_fuente in hojas_externas.items()
+    }
+    df_sustitutos = hojas_externas.get("Sustituto")
+    usar_sustitutos = (
+        any(clave.startswith("Sustituto") for clave in claves)
+        and df_sustitutos is not None
+        and "Material sustituto" in df_sustitutos.columns
+        and indices_externas.get("Sustituto") is not None
+    )
+
+    # Campos derivados de todos los pedidos de una vez (bloqueo, pendiente, ...)
+    pedidos_df = con_campos_derivados(pedidos_df)
+
+    # Pedidos cuyo material no está en ninguna fuente usada: no se buscan en
+    # las fuentes
+    posibles = materiales_en_fuentes(claves, indices_externas)
+    if posibles is None:
+        posiciones = np.arange(total_pedidos)
+    else:
+        posiciones = np.flatnonzero(pedidos_df["_material"].isin(posibles).to_numpy())
+        pedidos_df = pedidos_df.iloc[posiciones]
+    sin_fuente = total_pedidos - len(posiciones)
+    if sin_fuente:
+        logger.info(
+            f"Pedidos sin material en las fuentes activas: {sin_fuente} de "
+            f"{total_pedidos} (solo línea sin sugerencia)"
+        )
+
+    fragmentos = {
+        clave: (
+            [None] * total_pedidos
+            if clave == "Lento mov"
+            else [[] for _ in range(total_pedidos)]
+        )
+        for clave in claves
+    }
+
+    # Reportar avance por pedido (con frecuencia limitada)
+    reporte_progreso = ReporteProgreso(
+        progreso, total=len(pedidos_df), texto="Procesando pedido"
+    )
+
+    for posicion, (_, pedido) in zip(posiciones, pedidos_df.iterrows()):
+        # Actualizar barra de progreso
+        reporte_progreso.avanzar()
+
+        material = pedido["_material"]
+        materiales = [material]
+        if usar_sustitutos:
+            filas_sustitutos = filas_por_material(
+                df_sustitutos, indices_externas["Sustituto"], [material]
+            )
+            materiales += (
+                filas_sustitutos["Material sustituto"].astype(str).str.strip().tolist()
+            )
+        inventario_pedido = filas_por_material(
+            inventario_df, indice_inventario, materiales
+        )
+        hojas_pedido = {
+            fuente: filas_por_material(df_fuente, indices_externas[fuente], materiales)
+            for fuente, df_fuente in hojas_externas.items()
+        }
+
+        fragmentos_pedido = calcular_fragmentos_pedido(
+            pedido, claves, hojas_pedido, inventario_pedido, centros
+        )
+        for clave in claves:
+            fragmentos[clave][posicion] = fragmentos_pedido[clave]
+
+    reporte_progreso.finalizar()
+    return fragmentos
+
+
+# =========================
+# Cambios en pedidos entre corridas
+# =========================
+CLAVE_LINEA_PEDIDO = ["Pedido", "Material", "Centro", "Almacén"]
+
+
+def huellas_por_fila(df: pd.DataFrame) -> List[int]:
+    """
+    Huella (64 bits) del contenido de cada fila, sin el índice. Se calcula
+    sobre el texto de cada celda para que no dependa del tipo que pandas
+    infiera para la columna al leer el archivo (p. ej. int64 vs object).
+    """
+    if df.empty:
+        return []
+    return pd.util.hash_pandas_object(df.astype(str), index=False).tolist()
+
+
+def _claves_lineas_pedido(
+    pedidos_df: pd.DataFrame, huellas_filas: List[int]
+) -> pd.DataFrame:
+    """Clave (Pedido, Material, Centro, Almacén) y huella de cada línea de pedido."""
+    columnas = [c for c in CLAVE_LINEA_PEDIDO if c in pedidos_df.columns]
+    claves = pedidos_df[columnas].astype(str).reset_index(drop=True)
+    claves["_huella"] = np.array(huellas_filas, dtype="uint64")
+    return claves
+
+
+def comparar_pedidos(
+    anteriores: pd.DataFrame, actuales: pd.DataFrame
+) -> Dict[str, int]:
+    """
+    Compara dos corridas por clave de línea de pedido (hash join de las claves).
+    Una clave con varias filas se considera modificada si cambia cualquiera.
+    """
+    columnas = [
+        c for c in anteriores.columns if c != "_huella" and c in actuales.columns
+    ]
+    if not columnas:
+        return {
+            "nuevas": len(actuales),
+            "modificadas": 0,
+            "eliminadas": len(anteriores),
+            "sin_cambios": 0,
+        }
+
+    def por_clave(df: pd.DataFrame) -> pd.DataFrame:
+        return df.groupby(columnas, sort=False)["_huella"].agg(
+            lambda h: tuple(sorted(h))
+        )
+
+    union = pd.merge(
+        por_clave(anteriores).rename("anterior"),
+        por_clave(actuales).rename("actual"),
+        how="outer",
+        left_index=True,
+        right_index=True,
+    )
+    en_ambas = union["anterior"].notna() & union["actual"].notna()
+    iguales = en_ambas & (union["anterior"] == union["actual"])
+    return {
+        "nuevas": int(union["anterior"].isna().sum()),
+        "modificadas": int((en_ambas & ~iguales).sum()),
+        "eliminadas": int(union["actual"].isna().sum()),
+        "sin_cambios": int(iguales.sum()),
+    }
+
+
+# =========================
+# Actualizar generar_todas_sugerencias
+# =========================
+@instrumentado()
+def generar_sugerencias_compactas(
+    pedidos_df: pd.DataFrame,
+    hojas_externas: Dict[str, pd.DataFrame],
+    fuentes_activas: List[str],
+    inventario_df: pd.DataFrame,
+    progreso: Optional[Progreso] = None,
+    avisar: Optional[Aviso] = None,
+    max_candidatos: Optional[int] = None,
+    criterio_candidatos: str = "caducidad",
+    centros: Optional[CentrosAlmacenes] = None,
+    huella_fuentes: Optional[str] = None,
+    corrida_anterior: Optional[Dict[str, object]] = None,
+) -> SugerenciasCompactas:
+    """
+    Genera todas las sugerencias para todos los pedidos, incluyendo línea sin
+    sugerencia, en el modelo compacto (ver SugerenciasCompactas). Con
+    `max_candidatos` cada línea de pedido conserva a lo sumo
+    ese número de sugerencias por fuente, las mejores según
+    `criterio_candidatos` (ver CRITERIOS_CANDIDATOS). `centros` define las
+    columnas de inventario (por defecto, CentrosAlmacenes.desde_entorno()).
+    `huella_fuentes` es huella_entradas(inventario_df, hojas_externas) ya
+    calculada, para no recorrer el inventario en cada llamada con las mismas
+    fuentes (p. ej. en el servicio HTTP).
+    `corrida_anterior` es un diccionario del llamador (p. ej. de la sesión del
+    usuario) donde se guardan las claves de las líneas de esta corrida; si ya
+    tiene las de una corrida anterior con las mismas fuentes, se avisa cuántas
+    líneas son nuevas, modificadas o eliminadas.
+    """
+    avisar = avisar or _aviso_por_defecto
+    centros = centros or CentrosAlmacenes.desde_entorno()
+
+    # Fragmentos por fuente y por línea de pedido, cacheados mientras el
+    # inventario y las hojas externas no cambien. Cada línea se identifica por
+    # la huella de su contenido: al cambiar las fuentes activas o al cargar un
+    # archivo de pedidos actualizado solo se calcula lo que falta.
+    claves = claves_fragmentos(hojas_externas, fuentes_activas)
+    cache = cache_compartido()
+    contexto = (
+        (huella_fuentes or huella_entradas(inventario_df, hojas_externas))
+        + repr(list(pedidos_df.columns))
+        + repr(centros.almacenes_inv_centro)
+    )
+    huellas_filas = huellas_por_fila(pedidos_df)
+
+    # Resumen de cambios respecto a la corrida anterior del mismo llamador
+    # con el mismo contexto (no de la caché compartida entre usuarios)
+    hay_anterior = False
+    if corrida_anterior is not None:
+        claves_pedidos = _claves_lineas_pedido(pedidos_df, huellas_filas)
+        hay_anterior = corrida_anterior.get("contexto") == contexto
+        if hay_anterior:
+            cambios = comparar_pedidos(corrida_anterior["claves"], claves_pedidos)
+            avisar(
+                "🔁 Cambios en pedidos respecto a la corrida anterior: "
+                f"{cambios['nuevas']} nuevas, {cambios['modificadas']} modificadas, "
+                f"{cambios['eliminadas']} eliminadas, {cambios['sin_cambios']} sin cambios"
+            )
+        corrida_anterior.update(contexto=contexto, claves=claves_pedidos)
+
+    previos = {
+        clave: cache.obtener(("fragmentos", contexto, clave)) or {} for clave in claves
+    }
+    faltantes = [
+        i
+        for i, h in enumerate(huellas_filas)
+        if any(h not in previos[clave] for clave in claves)
+    ]
+    claves_faltantes = [
+        clave
+        for clave in claves
+        if any(huellas_filas[i] not in previos[clave] for i in faltantes)
+    ]
+
+    nuevos = {}
+    if faltantes:
+        nuevos = _calcular_fragmentos(
+            pedidos_df.iloc[faltantes],
+            hojas_externas,
+            inventario_df,
+            claves_faltantes,
+            centros,
+            progreso,
+        )
+    if hay_anterior or len(faltantes) < len(pedidos_df):
+        avisar(
+            f"♻️ Líneas de pedido reutilizadas: {len(pedidos_df) - len(faltantes)}; "
+            f"calculadas: {len(faltantes)}"
+        )
+
+    fragmentos = {}
+    for clave in claves:
+        calculados = dict(
+            zip((huellas_filas[i] for i in faltantes), nuevos.get(clave, []))
+        )
+        fragmentos[clave] = [
+            calculados[h] if h in calculados else previos[clave][h]
+            for h in huellas_filas
+        ]
+        # Conservar solo las líneas de esta corrida para la siguiente
+        cache.guardar(
+            ("fragmentos", contexto, clave), dict(zip(huellas_filas, fragmentos[clave]))
+        )
+
+    # El límite de candidatos se aplica al armar: los fragmentos cacheados
+    # quedan completos y cambiar el límite no obliga a recalcularlos
+    centros_pedidos = derivar_campos_pedidos(pedidos_df)["_centro"].tolist()
+    candidatos = []
+    descartadas = {}
+    for i in range(len(pedidos_df)):
+        fragmentos_pedido = {clave: fragmentos[clave][i] for clave in claves}
+        candidatos.append(
+            ensamblar_sugerencias_pedido(
+                fragmentos_pedido,
+                hojas_externas,
+                fuentes_activas,
+                max_candidatos=max_candidatos,
+                criterio_candidatos=criterio_candidatos,
+                descartadas=descartadas,
+                centro_pedido=centros_pedidos[i],
+            )
+        )
+    if descartadas:
+        detalle = ", ".join(f"{clave}: {n}" for clave, n in descartadas.items())
+        avisar(
+            f"✂️ Candidatos descartados por el límite de {max_candidatos} por "
+            f"fuente ({criterio_candidatos}): {sum(descartadas.values())} ({detalle})"
+        )
+
+    return SugerenciasCompactas.desde_candidatos(
+        pedidos_df, candidatos, inventario_df, centros
+    )
+
+
+def generar_todas_sugerencias(
+    pedidos_df: pd.DataFrame,
+    hojas_externas: Dict[str, pd.DataFrame],
+    fuentes_activas: List[str],
+    inventario_df: pd.DataFrame,
+    progreso: Optional[Progreso] = None,
+    avisar: Optional[Aviso] = None,
+    max_candidatos: Optional[int] = None,
+    criterio_candidatos: str = "caducidad",
+    centros: Optional[CentrosAlmacenes] = None,
+) -> pd.DataFrame:
+    """
+    "Todas las Sugerencias" en formato ancho (ver generar_sugerencias_compactas).
+    """
+    return generar_sugerencias_compactas(
+        pedidos_df,
+        hojas_externas,
+        fuentes_activas,
+        inventario_df,
+        progreso=progreso,
+        avisar=avisar,
+        max_candidatos=max_candidatos,
+        criterio_candidatos=criterio_candidatos,
+        centros=centros,
+    ).a_formato_ancho()
+
+
+# =========================
+# NUEVA FUNCIÓN: Calcular estadísticas de consumo por Centro/Material/Almacén
+# =========================
+@instrumentado()
+def calcular_estadisticas_consumo_por_centro_material_almacen(
+    df_facturacion_procesado: pd.DataFrame,
+    cubo: Optional[FacturacionCube] = None,
+    fecha_corte=None,
+) -> pd.DataFrame:
+    """
+    Calcula estadísticas de consumo por Centro/Material/Almacén:
+    - Promedio consumo últimos 12 meses
+    - Último mes de consumo (MM/AAAA)
+    - Penúltimo mes de consumo (MM/AAAA)
+    - Cantidad facturada último mes
+    - Cantidad facturada penúltimo mes
+
+    Se calcula sobre el cubo de facturación; si no se indica `cubo` se
+    construye a partir del DataFrame. Los 12 meses terminan en el mes de
+    `fecha_corte` o, si no se indica, en el último mes facturado.
+    """
+    if cubo is None:
+        if df_facturacion_procesado is None or df_facturacion_procesado.empty:
+            return pd.DataFrame()
+
+        # Asegurar columnas necesarias
+        columnas_necesarias = ["Centro", "Material", "Almacén", "Fecha", "Cantidad"]
+        for col in columnas_necesarias:
+            if col not in df_facturacion_procesado.columns:
+                logger.warning(f"Columna {col} no encontrada en datos de facturación")
+                return pd.DataFrame()
+
+    try:
+        if cubo is None:
+            cubo = FacturacionCube.desde_facturacion(df_facturacion_procesado)
+        df_mensual = cubo.almacen
+
+        if df_mensual.empty:
+            return pd.DataFrame()
+
+        claves = ["Centro", "Material", "Almacén"]
+
+        # Promedio de los 12 meses calendario que terminan en el mes de corte,
+        # último y penúltimo mes de cada grupo hasta ese mes
+        mes_corte = df_mensual["mes"].max() if fecha_corte is None else fecha_corte
+        consumo = consumo_por_fechas_corte(df_mensual, claves, [mes_corte])
+
+        resultado = pd.DataFrame(
+            {
+                **{col: consumo[col] for col in claves},
+                "Promedio_Consumo_12M": consumo["promedio_ventana"].round(2),
+                "Ultimo_Mes_Consumo": texto_mes(consumo["ultimo_mes"]),
+                "Penultimo_Mes_Consumo": texto_mes(consumo["penultimo_mes"]).fillna(""),
+                "Cantidad_Ultimo_Mes": consumo["cantidad_ultimo"],
+                "Cantidad_Penultimo_Mes": consumo["cantidad_penultimo"].fillna(0),
+            }
+        )
+
+        return resultado.rename(columns={"Almacén": "Almacen"})[
+            [
+                "Centro",
+                "Material",
+                "Almacen",
+                "Promedio_Consumo_12M",
+                "Ultimo_Mes_Consumo",
+                "Penultimo_Mes_Consumo",
+                "Cantidad_Ultimo_Mes",
+                "Cantidad_Penultimo_Mes",
+            ]
+        ]
+
+    except Exception as e:
+        logger.error(f"Error al calcular estadísticas de consumo: {str(e)}")
+        import traceback
+
+        logger.error(traceback.format_exc())
+        return pd.DataFrame()
+
+
+def validar_coherencia_temporal(
+    df_resumen: pd.DataFrame, avisar: Optional[Aviso] = None
+):
+    """
+    Valida que el último mes sea mayor (más reciente) que el penúltimo mes
+    """
+    if df_resumen.empty:
+        return
+
+    # Convertir strings a fechas para comparación
+    def mes_a_fecha(mes_str):
+        if not mes_str or pd.isna(mes_str):
+            return None
+        try:
+            mes, año = mes_str.split("/")
+            return pd.Timestamp(year=int(año), month=int(mes), day=1)
+        except:
+            return None
+
+    incoherencias = 0
+    for idx, row in df_resumen.iterrows():
+        ultimo = mes_a_fecha(row.get("Ultimo_Mes_Consumo"))
+        penultimo = mes_a_fecha(row.get("Penultimo_Mes_Consumo"))
+
+        if ultimo and penultimo and penultimo > ultimo:
+            incoherencias += 1
+            logger.warning(
+                f"Incoherencia temporal en fila {idx}: Último={row['Ultimo_Mes_Consumo']}, Penúltimo={row['Penultimo_Mes_Consumo']}"
+            )
+
+    if incoherencias > 0:
+        (avisar or _aviso_por_defecto)(
+            f"⚠️ Se encontraron {incoherencias} incoherencias temporales en el resumen"
+        )
+
+
+COLUMNAS_CLAVE_RESUMEN = ["Centro", "Material", "Almacen"]
+
+
+@instrumentado()
+def calcular_pendiente_por_centro_sin_bloqueo(
+    df_todas_sugerencias: pd.DataFrame,
+    centros: Optional[List[str]] = None,
+) -> pd.Series:
+    """
+    Calcula la cantidad pendiente por centro sin estatus de bloqueo, solo de
+    `centros` (por defecto los de CentrosAlmacenes.desde_entorno()).
+    `df_todas_sugerencias` puede ser un SugerenciasCompactas.
+    Retorna una serie con índice (Centro, Material, Almacen): la suma del
+    pendiente de cada pedido (contado una vez) en esa combinación.
+    """
+    vacia = pd.Series(
+        dtype=float,
+        index=pd.MultiIndex.from_arrays([[], [], []], names=COLUMNAS_CLAVE_RESUMEN),
+    )
+    df_todas_sugerencias = lineas_sin_sugerencia(df_todas_sugerencias)
+    if df_todas_sugerencias.empty:
+        return vacia
+    if centros is None:
+        centros = CentrosAlmacenes.desde_entorno().centros
+
+    # IMPORTANTE: Filtrar solo las líneas SIN sugerencia (fuente vacía) y SIN bloqueo
+    df_sin_bloqueo = df_todas_sugerencias[
+        (df_todas_sugerencias[Columnas.FUENTE] == "")  # Solo líneas sin sugerencia
+        & (df_todas_sugerencias[Columnas.BLOQUEADO] == "")  # Sin bloqueo
+        & (df_todas_sugerencias[Columnas.CANTIDAD_PENDIENTE] > 0)  # Con pendiente
+        & (df_todas_sugerencias[Columnas.CENTRO_PEDIDO].isin([str(c) for c in centros]))
+    ]
+    if df_sin_bloqueo.empty:
+        return vacia
+
+    # Para evitar duplicados, agrupar por Centro, Material, Almacén y PEDIDO
+    # primero (todas las líneas de un pedido tienen el mismo pendiente) y
+    # luego sumar por Centro, Material y Almacén
+    por_pedido = df_sin_bloqueo.groupby(
+        [
+            Columnas.CENTRO_PEDIDO,
+            Columnas.MATERIAL_SOLICITADO,
+            Columnas.ALMACEN,
+            Columnas.PEDIDO,
+        ]
+    )[Columnas.CANTIDAD_PENDIENTE].first()
+    pendiente = por_pedido.groupby(level=[0, 1, 2]).sum().astype(float)
+    pendiente.index.names = COLUMNAS_CLAVE_RESUMEN
+    return pendiente
+
+
+# =========================
+# MODIFICAR: generar_resumen_sin_sugerencias_optimizado para cumplir con los nuevos requisitos
+# =========================
+@instrumentado()
+def generar_resumen_sin_sugerencias_optimizado(
+    df_sugerencias: pd.DataFrame,
+    inventario_df: pd.DataFrame,
+    df_todas_sugerencias: pd.DataFrame,
+    df_facturacion_procesado: pd.DataFrame = None,
+    cubo_facturacion: Optional[FacturacionCube] = None,
+    fecha_corte=None,
+    centros: Optional[CentrosAlmacenes] = None,
+) -> pd.DataFrame:
+    """
+    Versión MODIFICADA según los nuevos requisitos:
+    1. Debe incluir TODOS los "Material" y "Descripcion" por Centro/Material/Almacén con:
+       - Inventario > 0 (ya calculado como: "Libre Utilización" - "Entrega a cliente")
+       - O materiales que tengan Pedidos > 0 (sin sugerencia y sin bloqueo)
+    Las estadísticas de consumo salen de `cubo_facturacion` si se indica; si
+    no, de `df_facturacion_procesado`, con los 12 meses hasta `fecha_corte`.
+    Las columnas por almacén y por centro salen de `centros` (por defecto,
+    CentrosAlmacenes.desde_entorno()).
+    Las sugerencias pueden venir en formato ancho o como SugerenciasCompactas:
+    solo se usan sus líneas sin sugerencia.
+    """
+    centros = centros or CentrosAlmacenes.desde_entorno()
+    df_sugerencias = lineas_sin_sugerencia(df_sugerencias)
+    df_todas_sugerencias = lineas_sin_sugerencia(df_todas_sugerencias)
+
+    # 1. OBTENER MATERIALES CON INVENTARIO > 0
+    inventario_materiales = pd.DataFrame()
+    if inventario_df is not None and not inventario_df.empty:
+        # Filtrar materiales con Libre Utilización > 0 (ya calculado)
+        inventario_filtrado = inventario_df[
+            inventario_df["Libre Utilización"] > 0
+        ].copy()
+
+        if not inventario_filtrado.empty:
+            # Crear DataFrame base con materiales de inventario > 0
+            inventario_materiales = (
+                inventario_filtrado.groupby(["Centro", "Material", "Almacén"])
+                .agg(
+                    Descripcion=("Descripción", "first"),
+                    Libre_Utilizacion_Total=("Libre Utilización", "sum"),
+                    Transito_Total=("Cant. en Tránsito", "sum"),
+                )
+                .reset_index()
+            )
+
+            inventario_materiales = inventario_materiales.rename(
+                columns={
+                    "Centro": "Centro",
+                    "Almacén": "Almacen",
+                    "Material": "Material",
+                    "Descripcion": "Descripcion",
+                }
+            )
+            inventario_materiales["Fuente"] = "Inventario"  # Marcar origen
+
+    # 2. OBTENER MATERIALES CON PEDIDOS > 0 (SIN SUGERENCIA Y SIN BLOQUEO)
+    pedidos_materiales = pd.DataFrame()
+    if df_sugerencias is not None and not df_sugerencias.empty:
+        # Filtrar solo las líneas sin sugerencia (fuente vacía) y SIN BLOQUEO
+        df_sin_sugerencia = df_sugerencias[
+            (df_sugerencias[Columnas.FUENTE] == "")
+            & (df_sugerencias[Columnas.BLOQUEADO] == "")
+            & (df_sugerencias[Columnas.CANTIDAD_PENDIENTE] > 0)
+        ].copy()
+
+        if not df_sin_sugerencia.empty:
+            # Calcular estadísticas de pedidos sin sugerencia
+            df_sin_sugerencia["Importe_Calculado"] = (
+                df_sin_sugerencia[Columnas.CANTIDAD_PENDIENTE]
+                * df_sin_sugerencia[Columnas.PRECIO]
+            )
+
+            pedidos_materiales = (
+                df_sin_sugerencia.groupby(
+                    [
+                        Columnas.CENTRO_PEDIDO,
+                        Columnas.ALMACEN,
+                        Columnas.MATERIAL_SOLICITADO,
+                    ]
+                )
+                .agg(
+                    Pedidos=(Columnas.PEDIDO, "nunique"),
+                    Descripcion=(Columnas.DESCRIPCION_SOLICITADA, "first"),
+                    Cantidad_Pendiente=(Columnas.CANTIDAD_PENDIENTE, "sum"),
+                    Importe_Pendiente=("Importe_Calculado", "sum"),
+                )
+                .reset_index()
+            )
+
+            pedidos_materiales = pedidos_materiales.rename(
+                columns={
+                    Columnas.CENTRO_PEDIDO: "Centro",
+                    Columnas.ALMACEN: "Almacen",
+                    Columnas.MATERIAL_SOLICITADO: "Material",
+                }
+            )
+            pedidos_materiales["Fuente"] = "Pedidos"  # Marcar origen
+
+    # 3. COMBINAR AMBAS FUENTES (UNIÓN - UNION)
+    # Primero, asegurarnos de que ambos DataFrames tengan las mismas columnas
+    # Añadir columnas faltantes a inventario_materiales
+    if not inventario_materiales.empty:
+        for col in ["Pedidos", "Cantidad_Pendiente", "Importe_Pendiente"]:
+            if col not in inventario_materiales.columns:
+                inventario_materiales[col] = 0
+
+    # Añadir columnas faltantes a pedidos_materiales
+    if not pedidos_materiales.empty:
+        for col in ["Libre_Utilizacion_Total", "Transito_Total"]:
+            if col not in pedidos_materiales.columns:
+                pedidos_materiales[col] = 0
+
+    # 4. COMBINAR AMBOS CONJUNTOS (eliminando duplicados de Centro/Material/Almacen)
+    if not inventario_materiales.empty and not pedidos_materiales.empty:
+        # Concatenar ambos DataFrames
+        combined = pd.concat(
+            [inventario_materiales, pedidos_materiales], ignore_index=True
+        )
+
+        # Para cada combinación Centro/Material/Almacen, priorizar:
+        # 1. Si existe en INVENTARIO, usar esos datos (inventario > 0 tiene prioridad)
+        # 2. Si solo existe en PEDIDOS, usar esos datos
+        combined = combined.sort_values(
+            by=["Centro", "Material", "Almacen", "Fuente"],
+            ascending=[
+                True,
+                True,
+                True,
+                False,
+            ],  # "Inventario" viene antes que "Pedidos" alfabéticamente
+        )
+
+        # Eliminar duplicados, manteniendo el primero (prioridad a Inventario)
+        grouped = combined.drop_duplicates(
+            subset=["Centro", "Material", "Almacen"], keep="first"
+        )
+    elif not inventario_materiales.empty:
+        grouped = inventario_materiales
+    elif not pedidos_materiales.empty:
+        grouped = pedidos_materiales
+    else:
+        return pd.DataFrame()
+
+    # 5. RELLENAR VALORES FALTANTES
+    # Asegurar que todas las columnas necesarias existan
+    for col in [
+        "Pedidos",
+        "Cantidad_Pendiente",
+        "Importe_Pendiente",
+        "Libre_Utilizacion_Total",
+        "Transito_Total",
+    ]:
+        if col not in grouped.columns:
+            grouped[col] = 0
+
+    # Rellenar descripciones vacías
+    if "Descripcion" in grouped.columns:
+        grouped["Descripcion"] = grouped["Descripcion"].fillna("")
+
+    # 6. INVENTARIO POR CENTRO/MATERIAL/ALMACÉN: libre utilización de la
+    # última fila de cada combinación y tránsito sumado
+    inventario_por_almacen = pd.DataFrame()
+    transito_por_almacen = pd.Series(dtype=float)
+    if inventario_df is not None and not inventario_df.empty:
+        por_combinacion = inventario_df.groupby(["Centro", "Material", "Almacén"])
+        inventario_por_almacen = (
+            por_combinacion["Libre Utilización"].last().astype(float).unstack()
+        )
+        transito_por_almacen = por_combinacion["Cant. en Tránsito"].sum()
+
+    # 7. CALCULAR ESTADÍSTICAS DE CONSUMO (NUEVO)
+    estadisticas_consumo_df = None
+    if cubo_facturacion is not None or (
+        df_facturacion_procesado is not None and not df_facturacion_procesado.empty
+    ):
+        estadisticas_consumo_df = (
+            calcular_estadisticas_consumo_por_centro_material_almacen(
+                df_facturacion_procesado,
+                cubo=cubo_facturacion,
+                fecha_corte=fecha_corte,
+            )
+        )
+
+    # 8. AGREGAR ESTADÍSTICAS DE CONSUMO
+    if estadisticas_consumo_df is not None and not estadisticas_consumo_df.empty:
+        # Hacer merge con estadísticas de consumo
+        grouped = pd.merge(
+            grouped,
+            estadisticas_consumo_df,
+            left_on=["Centro", "Material", "Almacen"],
+            right_on=["Centro", "Material", "Almacen"],
+            how="left",
+        )
+        # Rellenar valores nulos
+        for col in [
+            "Promedio_Consumo_12M",
+            "Cantidad_Ultimo_Mes",
+            "Cantidad_Penultimo_Mes",
+        ]:
+            if col in grouped.columns:
+                grouped[col] = grouped[col].fillna(0)
+        for col in ["Ultimo_Mes_Consumo", "Penultimo_Mes_Consumo"]:
+            if col in grouped.columns:
+                grouped[col] = grouped[col].fillna("")
+    else:
+        grouped["Promedio_Consumo_12M"] = 0
+        grouped["Ultimo_Mes_Consumo"] = ""
+        grouped["Penultimo_Mes_Consumo"] = ""
+        grouped["Cantidad_Ultimo_Mes"] = 0
+        grouped["Cantidad_Penultimo_Mes"] = 0
+
+    # 9. AGREGAR DATOS DE INVENTARIO ESPECÍFICOS POR ALMACÉN
+    def inventario_en(centros_buscados, almacen: str) -> np.ndarray:
+        """Libre utilización del material de cada fila (0 si no hay filas)."""
+        if almacen not in inventario_por_almacen.columns:
+            return np.zeros(len(grouped))
+        buscados = pd.MultiIndex.from_arrays([centros_buscados, grouped["Material"]])
+        return (
+            inventario_por_almacen[almacen]
+            .reindex(buscados)
+            .fillna(0)
+            .to_numpy(dtype=float)
+        )
+
+    for almacen, columna in zip(centros.almacenes, centros.columnas_inv_almacen()):
+        grouped[columna] = inventario_en(grouped["Centro"], almacen)
+
+    # Tránsito del almacén de la fila (solo almacenes configurados)
+    grouped["Cant. en Tránsito"] = (
+        transito_por_almacen.reindex(
+            pd.MultiIndex.from_arrays(
+                [grouped["Centro"], grouped["Material"], grouped["Almacen"]]
+            )
+        )
+        .fillna(0)
+        .to_numpy(dtype=float)
+    )
+    grouped.loc[~grouped["Almacen"].isin(centros.almacenes), "Cant. en Tránsito"] = 0
+
+    # Disponible en el centro de disponible para sus almacenes
+    for almacen, columna in zip(
+        centros.almacenes_disponible, centros.columnas_disponible()
+    ):
+        grouped[columna] = inventario_en(
+            np.full(len(grouped), centros.centro_disponible, dtype=object), almacen
+        )
+
+    columnas_inventario_resumen = (
+        centros.columnas_inv_almacen()
+        + ["Cant. en Tránsito"]
+        + centros.columnas_disponible()
+    )
+
+    # 10. CALCULAR MESES DE INVENTARIO
+    # Inventario total en el centro para el material
+    inv_total = grouped[centros.columnas_inv_almacen()].sum(axis=1)
+    grouped["Meses_Inventario"] = [
+        (
+            round(inventario / consumo_promedio, 2)
+            if consumo_promedio > 0
+            else (0 if inventario == 0 else 999)  # Inventario pero sin consumo
+        )
+        for inventario, consumo_promedio in zip(
+            inv_total, grouped["Promedio_Consumo_12M"]
+        )
+    ]
+
+    # 11. CALCULAR PENDIENTE POR CENTRO SIN BLOQUEO
+    pendiente_por_centro = None
+    if df_todas_sugerencias is not None and not df_todas_sugerencias.empty:
+        pendiente_por_centro = calcular_pendiente_por_centro_sin_bloqueo(
+            df_todas_sugerencias, centros.centros
+        )
+
+    # 12. AGREGAR PENDIENTE POR CENTRO: solo en las filas de ese centro
+    pendiente = np.zeros(len(grouped))
+    if pendiente_por_centro is not None and not pendiente_por_centro.empty:
+        pendiente = (
+            pendiente_por_centro.reindex(
+                pd.MultiIndex.from_arrays(
+                    [grouped["Centro"], grouped["Material"], grouped["Almacen"]]
+                )
+            )
+            .fillna(0)
+            .to_numpy(dtype=float)
+        )
+    for centro, columna in zip(centros.centros, centros.columnas_pendiente()):
+        grouped[columna] = np.where(grouped["Centro"] == centro, pendiente, 0)
+
+    # 13. ORDENAR COLUMNAS SEGÚN LO SOLICITADO
+    columnas_orden = [
+        "Centro",
+        "Almacen",
+        "Pedidos",  # Mantener para referencia
+        "Material",
+        "Descripcion",
+        "Cantidad_Pendiente",
+        "Importe_Pendiente",
+        "Promedio_Consumo_12M",
+        "Ultimo_Mes_Consumo",
+        "Cantidad_Ultimo_Mes",
+        "Penultimo_Mes_Consumo",
+        "Cantidad_Penultimo_Mes",
+        "Meses_Inventario",
+    ]
+    columnas_orden += columnas_inventario_resumen
+
+    # Agregar columnas de pendiente por centro
+    columnas_orden += centros.columnas_pendiente()
+
+    # Agregar columna de fuente para depuración (opcional)
+    columnas_orden.append("Fuente")
+
+    # Asegurar que todas las columnas existan
+    for col in columnas_orden:
+        if col not in grouped.columns:
+            if col in [
+                "Descripcion",
+                "Centro",
+                "Almacen",
+                "Material",
+                "Ultimo_Mes_Consumo",
+                "Penultimo_Mes_Consumo",
+                "Fuente",
+            ]:
+                grouped[col] = ""
+            elif col == "Meses_Inventario":
+                grouped[col] = 0.0
+            else:
+                grouped[col] = 0
+
+    # 14. ORDENAR POR CENTRO, ALMACEN, MATERIAL
+    grouped = grouped.sort_values(
+        by=["Centro", "Almacen", "Material"], ascending=[True, True, True]
+    )
+
+    return grouped[columnas_orden]
+
+
+# =========================
+# Escritura de hojas respetando el límite de filas de Excel
+# =========================
+LIMITE_FILAS_EXCEL = 1_048_576  # Filas por hoja en .xlsx (incluye encabezado)
+LIMITE_NOMBRE_HOJA = 31  # Excel limita a 31 caracteres
+FILAS_POR_BLOQUE_EXCEL = 20_000  # Filas convertidas a la vez al escribir
+# Columnas que viajan como datetime64 y se escriben como texto dd/mm/aaaa
+COLUMNAS_FECHA_TEXTO = [Columnas.FECHA_CADUCIDAD]
+# Formatos y estilo de encabezado que usaba DataFrame.to_excel
+FORMATO_FECHA_HORA_EXCEL = "YYYY-MM-DD HH:MM:SS"
+FORMATO_FECHA_EXCEL = "YYYY-MM-DD"
+
+
+def fechas_como_texto(df: pd.DataFrame) -> pd.DataFrame:
+    """Formatea como dd/mm/aaaa las COLUMNAS_FECHA_TEXTO que sean datetime64."""
+    columnas = {
+        col: formatear_fechas(df[col])
+        for col in COLUMNAS_FECHA_TEXTO
+        if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col])
+    }
+    return df.assign(**columnas) if columnas else df
+
+
+def nombres_hojas_divididas(nombre_hoja: str, num_partes: int) -> List[str]:
+    """Genera los nombres de las hojas de continuación: 'Hoja', 'Hoja (2)', ..."""
+    nombres = []
+    for parte in range(1, num_partes + 1):
+        sufijo = "" if parte == 1 else f" ({parte})"
+        base = nombre_hoja[: LIMITE_NOMBRE_HOJA - len(sufijo)]
+        nombres.append(f"{base}{sufijo}")
+    return nombres
+
+
+@contextmanager
+def libro_excel(destino):
+    """
+    Libro de openpyxl en modo de solo escritura: cada fila se serializa al
+    agregarla y no se conserva en memoria. Se guarda en `destino` (ruta o
+    archivo binario) al salir del bloque.
+    """
+    libro = Workbook(write_only=True)
+    yield libro
+    libro.save(destino)
+
+
+def _celda_excel(hoja, valor):
+    """
+    Convierte un valor como lo hacía DataFrame.to_excel (vacíos -> "",
+    infinitos -> "inf", tipos no soportados -> texto) y agrega el formato de
+    número de fechas y duraciones.
+    """
+    if pd.api.types.is_scalar(valor) and pd.isna(valor):
+        return ""
+    if isinstance(valor, (bool, np.bool_)):
+        return bool(valor)
+    if isinstance(valor, (int, np.integer)):
+        return int(valor)
+    if isinstance(valor, (float, np.floating)):
+        if np.isinf(valor):
+            return "inf" if valor > 0 else "-inf"
+        return float(valor)
+    if isinstance(valor, str):
+        return valor
+    if isinstance(valor, datetime.datetime):
+        formato = FORMATO_FECHA_HORA_EXCEL
+        valor = pd.Timestamp(valor).to_pydatetime()
+    elif isinstance(valor, datetime.date):
+        formato = FORMATO_FECHA_EXCEL
+    elif isinstance(valor, (datetime.timedelta, np.timedelta64)):
+        formato = "0"
+        valor = pd.Timedelta(valor).total_seconds() / 86400
+    else:
+        return str(valor)
+    celda = WriteOnlyCell(hoja, valor)
+    celda.number_format = formato
+    return celda
+
+
+def _valores_excel(hoja, serie: pd.Series) -> list:
+    """Valores de una columna listos para openpyxl (ver _celda_excel)."""
+    tipo = serie.dtype
+    if pd.api.types.is_bool_dtype(tipo) and not pd.api.types.is_extension_array_dtype(
+        tipo
+    ):
+        return serie.tolist()
+    if pd.api.types.is_integer_dtype(
+        tipo
+    ) and not pd.api.types.is_extension_array_dtype(tipo):
+        return serie.tolist()
+    if pd.api.types.is_float_dtype(tipo) and not pd.api.types.is_extension_array_dtype(
+        tipo
+    ):
+        valores = serie.tolist()
+        arreglo = serie.to_numpy()
+        for posicion in np.flatnonzero(~np.isfinite(arreglo)):
+            valores[posicion] = _celda_excel(hoja, arreglo[posicion])
+        return valores
+
+    valores = serie.tolist()
+    if tipo == object and set(map(type, valores)) <= {str}:
+        # Caso habitual: columna de texto sin vacíos
+        return valores
+    return [_celda_excel(hoja, valor) for valor in valores]
+
+
+def _escribir_filas(hoja, df: pd.DataFrame) -> None:
+    """Agrega las filas de `df` a la hoja por bloques de FILAS_POR_BLOQUE_EXCEL."""
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE_EXCEL):
+        bloque = fechas_como_texto(df.iloc[inicio : inicio + FILAS_POR_BLOQUE_EXCEL])
+        columnas = [
+            _valores_excel(hoja, bloque.iloc[:, posicion])
+            for posicion in range(bloque.shape[1])
+        ]
+        for fila in zip(*columnas):
+            hoja.append(fila)
+
+
+def _encabezado_excel(hoja, columnas) -> list:
+    """Encabezado en negrita, centrado y con bordes (como DataFrame.to_excel)."""
+    borde = Side(style="thin")
+    celdas = []
+    for columna in columnas:
+        celda = WriteOnlyCell(hoja, str(columna))
+        celda.font = Font(bold=True)
+        celda.border = Border(left=borde, right=borde, top=borde, bottom=borde)
+        celda.alignment = Alignment(horizontal="center", vertical="top")
+        celdas.append(celda)
+    return celdas
+
+
+@instrumentado()
+def escribir_hoja_excel(
+    libro: Workbook,
+    df: pd.DataFrame,
+    nombre_hoja: str,
+    max_filas: int = LIMITE_FILAS_EXCEL,
+) -> List[str]:
+    """
+    Escribe un DataFrame en una o varias hojas de un libro de solo escritura
+    (ver libro_excel).
+    Si el DataFrame excede el límite de filas de Excel se divide en hojas de
+    continuación ("Hoja (2)", "Hoja (3)", ...). Cada parte se escribe por
+    bloques a partir de vistas por posición (iloc), sin copiar el DataFrame
+    completo ni mantener la hoja en memoria.
+    Retorna la lista de hojas escritas.
+    """
+    filas_por_hoja = max_filas - 1  # Reservar la fila del encabezado
+    total_filas = len(df)
+    num_partes = max(1, -(-total_filas // filas_por_hoja))
+    nombres = nombres_hojas_divididas(nombre_hoja, num_partes)
+
+    if num_partes > 1:
+        logger.info(
+            f"'{nombre_hoja}' tiene {total_filas:,} filas; se dividirá en {num_partes} hojas"
+        )
+
+    for parte, nombre in enumerate(nombres):
+        inicio = parte * filas_por_hoja
+        fin = min(inicio + filas_por_hoja, total_filas)
+        hoja = libro.create_sheet(nombre)
+        hoja.append(_encabezado_excel(hoja, df.columns))
+        _escribir_filas(hoja, df.iloc[inicio:fin])
+
+    return nombres
+
+
+# =========================
+# MODIFICAR: Función exportar_a_excel para incluir la hoja de resumen modificada
+# =========================
+@instrumentado()
+def exportar_a_excel(
+    df_todas_sugerencias: pd.DataFrame = None,
+    df_resumen_sin_sugerencias: pd.DataFrame = None,
+    df_reporte_consumo: pd.DataFrame = None,
+) -> bytes:
+    """Exporta los reportes seleccionados a Excel"""
+    output = io.BytesIO()
+
+    with libro_excel(output) as libro:
+        # Agregar hoja "Todas las Sugerencias" si se proporciona
+        if df_todas_sugerencias is not None and not df_todas_sugerencias.empty:
+            escribir_hoja_excel(libro, df_todas_sugerencias, "Todas las Sugerencias")
+
+        # Agregar hoja "Resumen Sin Sugerencias" si se proporciona (CON LOS CAMBIOS)
+        if (
+            df_resumen_sin_sugerencias is not None
+            and not df_resumen_sin_sugerencias.empty
+        ):
+            escribir_hoja_excel(
+                libro, df_resumen_sin_sugerencias, "Resumen Sin Sugerencias"
+            )
+
+        # Agregar hoja "Reporte de Consumo" si se proporciona
+        if df_reporte_consumo is not None and not df_reporte_consumo.empty:
+            escribir_hoja_excel(libro, df_reporte_consumo, "Reporte de Consumo")
+
+    return output.getvalue()
+
+
+@instrumentado()
+def exportar_reporte_individual(df_reporte: pd.DataFrame, nombre_reporte: str) -> bytes:
+    """Exporta un solo reporte a Excel"""
+    output = io.BytesIO()
+
+    with libro_excel(output) as libro:
+        escribir_hoja_excel(libro, df_reporte, nombre_reporte)
+
+    return output.getvalue()
+
+
+# ------------------------------------------------------------------------------
+# Carga de libros de Excel (rutas o archivos subidos)
+# ------------------------------------------------------------------------------
+HOJAS_PEDIDOS = ["seg pedidos", "sheets1"]
+COLUMNAS_MINIMAS_PEDIDOS = [
+    "Pedido",
+    "Material",
+    "Centro",
+]  # ajusta si tu SAP trae otras fijas
+
+
+@instrumentado()
+def detectar_hoja_pedidos(
+    xls_principal: pd.ExcelFile, encabezados: Optional[Dict[str, list]] = None
+) -> Optional[str]:
+    """
+    Detecta la hoja de pedidos (Seg pedidos / sheets1 o por columnas mínimas).
+    `encabezados` son los de esquemas.encabezados_libro; sin ellos se lee la
+    fila de encabezados de cada hoja con pandas.
+    """
+    sheet_map = {s.strip().casefold(): s for s in xls_principal.sheet_names}
+
+    # 1) Por nombre (case-insensitive)
+    for candidato in HOJAS_PEDIDOS:
+        if candidato in sheet_map:
+            return sheet_map[candidato]
+
+    # 2) Si no coincide por nombre, detectar por columnas mínimas
+    columnas_minimas = set(COLUMNAS_MINIMAS_PEDIDOS)
+    for sh in xls_principal.sheet_names:
+        try:
+            if encabezados is not None:
+                cols = set(encabezados.get(sh, []))
+            else:
+                cols = set(pd.read_excel(xls_principal, sh, nrows=0).columns)
+            if columnas_minimas.issubset(cols):
+                return sh
+        except Exception:
+            pass
+
+    return None
+
+
+@instrumentado()
+def resolver_hoja_pedidos(
+    xls_principal: pd.ExcelFile, archivo_principal
+) -> Optional[str]:
+    """
+    Hoja de pedidos memorizada por formato de libro (nombres de hojas y sus
+    encabezados, leídos del XML): un libro con la distribución de siempre se
+    resuelve sin abrir ninguna hoja.
+    """
+    encabezados = encabezados_libro(archivo_principal)
+    if encabezados is None:
+        return detectar_hoja_pedidos(xls_principal)
+
+    firma = [f"{hoja}: {cols}" for hoja, cols in encabezados.items()]
+    reglas = {"hojas": HOJAS_PEDIDOS, "columnas": COLUMNAS_MINIMAS_PEDIDOS}
+    return esquemas_compartidos().resolver(
+        "hoja_pedidos",
+        firma,
+        reglas,
+        lambda: detectar_hoja_pedidos(xls_principal, encabezados),
+    )
+
+
+@instrumentado()
+def cargar_pedidos(archivo_principal) -> pd.DataFrame:
+    """Lee y normaliza la hoja de pedidos del archivo principal."""
+    xls_principal = pd.ExcelFile(archivo_principal)
+    hoja_pedidos = resolver_hoja_pedidos(xls_principal, archivo_principal)
+
+    if hoja_pedidos is None:
+        raise ValueError(
+            "El archivo principal debe contener la hoja 'Seg pedidos' o 'sheets1' "
+            "o una hoja con columnas mínimas: Pedido, Material, Centro.\n"
+            f"Hojas encontradas: {xls_principal.sheet_names}"
+        )
+
+    return procesar_hoja_pedidos(pd.read_excel(xls_principal, hoja_pedidos))
+
+
+PATRONES_PEDIDOS = {
+    "Gpo.Vdor.": [
+        "gpo.vdor",
+        "gpo. vdor",
+        "gpo vdor",
+        "grupo vendedor",
+        "gpo vendedor",
+        "vdor",
+    ],
+}
+
+
+@instrumentado()
+def procesar_hoja_pedidos(pedidos_df: pd.DataFrame) -> pd.DataFrame:
+    """Normaliza columnas, "Gpo.Vdor." e IDs de la hoja de pedidos."""
+    # Normalizar columnas del archivo principal (sin modificar el recibido)
+    pedidos_df = normalizar_nombres_columnas(pedidos_df)
+
+    # Normalizar "Gpo.Vdor." (memorizado por formato de archivo)
+    col_gpo_vdor = resolver_columnas("pedidos", pedidos_df.columns, PATRONES_PEDIDOS)[
+        "mapeo"
+    ].get("Gpo.Vdor.")
+
+    if "Gpo.Vdor." not in pedidos_df.columns:
+        if col_gpo_vdor:
+            # Renombrar sobre la copia superficial (sin copiar los datos)
+            pedidos_df.columns = [
+                "Gpo.Vdor." if col == col_gpo_vdor else col
+                for col in pedidos_df.columns
+            ]
+        else:
+            pedidos_df["Gpo.Vdor."] = ""
+
+    # Limpieza (por si viene numérico/NaN)
+    pedidos_df["Gpo.Vdor."] = (
+        pedidos_df["Gpo.Vdor."].astype(str).str.strip().replace({"nan": "", "None": ""})
+    )
+
+    # Normalizar IDs
+    for col in ["Centro", "Material", "Almacén"]:
+        if col in pedidos_df.columns:
+            pedidos_df[col] = normalizar_ids(pedidos_df[col])
+
+    return pedidos_df
+
+
+@instrumentado()
+def cargar_inventario(
+    archivo_inventario, avisar: Optional[Aviso] = None, agregado: bool = False
+) -> pd.DataFrame:
+    """
+    Lee la hoja de inventario y aplica el ajuste de 'Entrega a cliente'. Con
+    `agregado`, una fila por Centro/Material/Almacén (ver agregar_inventario).
+    """
+    avisar = avisar or _aviso_por_defecto
+    xls_inventario = pd.ExcelFile(archivo_inventario)
+
+    # Buscar hoja de inventario
+    hoja_inventario = None
+    for hoja in xls_inventario.sheet_names:
+        if "inventario" in hoja.lower() or "sheets1" in hoja.lower():
+            hoja_inventario = hoja
+            break
+
+    if hoja_inventario is None:
+        # Intentar con la primera hoja
+        hoja_inventario = xls_inventario.sheet_names[0]
+        avisar(f"Usando hoja '{hoja_inventario}' como inventario")
+
+    df_inventario_raw = pd.read_excel(xls_inventario, hoja_inventario)
+
+    # Aplicar procesamiento especial con cálculo
+    return procesar_hoja_inventario_ajustada(
+        df_inventario_raw, avisar=avisar, agregado=agregado
+    )
+
+
+@instrumentado()
+def cargar_hojas_externas(
+    archivo_externas, avisar: Optional[Aviso] = None, depuracion: bool = False
+) -> Dict[str, pd.DataFrame]:
+    """Lee y normaliza las hojas externas reconocidas (Corta caducidad, Lento mov, etc.)."""
+    avisar = avisar or _aviso_por_defecto
+    xls_externas = pd.ExcelFile(archivo_externas)
+    hojas_externas = {}
+
+    # Lista de hojas a procesar (excluyendo posibles hojas de inventario)
+    hojas_a_procesar = [
+        hoja for hoja in xls_externas.sheet_names if "inventario" not in hoja.lower()
+    ]
+
+    for hoja in hojas_a_procesar:
+        if hoja in FUENTES_DISPONIBLES:
+            df_hoja = pd.read_excel(xls_externas, hoja)
+
+            if depuracion:
+                avisar(f"**Hoja '{hoja}'**: {len(df_hoja)} filas")
+                avisar(f"Columnas: {df_hoja.columns.tolist()}")
+
+            hojas_externas[hoja] = procesar_hoja_externa(df_hoja, hoja)
+            avisar(f"  ✓ {hoja}: {len(hojas_externas[hoja])} registros")
+
+    return hojas_externas
+
+
+@instrumentado()
+def cargar_facturacion(
+    archivo_facturacion,
+    avisar: Optional[Aviso] = None,
+    clave_dedup: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """Lee y normaliza la hoja de facturación (ver procesar_datos_facturacion)."""
+    avisar = avisar or _aviso_por_defecto
+    xls_facturacion = pd.ExcelFile(archivo_facturacion)
+
+    # Buscar hoja de facturación
+    hoja_facturacion = None
+    for hoja in xls_facturacion.sheet_names:
+        if "facturacion" in hoja.lower() or "sheets1" in hoja.lower():
+            hoja_facturacion = hoja
+            break
+
+    if hoja_facturacion is None:
+        # Intentar con la primera hoja
+        hoja_facturacion = xls_facturacion.sheet_names[0]
+        avisar(f"Usando hoja '{hoja_facturacion}' como facturación")
+
+    df_facturacion_raw = pd.read_excel(xls_facturacion, hoja_facturacion)
+    return procesar_datos_facturacion(
+        df_facturacion_raw, avisar=avisar, clave_dedup=clave_dedup
+    )
+
+
+# ------------------------------------------------------------------------------
+# Carga compartida entre sesiones
+# ------------------------------------------------------------------------------
+def leer_contenido(archivo) -> bytes:
+    """Bytes de un archivo dado como ruta, bytes o archivo abierto (p. ej. subido)."""
+    if isinstance(archivo, bytes):
+        return archivo
+    if isinstance(archivo, (str, os.PathLike)):
+        with open(archivo, "rb") as f:
+            return f.read()
+    if hasattr(archivo, "getvalue"):
+        return archivo.getvalue()
+    posicion = archivo.tell()
+    contenido = archivo.read()
+    archivo.seek(posicion)
+    return contenido
+
+
+@instrumentado()
+def cargar_compartido(
+    cargador: Callable, archivo, avisar: Optional[Aviso] = None, **kwargs
+):
+    """
+    Ejecuta `cargador(archivo, avisar=..., **kwargs)` (cargar_inventario,
+    cargar_hojas_externas, ...) una sola vez por contenido en todo el proceso.
+    Las demás sesiones reciben una vista de solo lectura del mismo resultado.
+    """
+    avisar = avisar or _aviso_por_defecto
+    contenido = leer_contenido(archivo)
+    # Una carga en depuración se guarda aparte: sus avisos por hoja salen del
+    # propio cargador y no se repetirían con el resultado de una carga normal
+    opciones = sorted(
+        (k, v) for k, v in kwargs.items() if not (k == "depuracion" and not v)
+    )
+    clave = (cargador.__name__, huella_contenido(contenido, opciones))
+
+    cache = cache_compartido()
+    calculado = []
+
+    def cargar():
+        calculado.append(True)
+        return cargador(io.BytesIO(contenido), avisar=avisar, **kwargs)
+
+    resultado = cache.obtener_o_calcular(clave, cargar)
+    if not calculado:
+        avisar(f"♻️ {cargador.__name__}: datos reutilizados de la caché compartida")
+    return vista_lectura(resultado)
+
+
+# ------------------------------------------------------------------------------
+# Ejecución completa (sin interfaz)
+# ------------------------------------------------------------------------------
+@instrumentado()
+def generar_reportes(
+    pedidos_df: pd.DataFrame,
+    inventario_df: pd.DataFrame,
+    hojas_externas: Dict[str, pd.DataFrame],
+    fuentes_activas: List[str],
+    df_facturacion_procesado: Optional[pd.DataFrame] = None,
+    generar_sugerencias: bool = True,
+    generar_resumen: bool = True,
+    generar_consumo: bool = False,
+    avisar: Optional[Aviso] = None,
+    progreso: Optional[Progreso] = None,
+    al_generar: Optional[Callable[[str, pd.DataFrame], None]] = None,
+    cubo_facturacion: Optional[FacturacionCube] = None,
+    fecha_corte=None,
+    max_candidatos: Optional[int] = None,
+    criterio_candidatos: str = "caducidad",
+    centros: Optional[CentrosAlmacenes] = None,
+    corrida_anterior: Optional[Dict[str, object]] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Ejecuta las etapas del pipeline en el mismo orden que la interfaz.
+    Retorna un diccionario con los reportes generados ("consumo", "sugerencias",
+    "resumen"); los reportes no solicitados o vacíos se omiten. "sugerencias"
+    es un SugerenciasCompactas: usar formato_ancho() para mostrarlo o
+    exportarlo.
+    Si se indica `al_generar(clave, df)`, se llama en cuanto cada reporte está
+    listo, para mostrar resultados parciales.
+    Los reportes de consumo comparten un solo `FacturacionCube`: el indicado en
+    `cubo_facturacion` (p. ej. el del historial) o el construido a partir de
+    la facturación procesada. `fecha_corte` fija el mes actual del reporte de
+    consumo y el final de la ventana de 12 meses del resumen.
+    `max_candidatos` y `criterio_candidatos` limitan las sugerencias por línea
+    de pedido y fuente (ver generar_todas_sugerencias). `centros` define las
+    columnas por centro y almacén de las sugerencias y del resumen (por
+    defecto, CentrosAlmacenes.desde_entorno()). `corrida_anterior` se pasa a
+    generar_sugerencias_compactas.
+    """
+    avisar = avisar or _aviso_por_defecto
+    centros = centros or CentrosAlmacenes.desde_entorno()
+    reportes = {}
+
+    def agregar(clave: str, df: pd.DataFrame) -> None:
+        reportes[clave] = df
+        if al_generar is not None:
+            al_generar(clave, df)
+
+    if (
+        cubo_facturacion is None
+        and df_facturacion_procesado is not None
+        and not df_facturacion_procesado.empty
+    ):
+        cubo_facturacion = FacturacionCube.desde_facturacion(df_facturacion_procesado)
+    hay_facturacion = cubo_facturacion is not None
+
+    if generar_consumo and hay_facturacion:
+        df_reporte_consumo = generar_reporte_consumo(
+            df_facturacion_procesado,
+            progreso=progreso,
+            cubo=cubo_facturacion,
+            fecha_corte=fecha_corte,
+        )
+        if not df_reporte_consumo.empty:
+            agregar("consumo", df_reporte_consumo)
+        else:
+            avisar("No se pudo generar el reporte de consumo")
+
+    if generar_sugerencias:
+        sugerencias = generar_sugerencias_compactas(
+            pedidos_df,
+            hojas_externas,
+            fuentes_activas,
+            inventario_df,
+            progreso=progreso,
+            avisar=avisar,
+            max_candidatos=max_candidatos,
+            criterio_candidatos=criterio_candidatos,
+            centros=centros,
+            corrida_anterior=corrida_anterior,
+        )
+        if not sugerencias.empty:
+            agregar("sugerencias", sugerencias)
+        else:
+            avisar("No se generaron sugerencias")
+
+    if generar_resumen and "sugerencias" in reportes:
+        # El resumen usa solo las líneas sin sugerencia del modelo compacto
+        df_todas_sugerencias = reportes["sugerencias"]
+        df_resumen = generar_resumen_sin_sugerencias_optimizado(
+            df_todas_sugerencias,
+            inventario_df,
+            df_todas_sugerencias,
+            df_facturacion_procesado if hay_facturacion else None,
+            cubo_facturacion=cubo_facturacion,
+            fecha_corte=fecha_corte,
+            centros=centros,
+        )
+        if df_resumen is not None and not df_resumen.empty:
+            agregar("resumen", df_resumen)
+        else:
+            avisar("No se pudo generar el resumen modificado")
+
+    return reportes
+
+
+@instrumentado()
+def ejecutar_pipeline(
+    archivo_principal,
+    archivo_inventario,
+    archivo_externas,
+    archivo_facturacion=None,
+    fuentes_activas: Optional[List[str]] = None,
+    generar_sugerencias: bool = True,
+    generar_resumen: bool = True,
+    generar_consumo: bool = False,
+    avisar: Optional[Aviso] = None,
+    progreso: Optional[Progreso] = None,
+    al_generar: Optional[Callable[[str, pd.DataFrame], None]] = None,
+    historial_facturacion: Optional[str] = None,
+    fecha_corte=None,
+    max_candidatos: Optional[int] = None,
+    criterio_candidatos: str = "caducidad",
+    centros: Optional[CentrosAlmacenes] = None,
+    inventario_agregado: bool = False,
+    depuracion: bool = False,
+    clave_dedup_facturacion: Optional[List[str]] = None,
+    corrida_anterior: Optional[Dict[str, object]] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Carga los libros (rutas, archivos o bytes) y genera los reportes.
+    Es la unidad de trabajo que se ejecuta en segundo plano.
+    Con `inventario_agregado` el inventario se reduce a una fila por
+    Centro/Material/Almacén al cargarlo (ver agregar_inventario).
+    Con `depuracion` se avisan las filas y columnas de cada hoja externa.
+    `clave_dedup_facturacion` son las columnas que identifican una línea de
+    factura repetida (ver clave_dedup_facturacion).
+    Con `historial_facturacion` (directorio del historial) la facturación se acumula por mes
+    y los reportes de consumo usan todo el historial. `fecha_corte` y el límite
+    de candidatos, `centros` y `corrida_anterior` se pasan a `generar_reportes`.
+    """
+    avisar = avisar or _aviso_por_defecto
+
+    def abrir(archivo):
+        return io.BytesIO(archivo) if isinstance(archivo, bytes) else archivo
+
+    pedidos_df = cargar_pedidos(abrir(archivo_principal))
+    avisar(f"✅ Archivo principal procesado: {len(pedidos_df)} pedidos cargados")
+
+    inventario_df = cargar_compartido(
+        cargar_inventario,
+        archivo_inventario,
+        avisar=avisar,
+        agregado=inventario_agregado,
+    )
+    avisar(f"✅ Inventario procesado: {len(inventario_df)} registros")
+
+    hojas_externas = {}
+    if generar_sugerencias:
+        hojas_externas = cargar_compartido(
+            cargar_hojas_externas,
+            archivo_externas,
+            avisar=avisar,
+            depuracion=depuracion,
+        )
+    avisar(f"✅ Archivo externo procesado: {len(hojas_externas)} hojas cargadas")
+
+    df_facturacion_procesado = None
+    if generar_consumo and archivo_facturacion is not None:
+        df_facturacion_procesado = cargar_compartido(
+            cargar_facturacion,
+            archivo_facturacion,
+            avisar=avisar,
+            clave_dedup=clave_dedup_facturacion,
+        )
+        avisar(f"✅ Facturación procesada: {len(df_facturacion_procesado)} registros")
+
+    cubo_facturacion = None
+    if df_facturacion_procesado is not None and not df_facturacion_procesado.empty:
+        cubo_facturacion = FacturacionCube.desde_facturacion(df_facturacion_procesado)
+    if generar_consumo and historial_facturacion:
+        cubo_facturacion = actualizar_historial_facturacion(
+            historial_facturacion, cubo_facturacion, avisar=avisar
+        )
+
+    return generar_reportes(
+        pedidos_df,
+        inventario_df,
+        hojas_externas,
+        fuentes_activas if fuentes_activas is not None else FUENTES_DISPONIBLES,
+        df_facturacion_procesado,
+        generar_sugerencias=generar_sugerencias,
+        generar_resumen=generar_resumen,
+        generar_consumo=generar_consumo,
+        avisar=avisar,
+        progreso=progreso,
+        al_generar=al_generar,
+        cubo_facturacion=cubo_facturacion,
+        fecha_corte=fecha_corte,
+        max_candidatos=max_candidatos,
+        criterio_candidatos=criterio_candidatos,
+        centros=centros,
+        corrida_anterior=corrida_anterior,
+    )
@@ -0,0 +1,142 @@
+"""
+Reporte de progreso con límite de frecuencia.
+
+Los procesos largos llaman `avanzar()` por cada elemento, pero el callback de
+progreso (por ejemplo la barra de Streamlit, que envía un mensaje al navegador
+en cada actualización) solo se invoca cuando pasó un intervalo mínimo de
+tiempo Y el avance cambió al menos un porcentaje mínimo, además de al terminar.
+El texto incluye el ritmo (elementos/s) y el tiempo estimado restante.
+
+Es seguro llamarlo desde varios hilos, para etapas paralelas o por bloques.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+Progreso = Callable[[float, str], None]
+
+
+def formatear_duracion(segundos: float) -> str:
+    """Formatea segundos como m:ss o h:mm:ss."""
+    segundos = int(round(max(segundos, 0)))
+    horas, resto = divmod(segundos, 3600)
+    minutos, segundos = divmod(resto, 60)
+    if horas:
+        return f"{horas}:{minutos:02d}:{segundos:02d}"
+    return f"{minutos}:{segundos:02d}"
+
+
+class ReporteProgreso:
+    """
+    Acumula el avance de un proceso y reporta con frecuencia limitada.
+
+    progreso:     callback (fraccion, texto); None para no reportar nada
+    total:        número de elementos (o 1.0 para etapas por fracción)
+    texto:        descripción del proceso ("Procesando pedido")
+    unidad:       nombre de los elementos para el ritmo ("líneas"); None lo omite
+    intervalo:    segundos mínimos entre actualizaciones
+    paso_minimo:  cambio mínimo de la fracción entre actualizaciones
+    """
+
+    def __init__(
+        self,
+        progreso: Optional[Progreso],
+        total: float,
+        texto: str = "Procesando",
+        unidad: Optional[str] = "líneas",
+        intervalo: float = 0.25,
+        paso_minimo: float = 0.01,
+    ):
+        self.progreso = progreso
+        self.total = total
+        self.texto = texto
+        self.unidad = unidad
+        self.intervalo = intervalo
+        self.paso_minimo = paso_minimo
+        self.completado = 0
+        self.actualizaciones = 0
+        self._inicio = time.perf_counter()
+        self._ultimo_tiempo = float("-inf")
+        self._ultima_fraccion = -1.0
+        self._lock = threading.Lock()
+
+    # --------------------------------------------------------------
+    # Métricas
+    # --------------------------------------------------------------
+    @property
+    def fraccion(self) -> float:
+        if not self.total:
+            return 1.0
+        return min(self.completado / self.total, 1.0)
+
+    @property
+    def transcurrido(self) -> float:
+        return time.perf_counter() - self._inicio
+
+    @property
+    def ritmo(self) -> float:
+        """Elementos procesados por segundo."""
+        transcurrido = self.transcurrido
+        return self.completado / transcurrido if transcurrido > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Segundos estimados para terminar (None si aún no hay avance)."""
+        fraccion = self.fraccion
+        if fraccion <= 0:
+            return None
+        return self.transcurrido * (1 - fraccion) / fraccion
+
+    def describir(self) -> str:
+        """Texto con avance, ritmo y tiempo estimado restante."""
+        partes = []
+        if self.unidad is not None:
+            partes.append(
+                f"{self.texto} {int(self.completado):,} de {int(self.total):,}"
+            )
+            partes.append(f"{self.ritmo:,.0f} {self.unidad}/s")
+        else:
+            partes.append(self.texto)
+        eta = self.eta
+        if eta is not None and self.fraccion < 1:
+            partes.append(f"ETA {formatear_duracion(eta)}")
+        return " · ".join(partes)
+
+    # --------------------------------------------------------------
+    # Avance
+    # --------------------------------------------------------------
+    def avanzar(self, cantidad: float = 1, texto: Optional[str] = None) -> None:
+        """Suma `cantidad` elementos procesados."""
+        with self._lock:
+            self.completado += cantidad
+            self._reportar(texto, forzar=False)
+
+    def fijar(self, completado: float, texto: Optional[str] = None) -> None:
+        """Fija el avance absoluto (para etapas que reportan por fracción)."""
+        with self._lock:
+            self.completado = completado
+            # Un cambio de texto indica una etapa nueva: mostrarlo siempre
+            self._reportar(texto, forzar=texto is not None)
+
+    def finalizar(self) -> None:
+        with self._lock:
+            self.completado = self.total
+            self._reportar(None, forzar=True)
+
+    def _reportar(self, texto: Optional[str], forzar: bool) -> None:
+        if texto is not None:
+            self.texto = texto
+        if self.progreso is None:
+            return
+        ahora = time.perf_counter()
+        fraccion = self.fraccion
+        if not forzar and fraccion < 1:
+            if ahora - self._ultimo_tiempo < self.intervalo:
+                return
+            if fraccion - self._ultima_fraccion < self.paso_minimo:
+                return
+        self._ultimo_tiempo = ahora
+        self._ultima_fraccion = fraccion
+        self.actualizaciones += 1
+        self.progreso(fraccion, self.describir())
@@ -0,0 +1,254 @@
+"""
+Medición de tiempos y memoria por etapa del pipeline.
+
+Uso:
+    registro = RegistroRendimiento(memoria=True)
+    with sesion_rendimiento(registro):
+        ...  # cualquier función decorada con @instrumentado o bloque `with medir()`
+    registro.resumen()   # lista de dicts por etapa
+    registro.a_json()    # mismo contenido serializado
+
+El registro activo se guarda en un ContextVar, por lo que cada sesión de
+Streamlit (un hilo por ejecución) o cada ejecución sin interfaz mide lo suyo.
+Sin una sesión activa, `medir` e `@instrumentado` no hacen nada más que
+consultar el ContextVar.
+
+tracemalloc es global al proceso: lo inicia la primera sesión con memoria y lo
+detiene la última (si no estaba activo antes). Su pico tampoco distingue
+hilos, así que las etapas medidas mientras hay otra sesión con memoria activa
+no registran memoria (solo tiempo).
+"""
+
+import contextvars
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource  # No disponible en Windows
+except ImportError:  # pragma: no cover
+    resource = None
+
+_registro_actual: contextvars.ContextVar = contextvars.ContextVar(
+    "registro_rendimiento", default=None
+)
+
+# Sesiones con memoria activas en el proceso (comparten tracemalloc)
+_lock_tracemalloc = threading.Lock()
+_sesiones_memoria = 0
+_tracemalloc_propio = False
+# Aumenta cada vez que dos sesiones con memoria se solapan: una etapa que vio
+# cambiar este número no puede atribuirse el pico
+_solapamientos = 0
+
+
+def _iniciar_tracemalloc() -> None:
+    global _sesiones_memoria, _tracemalloc_propio, _solapamientos
+    with _lock_tracemalloc:
+        if _sesiones_memoria == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_propio = True
+        _sesiones_memoria += 1
+        if _sesiones_memoria > 1:
+            _solapamientos += 1
+
+
+def _detener_tracemalloc() -> None:
+    global _sesiones_memoria, _tracemalloc_propio
+    with _lock_tracemalloc:
+        _sesiones_memoria -= 1
+        if _sesiones_memoria == 0 and _tracemalloc_propio:
+            tracemalloc.stop()
+            _tracemalloc_propio = False
+
+
+def _memoria_exclusiva() -> Optional[int]:
+    """
+    Identificador del periodo sin solapamientos en curso, o None si hay otra
+    sesión con memoria activa (el pico de tracemalloc no sería de esta).
+    """
+    if _sesiones_memoria > 1 or not tracemalloc.is_tracing():
+        return None
+    return _solapamientos
+
+
+def _rss_pico_mb() -> Optional[float]:
+    """Memoria residente máxima del proceso (MB), si el sistema la reporta."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB; macOS reporta bytes
+    return round(pico / 1024 if pico < 1 << 32 else pico / (1024 * 1024), 1)
+
+
+class _Marco:
+    """Etapa en curso (para anidar mediciones de memoria)."""
+
+    __slots__ = ("nombre", "inicio", "memoria_inicial", "pico", "periodo")
+
+    def __init__(self, nombre: str, memoria_inicial: int, periodo: Optional[int]):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.memoria_inicial = memoria_inicial
+        self.pico = memoria_inicial
+        self.periodo = periodo
+
+
+class RegistroRendimiento:
+    """Acumula tiempo, número de llamadas y memoria por nombre de etapa."""
+
+    def __init__(self, memoria: bool = False):
+        self.memoria = memoria
+        self._estadisticas: Dict[str, Dict[str, float]] = {}
+        self._pila: List[_Marco] = []
+        self._lock = threading.Lock()
+        self._sesiones = 0
+
+    # --------------------------------------------------------------
+    # Ciclo de vida
+    # --------------------------------------------------------------
+    def iniciar(self) -> None:
+        if self.memoria:
+            _iniciar_tracemalloc()
+            self._sesiones += 1
+
+    def detener(self) -> None:
+        if self._sesiones:
+            self._sesiones -= 1
+            _detener_tracemalloc()
+
+    # --------------------------------------------------------------
+    # Medición
+    # --------------------------------------------------------------
+    def _entrar(self, nombre: str) -> _Marco:
+        memoria_inicial = 0
+        periodo = _memoria_exclusiva() if self.memoria else None
+        if periodo is not None:
+            actual, pico = tracemalloc.get_traced_memory()
+            # Conservar el pico observado por la etapa padre antes de reiniciarlo
+            if self._pila:
+                self._pila[-1].pico = max(self._pila[-1].pico, pico)
+            tracemalloc.reset_peak()
+            memoria_inicial = actual
+        marco = _Marco(nombre, memoria_inicial, periodo)
+        self._pila.append(marco)
+        return marco
+
+    def _salir(self, marco: _Marco) -> None:
+        duracion = time.perf_counter() - marco.inicio
+        self._pila.pop()
+
+        delta_pico = None
+        if marco.periodo is not None and marco.periodo == _memoria_exclusiva():
+            marco.pico = max(marco.pico, tracemalloc.get_traced_memory()[1])
+            delta_pico = marco.pico - marco.memoria_inicial
+            if self._pila:
+                self._pila[-1].pico = max(self._pila[-1].pico, marco.pico)
+
+        with self._lock:
+            est = self._estadisticas.get(marco.nombre)
+            if est is None:
+                est = self._estadisticas[marco.nombre] = {
+                    "llamadas": 0,
+                    "segundos": 0.0,
+                    "max_segundos": 0.0,
+                    "memoria_pico_mb": None,
+                }
+            est["llamadas"] += 1
+            est["segundos"] += duracion
+            est["max_segundos"] = max(est["max_segundos"], duracion)
+            if delta_pico is not None:
+                est["memoria_pico_mb"] = max(
+                    est["memoria_pico_mb"] or 0.0, delta_pico / (1024 * 1024)
+                )
+
+    @contextmanager
+    def medir(self, nombre: str):
+        marco = self._entrar(nombre)
+        try:
+            yield
+        finally:
+            self._salir(marco)
+
+    # --------------------------------------------------------------
+    # Resultados
+    # --------------------------------------------------------------
+    def resumen(self) -> List[Dict[str, object]]:
+        """Estadísticas por etapa, ordenadas por tiempo total descendente."""
+        with self._lock:
+            filas = [
+                {
+                    "Etapa": nombre,
+                    "Llamadas": int(est["llamadas"]),
+                    "Segundos": round(est["segundos"], 4),
+                    "Promedio (ms)": round(est["segundos"] / est["llamadas"] * 1000, 3),
+                    "Máximo (s)": round(est["max_segundos"], 4),
+                    "Memoria pico (MB)": (
+                        round(est["memoria_pico_mb"], 2)
+                        if est["memoria_pico_mb"] is not None
+                        else None
+                    ),
+                }
+                for nombre, est in self._estadisticas.items()
+            ]
+        return sorted(filas, key=lambda f: f["Segundos"], reverse=True)
+
+    def a_json(self) -> str:
+        return json.dumps(
+            {"rss_pico_mb": _rss_pico_mb(), "etapas": self.resumen()},
+            indent=2,
+            ensure_ascii=False,
+        )
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._estadisticas.clear()
+
+
+@contextmanager
+def sesion_rendimiento(registro: Optional[RegistroRendimiento]):
+    """Activa `registro` para el contexto actual; con None no mide nada."""
+    if registro is None:
+        yield None
+        return
+    registro.iniciar()
+    token = _registro_actual.set(registro)
+    try:
+        yield registro
+    finally:
+        _registro_actual.reset(token)
+        registro.detener()
+
+
+@contextmanager
+def medir(nombre: str):
+    """Mide un bloque con el registro activo (si lo hay)."""
+    registro = _registro_actual.get()
+    if registro is None:
+        yield
+        return
+    with registro.medir(nombre):
+        yield
+
+
+def instrumentado(nombre: Optional[str] = None) -> Callable:
+    """Decorador que mide cada llamada a la función con el registro activo."""
+
+    def decorador(funcion: Callable) -> Callable:
+        etiqueta = nombre or funcion.__name__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            registro = _registro_actual.get()
+            if registro is None:
+                return funcion(*args, **kwargs)
+            with registro.medir(etiqueta):
+                return funcion(*args, **kwargs)
+
+        return envoltura
+
+    return decorador
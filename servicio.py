@@ -0,0 +1,505 @@
+"""
+Servicio HTTP local del sugeridor de materiales.
+
+Otras herramientas (p. ej. los scripts de la mesa de pedidos) necesitan las
+sugerencias de unas pocas líneas de pedido a la vez. Con la interfaz de
+Streamlit cada consulta implica cargar y normalizar los libros completos.
+`ServicioSugerencias` carga una sola vez el inventario y las hojas externas de
+un directorio (la instantánea), deja listos en memoria sus índices por
+material y responde consultas JSON:
+
+    GET  /estado        versión de la instantánea, archivos y filas cargadas
+    POST /sugerencias   una línea de pedido, una lista de líneas o
+                        {"lineas": [...], "fuentes": [...], "max_candidatos": N,
+                         "criterio_candidatos": "caducidad"}
+    POST /recargar      vuelve a leer el directorio
+
+Cada línea de pedido es un objeto con las columnas de la hoja de pedidos
+("Pedido", "Material", "Centro", "Almacén", "Pendiente", ...). La respuesta
+trae, por línea y en el mismo orden, sus sugerencias con las columnas de
+"Todas las Sugerencias".
+
+El directorio se revisa cada `intervalo` segundos: cuando cambia un libro (y su
+firma se mantiene entre dos revisiones, es decir, terminó de copiarse) se carga
+una instantánea nueva y se reemplaza la anterior sin interrumpir las consultas
+en curso. Si la carga falla se conserva la instantánea anterior.
+
+Solo usa la biblioteca estándar y escucha en 127.0.0.1 por defecto.
+
+Ejemplo:
+    python servicio.py datos/ --puerto 8765
+    curl -s localhost:8765/sugerencias \\
+        -d '{"Pedido": "4500", "Material": "100234", "Centro": "1001",
+             "Almacén": "1030", "Pendiente": 10}'
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from cache_compartido import huella_entradas, indice_por_columna
+from motor import (
+    CRITERIOS_CANDIDATOS,
+    FUENTES_DISPONIBLES,
+    CentrosAlmacenes,
+    cargar_hojas_externas,
+    cargar_inventario,
+    generar_sugerencias_compactas,
+    procesar_hoja_pedidos,
+)
+
+logger = logging.getLogger("sugeridor.servicio")
+
+EXTENSIONES_LIBROS = (".xlsx", ".xls")
+# Tipo de libro -> texto que debe contener el nombre del archivo
+PATRONES_ARCHIVOS = {"inventario": "inventario", "externas": "extern"}
+LIMITE_LINEAS_POR_CONSULTA = 10_000
+
+
+# ------------------------------------------------------------------------------
+# Instantánea de inventario y fuentes
+# ------------------------------------------------------------------------------
+def libros_directorio(
+    directorio: str, patrones: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Ruta del libro más reciente de cada tipo de `patrones` (tipo -> texto del
+    nombre; por defecto PATRONES_ARCHIVOS) en el directorio. Se ignoran los
+    archivos temporales de Excel '~$...'.
+    """
+    patrones = patrones or PATRONES_ARCHIVOS
+    candidatos: Dict[str, tuple] = {}
+    for nombre in os.listdir(directorio):
+        minusculas = nombre.lower()
+        if nombre.startswith("~$") or not minusculas.endswith(EXTENSIONES_LIBROS):
+            continue
+        ruta = os.path.join(directorio, nombre)
+        for tipo, patron in patrones.items():
+            if patron in minusculas:
+                modificado = os.stat(ruta).st_mtime_ns
+                if tipo not in candidatos or modificado > candidatos[tipo][0]:
+                    candidatos[tipo] = (modificado, ruta)
+                break
+    return {tipo: ruta for tipo, (_, ruta) in candidatos.items()}
+
+
+def firma_libros(libros: Dict[str, str]) -> tuple:
+    """Ruta, tamaño y fecha de modificación de cada libro."""
+    firma = []
+    for tipo in sorted(libros):
+        estado = os.stat(libros[tipo])
+        firma.append((tipo, libros[tipo], estado.st_size, estado.st_mtime_ns))
+    return tuple(firma)
+
+
+class Instantanea:
+    """Inventario y hojas externas cargados, con sus índices por material."""
+
+    def __init__(
+        self,
+        version: int,
+        libros: Dict[str, str],
+        firma: tuple,
+        inventario_df: pd.DataFrame,
+        hojas_externas: Dict[str, pd.DataFrame],
+    ):
+        self.version = version
+        self.libros = libros
+        self.firma = firma
+        self.inventario_df = inventario_df
+        self.hojas_externas = hojas_externas
+        self.cargada = time.time()
+        # La huella de las fuentes se calcula una vez, no en cada consulta
+        self.huella = huella_entradas(inventario_df, hojas_externas)
+
+    @classmethod
+    def cargar(
+        cls, directorio: str, version: int, inventario_agregado: bool = False
+    ) -> "Instantanea":
+        libros = libros_directorio(directorio)
+        faltantes = [tipo for tipo in PATRONES_ARCHIVOS if tipo not in libros]
+        if faltantes:
+            raise FileNotFoundError(
+                f"No se encontraron libros de {', '.join(faltantes)} en {directorio} "
+                f"(el nombre debe contener: "
+                f"{', '.join(PATRONES_ARCHIVOS[t] for t in faltantes)})"
+            )
+        firma = firma_libros(libros)
+        inventario_df = cargar_inventario(
+            libros["inventario"], avisar=logger.debug, agregado=inventario_agregado
+        )
+        hojas_externas = cargar_hojas_externas(libros["externas"], avisar=logger.debug)
+        instantanea = cls(version, libros, firma, inventario_df, hojas_externas)
+        instantanea.calentar()
+        return instantanea
+
+    def calentar(self) -> None:
+        """Construye los índices por material antes de la primera consulta."""
+        for df in [self.inventario_df, *self.hojas_externas.values()]:
+            if df is not None and "Material" in df.columns:
+                indice_por_columna(df, "Material")
+
+    def estado(self) -> Dict[str, object]:
+        return {
+            "version": self.version,
+            "cargada": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.cargada)),
+            "libros": {tipo: os.path.basename(r) for tipo, r in self.libros.items()},
+            "filas_inventario": len(self.inventario_df),
+            "fuentes": {fuente: len(df) for fuente, df in self.hojas_externas.items()},
+        }
+
+
+# ------------------------------------------------------------------------------
+# Consultas
+# ------------------------------------------------------------------------------
+def leer_consulta(consulta) -> Dict[str, object]:
+    """
+    Líneas de pedido y opciones de una consulta JSON. Lanza ValueError si la
+    consulta no es válida.
+    """
+    opciones = {}
+    if isinstance(consulta, dict) and "lineas" in consulta:
+        opciones = consulta
+        lineas = consulta["lineas"]
+    elif isinstance(consulta, dict):
+        lineas = [consulta]
+    else:
+        lineas = consulta
+
+    if not isinstance(lineas, list) or not lineas:
+        raise ValueError("Se esperaba una línea de pedido o una lista de líneas")
+    if len(lineas) > LIMITE_LINEAS_POR_CONSULTA:
+        raise ValueError(
+            f"A lo sumo {LIMITE_LINEAS_POR_CONSULTA} líneas por consulta "
+            f"(se recibieron {len(lineas)})"
+        )
+    for posicion, linea in enumerate(lineas):
+        if not isinstance(linea, dict):
+            raise ValueError(f"La línea {posicion} no es un objeto JSON")
+        faltantes = [col for col in ("Material", "Centro") if col not in linea]
+        if faltantes:
+            raise ValueError(
+                f"A la línea {posicion} le faltan columnas: {', '.join(faltantes)}"
+            )
+
+    fuentes = opciones.get("fuentes", FUENTES_DISPONIBLES)
+    if not isinstance(fuentes, list):
+        raise ValueError("fuentes debe ser una lista")
+    desconocidas = [f for f in fuentes if f not in FUENTES_DISPONIBLES]
+    if desconocidas:
+        raise ValueError(f"Fuentes desconocidas: {', '.join(desconocidas)}")
+
+    max_candidatos = opciones.get("max_candidatos")
+    # En JSON true/false llegan como bool, que en Python es subclase de int
+    if max_candidatos is not None and (
+        isinstance(max_candidatos, bool)
+        or not isinstance(max_candidatos, int)
+        or max_candidatos < 1
+    ):
+        raise ValueError("max_candidatos debe ser un entero positivo")
+
+    criterio = opciones.get("criterio_candidatos", "caducidad")
+    if criterio not in CRITERIOS_CANDIDATOS:
+        raise ValueError(
+            f"criterio_candidatos debe ser uno de: {', '.join(CRITERIOS_CANDIDATOS)}"
+        )
+
+    return {
+        "lineas": lineas,
+        "fuentes": list(fuentes),
+        "max_candidatos": max_candidatos,
+        "criterio_candidatos": criterio,
+    }
+
+
+def registros_json(df: pd.DataFrame) -> List[Dict[str, object]]:
+    """Filas como objetos JSON (fechas ISO, NaN/NaT como null)."""
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+# ------------------------------------------------------------------------------
+# Servicio
+# ------------------------------------------------------------------------------
+class ServicioSugerencias:
+    """
+    Instantánea vigente del directorio y consultas de sugerencias sobre ella.
+    Las consultas toman la instantánea vigente al empezar: una recarga
+    simultánea no las afecta.
+    """
+
+    def __init__(
+        self,
+        directorio: str,
+        intervalo: float = 30.0,
+        inventario_agregado: bool = False,
+        centros: Optional[CentrosAlmacenes] = None,
+    ):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.inventario_agregado = inventario_agregado
+        self.centros = centros or CentrosAlmacenes.desde_entorno()
+        self._instantanea: Optional[Instantanea] = None
+        self._version = 0
+        self._firma_pendiente: Optional[tuple] = None
+        self._firma_fallida: Optional[tuple] = None
+        self._lock_carga = threading.Lock()
+        self._detener = threading.Event()
+        self._vigilancia: Optional[threading.Thread] = None
+
+    @property
+    def instantanea(self) -> Instantanea:
+        instantanea = self._instantanea
+        if instantanea is None:
+            raise RuntimeError("No hay una instantánea cargada")
+        return instantanea
+
+    def recargar(self) -> Instantanea:
+        """Carga el directorio y reemplaza la instantánea vigente."""
+        with self._lock_carga:
+            inicio = time.perf_counter()
+            instantanea = Instantanea.cargar(
+                self.directorio, self._version + 1, self.inventario_agregado
+            )
+            self._version = instantanea.version
+            self._instantanea = instantanea
+            self._firma_pendiente = None
+        logger.info(
+            f"Instantánea {instantanea.version} cargada en "
+            f"{time.perf_counter() - inicio:,.1f} s: "
+            f"{len(instantanea.inventario_df)} filas de inventario, "
+            f"{len(instantanea.hojas_externas)} fuentes"
+        )
+        return instantanea
+
+    def revisar(self) -> bool:
+        """
+        Recarga si los libros del directorio cambiaron y su firma no varió
+        desde la revisión anterior. Una firma que ya falló no se reintenta
+        hasta que cambie. Retorna True si se recargó.
+        """
+        try:
+            firma = firma_libros(libros_directorio(self.directorio))
+        except OSError as e:
+            logger.warning(f"No se pudo revisar {self.directorio}: {e}")
+            return False
+
+        vigente = self._instantanea
+        if (vigente is not None and firma == vigente.firma) or (
+            firma == self._firma_fallida
+        ):
+            self._firma_pendiente = None
+            return False
+        if firma != self._firma_pendiente:
+            # Puede estar copiándose: esperar a la siguiente revisión
+            self._firma_pendiente = firma
+            return False
+        try:
+            self.recargar()
+        except Exception as e:
+            self._firma_fallida = firma
+            logger.warning(
+                f"No se pudo cargar la instantánea nueva (se conserva la "
+                f"anterior): {e}"
+            )
+            return False
+        return True
+
+    def iniciar_vigilancia(self) -> None:
+        """Revisa el directorio cada `intervalo` segundos en un hilo aparte."""
+        if self._vigilancia is not None or self.intervalo <= 0:
+            return
+
+        def vigilar():
+            while not self._detener.wait(self.intervalo):
+                self.revisar()
+
+        self._vigilancia = threading.Thread(
+            target=vigilar, name="vigilancia-instantanea", daemon=True
+        )
+        self._vigilancia.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+
+    def estado(self) -> Dict[str, object]:
+        if self._instantanea is None:
+            return {"version": 0, "directorio": self.directorio}
+        return {"directorio": self.directorio, **self._instantanea.estado()}
+
+    def sugerir(self, consulta) -> Dict[str, object]:
+        """Sugerencias de las líneas de pedido de una consulta (ver leer_consulta)."""
+        datos = leer_consulta(consulta)
+        instantanea = self.instantanea
+        inicio = time.perf_counter()
+
+        pedidos_df = procesar_hoja_pedidos(pd.DataFrame.from_records(datos["lineas"]))
+        sugerencias = generar_sugerencias_compactas(
+            pedidos_df,
+            instantanea.hojas_externas,
+            datos["fuentes"],
+            instantanea.inventario_df,
+            avisar=logger.debug,
+            max_candidatos=datos["max_candidatos"],
+            criterio_candidatos=datos["criterio_candidatos"],
+            centros=self.centros,
+            huella_fuentes=instantanea.huella,
+        )
+
+        # En el formato ancho cada línea de pedido ocupa su línea sin
+        # sugerencia seguida de sus candidatos
+        filas = registros_json(sugerencias.a_formato_ancho())
+        cantidades = np.bincount(
+            sugerencias.candidatos["_pedido"].to_numpy(), minlength=len(pedidos_df)
+        )
+        resultados = []
+        posicion = 0
+        for linea, cantidad in enumerate(cantidades):
+            resultados.append(
+                {
+                    "linea": linea,
+                    "sugerencias": filas[posicion + 1 : posicion + 1 + cantidad],
+                }
+            )
+            posicion += 1 + cantidad
+
+        return {
+            "version": instantanea.version,
+            "milisegundos": round((time.perf_counter() - inicio) * 1000, 1),
+            "resultados": resultados,
+        }
+
+
+# ------------------------------------------------------------------------------
+# HTTP
+# ------------------------------------------------------------------------------
+class ManejadorSugerencias(BaseHTTPRequestHandler):
+    """Rutas JSON de ServicioSugerencias (el servidor lleva `servicio`)."""
+
+    server_version = "Sugeridor/1.0"
+
+    def _responder(self, codigo: int, cuerpo: Dict[str, object]) -> None:
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _leer_json(self):
+        longitud = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(longitud) or b"null")
+        except ValueError as e:
+            raise ValueError(f"JSON no válido: {e}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/estado":
+            self._responder(200, self.server.servicio.estado())
+        else:
+            self._responder(404, {"error": f"Ruta desconocida: {self.path}"})
+
+    def do_POST(self):
+        servicio: ServicioSugerencias = self.server.servicio
+        ruta = self.path.rstrip("/")
+        try:
+            if ruta == "/sugerencias":
+                self._responder(200, servicio.sugerir(self._leer_json()))
+            elif ruta == "/recargar":
+                servicio.recargar()
+                self._responder(200, servicio.estado())
+            else:
+                self._responder(404, {"error": f"Ruta desconocida: {self.path}"})
+        except ValueError as e:
+            self._responder(400, {"error": str(e)})
+        except (RuntimeError, FileNotFoundError) as e:
+            self._responder(503, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"Error en {ruta}: {e}", exc_info=True)
+            self._responder(500, {"error": str(e)})
+
+    def log_message(self, formato, *args):
+        logger.debug(f"{self.address_string()} {formato % args}")
+
+
+def crear_servidor(
+    servicio: ServicioSugerencias, host: str = "127.0.0.1", puerto: int = 8765
+) -> ThreadingHTTPServer:
+    """Servidor HTTP (un hilo por conexión) ligado a `servicio`."""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorSugerencias)
+    servidor.daemon_threads = True
+    servidor.servicio = servicio
+    return servidor
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Servicio HTTP local de sugerencias sobre una instantánea "
+        "de inventario y hojas externas."
+    )
+    parser.add_argument(
+        "directorio",
+        help="Directorio con los libros de inventario (nombre con 'inventario') "
+        "y de hojas externas (nombre con 'extern')",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz de escucha")
+    parser.add_argument("--puerto", type=int, default=8765, help="Puerto")
+    parser.add_argument(
+        "--intervalo",
+        type=float,
+        default=30.0,
+        help="Segundos entre revisiones del directorio (0: sin recarga automática)",
+    )
+    parser.add_argument(
+        "--inventario-agregado",
+        action="store_true",
+        help="Reducir el inventario a una fila por Centro/Material/Almacén",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Mostrar mensajes de depuración"
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = construir_parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+    servicio = ServicioSugerencias(
+        args.directorio,
+        intervalo=args.intervalo,
+        inventario_agregado=args.inventario_agregado,
+    )
+    try:
+        servicio.recargar()
+    except (OSError, ValueError) as e:
+        logger.error(str(e))
+        return 2
+    servicio.iniciar_vigilancia()
+
+    servidor = crear_servidor(servicio, args.host, args.puerto)
+    logger.info(f"Escuchando en http://{args.host}:{args.puerto}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servicio.detener()
+        servidor.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
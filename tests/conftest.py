@@ -0,0 +1,66 @@
+"""Configuración común de las pruebas del motor."""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# Las pruebas no deben leer ni escribir los esquemas recordados del usuario
+os.environ.setdefault("SUGERIDOR_ESQUEMAS", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import motor  # noqa: E402
+from benchmarks.generador import escribir_libros, generar_conjunto  # noqa: E402
+from cache_compartido import cache_compartido  # noqa: E402
+from generar_golden import DIRECTORIO_GOLDEN, FILAS, SEMILLA  # noqa: E402
+from ingesta import guardar_parquet  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def entradas_sinteticas():
+    """Pedidos, inventario, hojas externas y facturación normalizados del
+    conjunto sintético de las salidas de referencia (ver generar_golden.py)."""
+    conjunto = generar_conjunto(FILAS, semilla=SEMILLA)
+    return {
+        "pedidos": motor.procesar_hoja_pedidos(conjunto["pedidos"]),
+        "inventario": motor.procesar_hoja_inventario_ajustada(conjunto["inventario"]),
+        "externas": {
+            nombre: motor.procesar_hoja_externa(hoja, nombre)
+            for nombre, hoja in conjunto["externas"].items()
+        },
+        "facturacion": motor.procesar_datos_facturacion(conjunto["facturacion"]),
+    }
+
+
+@pytest.fixture(scope="session")
+def libros_sinteticos(tmp_path_factory):
+    """Rutas de los cuatro libros de Excel de un conjunto sintético pequeño."""
+    directorio = tmp_path_factory.mktemp("libros")
+    return escribir_libros(generar_conjunto(200, semilla=SEMILLA), str(directorio))
+
+
+@pytest.fixture
+def cache_limpia():
+    """Vacía la caché compartida (fragmentos, líneas de pedido, libros)."""
+    cache_compartido().limpiar()
+    yield cache_compartido()
+    cache_compartido().limpiar()
+
+
+@pytest.fixture
+def como_golden(tmp_path):
+    """Pasa un reporte por Parquet como las salidas de referencia."""
+
+    def convertir(df: pd.DataFrame, nombre: str = "reporte") -> pd.DataFrame:
+        df = motor.fechas_como_texto(motor.formato_ancho(df))
+        ruta = tmp_path / f"{nombre}.parquet"
+        guardar_parquet(df.reset_index(drop=True), str(ruta))
+        return pd.read_parquet(ruta)
+
+    return convertir
+
+
+def leer_golden(nombre: str) -> pd.DataFrame:
+    return pd.read_parquet(os.path.join(DIRECTORIO_GOLDEN, f"{nombre}.parquet"))
@@ -0,0 +1,174 @@
+"""
+Genera las salidas de referencia de tests/golden con el motor original.
+
+El motor de la versión base (app.py del commit REVISION_BASE, antes de separar
+motor.py) se ejecuta sin interfaz sobre el conjunto sintético de
+benchmarks.generador (FILAS líneas, SEMILLA) y sus reportes se guardan en
+Parquet. test_golden.py compara contra ellos el motor actual.
+
+Sobre la salida original se aplican solo los cambios de comportamiento
+documentados en el historial:
+- El "mes actual" del reporte de consumo se fija en FECHA_CORTE (el original
+  usa la fecha del día; el motor actual recibe fecha_corte), dentro del último
+  mes facturado para que la ventana del resumen sea la misma.
+- El promedio de 12 meses del resumen cubre los 12 meses calendario que
+  terminan en el último mes facturado (el original cortaba el primer mes en
+  el día de la última factura).
+- La facturación llega sin líneas repetidas (deduplicar_facturacion las quita
+  al cargar; el original solo las quitaba en el reporte de consumo).
+- Las líneas combinadas ("Lento mov/<fuente>", "Sustituto/<fuente>") llevan
+  la fecha de caducidad de la hoja de la fuente (el original volvía a leer el
+  texto dd/mm/aaaa sin dayfirst e intercambiaba día y mes).
+
+Solo hace falta volver a generarlos si cambia el generador o un
+comportamiento a propósito (desde la raíz del repositorio, requiere git):
+    python tests/generar_golden.py
+"""
+
+import importlib.util
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+from typing import Dict
+
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.generador import generar_conjunto  # noqa: E402
+
+REVISION_BASE = "716d052"
+FILAS = 1000
+SEMILLA = 0
+FECHA_CORTE = "2026-09-30"
+DIRECTORIO_GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+REPORTES = ["sugerencias", "resumen", "consumo"]
+
+# Cambios de comportamiento documentados, aplicados al código original
+REEMPLAZOS_BASE = {
+    "pd.Timestamp.now()": f"pd.Timestamp('{FECHA_CORTE}')",
+    "fecha_inicio_12m = fecha_maxima - pd.DateOffset(months=12)": (
+        "fecha_inicio_12m = (fecha_maxima - pd.DateOffset(months=11))"
+        ".to_period('M').to_timestamp()"
+    ),
+}
+
+
+def cargar_motor_base():
+    """Importa app.py de REVISION_BASE en modo sin interfaz de Streamlit."""
+    fuente = subprocess.check_output(
+        ["git", "show", f"{REVISION_BASE}:app.py"], cwd=RAIZ, text=True
+    )
+    for original, reemplazo in REEMPLAZOS_BASE.items():
+        assert fuente.count(original) == 1, original
+        fuente = fuente.replace(original, reemplazo)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "app_base.py")
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(fuente)
+        spec = importlib.util.spec_from_file_location("app_base", ruta)
+        base = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(base)
+    return base
+
+
+def _pedidos_base(base, pedidos_df: pd.DataFrame) -> pd.DataFrame:
+    """Normalización de la hoja de pedidos que el original hacía en la interfaz."""
+    pedidos_df = pedidos_df.copy()
+    pedidos_df.columns = [
+        col.replace("Almacen", "Almacén").replace("Almaçen", "Almacén")
+        for col in pedidos_df.columns
+    ]
+    col_gpo_vdor = base.encontrar_columna_por_patron(
+        pedidos_df,
+        patrones=[
+            "gpo.vdor",
+            "gpo. vdor",
+            "gpo vdor",
+            "grupo vendedor",
+            "gpo vendedor",
+            "vdor",
+        ],
+    )
+    if "Gpo.Vdor." not in pedidos_df.columns:
+        pedidos_df["Gpo.Vdor."] = pedidos_df[col_gpo_vdor] if col_gpo_vdor else ""
+    pedidos_df["Gpo.Vdor."] = (
+        pedidos_df["Gpo.Vdor."].astype(str).str.strip().replace({"nan": "", "None": ""})
+    )
+    for col in ["Centro", "Material", "Almacén"]:
+        if col in pedidos_df.columns:
+            pedidos_df[col] = base.normalizar_ids(pedidos_df[col])
+    return pedidos_df
+
+
+def _fechas_fuente(sugerencias: pd.DataFrame, hojas: Dict[str, pd.DataFrame]):
+    """Fecha de caducidad de las líneas combinadas según la hoja de su fuente."""
+    sugerencias = sugerencias.copy()
+    combinadas = sugerencias["Fuente"].str.contains("/", regex=False)
+    for posicion in sugerencias.index[combinadas]:
+        fila = sugerencias.loc[posicion]
+        hoja = hojas[fila["Fuente"].split("/", 1)[1]]
+        coincide = (
+            (hoja["Material"] == fila["Material sugerido"])
+            & (hoja["Centro"] == fila["Centro sugerido"])
+            & (hoja["Almacén"].astype(str).str.strip() == fila["Almacén sugerido"])
+            & (hoja["Lote"].astype(str).str.strip() == fila["Lote"])
+        )
+        fechas = hoja.loc[coincide, "FechaCaducidad"].unique()
+        assert len(fechas) == 1, fila
+        sugerencias.loc[posicion, "Fecha de Caducidad"] = fechas[0]
+    return sugerencias
+
+
+def generar_reportes_base() -> Dict[str, pd.DataFrame]:
+    """Reportes del motor original sobre el conjunto sintético."""
+    base = cargar_motor_base()
+    conjunto = generar_conjunto(FILAS, semilla=SEMILLA)
+
+    pedidos_df = _pedidos_base(base, conjunto["pedidos"])
+    inventario_df = base.procesar_hoja_inventario_ajustada(
+        conjunto["inventario"].copy()
+    )
+    hojas_externas = {
+        nombre: base.procesar_hoja_externa(hoja.copy(), nombre)
+        for nombre, hoja in conjunto["externas"].items()
+    }
+    df_facturacion = base.procesar_datos_facturacion(
+        conjunto["facturacion"].drop_duplicates()
+    )
+
+    sugerencias = base.generar_todas_sugerencias(
+        pedidos_df, hojas_externas, base.fuentes_disponibles, inventario_df
+    )
+    resumen = base.generar_resumen_sin_sugerencias_optimizado(
+        sugerencias, inventario_df, sugerencias, df_facturacion
+    )
+    return {
+        "sugerencias": _fechas_fuente(sugerencias, hojas_externas),
+        "resumen": resumen,
+        "consumo": base.generar_reporte_consumo(df_facturacion),
+    }
+
+
+def main() -> int:
+    from ingesta import guardar_parquet
+
+    warnings.filterwarnings("ignore")
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    os.makedirs(DIRECTORIO_GOLDEN, exist_ok=True)
+    for nombre, df in generar_reportes_base().items():
+        ruta = os.path.join(DIRECTORIO_GOLDEN, f"{nombre}.parquet")
+        guardar_parquet(df.reset_index(drop=True), ruta)
+        print(f"{nombre}: {len(df)} filas -> {ruta}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
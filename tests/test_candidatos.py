@@ -0,0 +1,78 @@
+"""Límite de candidatos por línea de pedido y fuente (max_candidatos)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor
+from conftest import leer_golden
+from motor import Columnas
+
+
+def _sugerencias(entradas, **opciones):
+    compactas = motor.generar_sugerencias_compactas(
+        entradas["pedidos"],
+        entradas["externas"],
+        motor.FUENTES_DISPONIBLES,
+        entradas["inventario"],
+        **opciones,
+    )
+    ancho = motor.formato_ancho(compactas).reset_index(drop=True)
+    # Número de línea de pedido de cada fila del formato ancho
+    linea = np.repeat(np.arange(len(compactas.pedidos)), compactas.lineas_por_pedido())
+    return ancho.assign(_linea=linea)
+
+
+@pytest.fixture(scope="module")
+def sin_limite(entradas_sinteticas):
+    return _sugerencias(entradas_sinteticas)
+
+
+def test_limite_amplio_igual_que_sin_limite(
+    entradas_sinteticas, sin_limite, como_golden
+):
+    amplio = _sugerencias(entradas_sinteticas, max_candidatos=10**6)
+    pd.testing.assert_frame_equal(amplio, sin_limite)
+    pd.testing.assert_frame_equal(
+        como_golden(amplio.drop(columns="_linea"), "sugerencias"),
+        leer_golden("sugerencias"),
+        check_dtype=False,
+    )
+
+
+@pytest.mark.parametrize("criterio", motor.CRITERIOS_CANDIDATOS)
+def test_un_candidato_por_fuente(entradas_sinteticas, sin_limite, criterio):
+    limitado = _sugerencias(
+        entradas_sinteticas, max_candidatos=1, criterio_candidatos=criterio
+    )
+    grupo = ["_linea", Columnas.FUENTE, Columnas.MATERIAL_SUGERIDO]
+    assert limitado.groupby(grupo).size().max() == 1
+    assert sin_limite.groupby(grupo).size().max() > 1
+
+    # Las elegidas son líneas de la salida sin límite y ninguna línea de pedido
+    # ni fuente desaparece
+    texto_limitado = limitado.astype(str)
+    texto_completo = sin_limite.astype(str).drop_duplicates()
+    cruce = texto_limitado.merge(texto_completo, how="left", indicator=True)
+    assert (cruce["_merge"] == "both").all()
+    assert set(map(tuple, limitado[grupo].astype(str).values)) == set(
+        map(tuple, sin_limite[grupo].astype(str).values)
+    )
+
+    if criterio == "caducidad":
+        # Con "caducidad" queda la fecha más próxima de cada grupo
+        fecha = Columnas.FECHA_CADUCIDAD
+        proxima = sin_limite.groupby(grupo)[fecha].min()
+        elegida = limitado.groupby(grupo)[fecha].min()
+        pd.testing.assert_series_equal(elegida, proxima)
+
+
+def test_seleccionar_conserva_el_orden():
+    lineas = [
+        {Columnas.FECHA_CADUCIDAD: pd.Timestamp(2027, m, 1), "i": i}
+        for i, m in enumerate([5, 2, 9, 1])
+    ]
+    elegidas, descartadas = motor.seleccionar_candidatos(lineas, 2)
+    assert [linea["i"] for linea in elegidas] == [1, 3]
+    assert descartadas == 2
+    assert motor.seleccionar_candidatos(lineas, None) == (lineas, 0)
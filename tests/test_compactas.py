@@ -0,0 +1,53 @@
+"""El modelo compacto de sugerencias (SugerenciasCompactas)."""
+
+import pandas as pd
+import pytest
+
+import motor
+from motor import Columnas
+
+
+@pytest.fixture(scope="module")
+def sugerencias(entradas_sinteticas):
+    return motor.generar_sugerencias_compactas(
+        entradas_sinteticas["pedidos"],
+        entradas_sinteticas["externas"],
+        motor.FUENTES_DISPONIBLES,
+        entradas_sinteticas["inventario"],
+    )
+
+
+def test_lineas_sin_armar_el_formato_ancho(sugerencias):
+    ancho = sugerencias.a_formato_ancho()
+    assert len(sugerencias) == len(ancho)
+    assert sugerencias.lineas_por_pedido().sum() == len(ancho)
+
+    sin_sugerencia = ancho[ancho[Columnas.FUENTE] == ""]
+    compactas = sugerencias.lineas_sin_sugerencia()
+    pd.testing.assert_frame_equal(
+        compactas[motor.COLUMNAS_SALIDA_PEDIDO].reset_index(drop=True),
+        sin_sugerencia[motor.COLUMNAS_SALIDA_PEDIDO].reset_index(drop=True),
+        check_dtype=False,
+    )
+
+    bloqueados = (sugerencias.pedidos[Columnas.BLOQUEADO] != "").to_numpy()
+    assert sugerencias.lineas_por_pedido()[bloqueados].sum() == (
+        (ancho[Columnas.BLOQUEADO] != "").sum()
+    )
+
+
+def test_reportes_sin_formato_ancho(entradas_sinteticas, monkeypatch):
+    """El resumen se calcula con el modelo compacto, sin armar el formato ancho."""
+
+    def no_armar(self):
+        raise AssertionError("formato ancho armado antes de mostrar o exportar")
+
+    monkeypatch.setattr(motor.SugerenciasCompactas, "a_formato_ancho", no_armar)
+    reportes = motor.generar_reportes(
+        entradas_sinteticas["pedidos"],
+        entradas_sinteticas["inventario"],
+        entradas_sinteticas["externas"],
+        motor.FUENTES_DISPONIBLES,
+    )
+    assert isinstance(reportes["sugerencias"], motor.SugerenciasCompactas)
+    assert not reportes["resumen"].empty
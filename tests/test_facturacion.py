@@ -0,0 +1,46 @@
+import pandas as pd
+
+import motor
+from benchmarks.generador import generar_conjunto
+from generar_golden import FILAS, SEMILLA
+
+
+def _facturacion_cruda():
+    return generar_conjunto(FILAS, semilla=SEMILLA)["facturacion"]
+
+
+def test_quita_lineas_repetidas_al_cargar():
+    cruda = _facturacion_cruda()
+    procesada = motor.procesar_datos_facturacion(cruda)
+    assert len(procesada) == len(cruda.drop_duplicates())
+    assert not procesada.duplicated(motor.CLAVE_DEDUP_FACTURACION).any()
+
+
+def test_clave_indicada():
+    cruda = _facturacion_cruda()
+    clave = ["Material", "Fecha"]
+    procesada = motor.procesar_datos_facturacion(cruda, clave_dedup=clave)
+    assert len(procesada) < len(cruda.drop_duplicates())
+    assert not procesada.duplicated(clave).any()
+
+
+def test_clave_de_la_variable_de_entorno(monkeypatch):
+    monkeypatch.setenv("SUGERIDOR_CLAVE_DEDUP_FACTURACION", "Material, Fecha")
+    assert motor.clave_dedup_facturacion() == ["Material", "Fecha"]
+    assert motor.clave_dedup_facturacion(["Factura"]) == ["Factura"]
+
+    procesada = motor.procesar_datos_facturacion(_facturacion_cruda())
+    assert not procesada.duplicated(["Material", "Fecha"]).any()
+
+
+def test_clave_incompleta_compara_la_fila_completa():
+    df = pd.DataFrame(
+        {
+            "Factura": ["", "", ""],
+            "Material": ["A", "A", "A"],
+            "Cantidad": [1, 1, 2],
+        }
+    )
+    sin_repetidas, quitadas = motor.deduplicar_facturacion(df)
+    assert quitadas == 1
+    assert sin_repetidas["Cantidad"].tolist() == [1, 2]
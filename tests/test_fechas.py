@@ -0,0 +1,87 @@
+"""Normalización de fechas (normalizar_fechas) y fecha de caducidad de las
+líneas combinadas."""
+
+import datetime
+
+import pandas as pd
+import pytest
+
+import motor
+from benchmarks.generador import generar_conjunto
+from generar_golden import SEMILLA
+from motor import Columnas
+
+COLUMNA_FECHA = "Fecha caducidad"
+FUENTES_CON_FECHA = ["Corta caducidad", "Cosmopark", "PNC", "Caduco"]
+
+
+def test_texto_dia_mes():
+    fechas = motor.normalizar_fechas(
+        pd.Series(["03/04/2026", " 12/01/2027 ", "", None], dtype=object)
+    )
+    assert fechas.tolist()[:2] == [pd.Timestamp(2026, 4, 3), pd.Timestamp(2027, 1, 12)]
+    assert fechas[2:].isna().all()
+
+
+def test_numeros_y_columnas_mixtas():
+    assert motor.normalizar_fechas(pd.Series([46115, 20260403])).tolist() == [
+        pd.Timestamp(2026, 4, 3),
+        pd.Timestamp(2026, 4, 3),
+    ]
+    mixta = pd.Series(
+        ["05/06/2026", 46115, datetime.datetime(2026, 4, 3), "no es fecha"],
+        dtype=object,
+    )
+    assert motor.normalizar_fechas(mixta).tolist()[:3] == [
+        pd.Timestamp(2026, 6, 5),
+        pd.Timestamp(2026, 4, 3),
+        pd.Timestamp(2026, 4, 3),
+    ]
+    assert pd.isna(motor.normalizar_fechas(mixta)[3])
+
+
+@pytest.fixture(scope="module")
+def conjunto_dias_ambiguos():
+    """Conjunto sintético cuyas fechas de caducidad tienen todas día <= 12."""
+    conjunto = generar_conjunto(300, semilla=SEMILLA)
+    for nombre in FUENTES_CON_FECHA:
+        hoja = conjunto["externas"][nombre]
+        hoja[COLUMNA_FECHA] = [
+            f"{i % 12 + 1:02d}/{(i * 5 + 3) % 12 + 1:02d}/2027"
+            for i in range(len(hoja))
+        ]
+    return conjunto
+
+
+def test_lineas_combinadas_con_fecha_de_la_fuente(conjunto_dias_ambiguos, cache_limpia):
+    conjunto = conjunto_dias_ambiguos
+    hojas = {
+        nombre: motor.procesar_hoja_externa(hoja, nombre)
+        for nombre, hoja in conjunto["externas"].items()
+    }
+    sugerencias = motor.formato_ancho(
+        motor.generar_sugerencias_compactas(
+            motor.procesar_hoja_pedidos(conjunto["pedidos"]),
+            hojas,
+            motor.FUENTES_DISPONIBLES,
+            motor.procesar_hoja_inventario_ajustada(conjunto["inventario"]),
+        )
+    )
+
+    esperadas = {
+        (nombre, lote): pd.Timestamp(datetime.datetime.strptime(fecha, "%d/%m/%Y"))
+        for nombre in FUENTES_CON_FECHA
+        for lote, fecha in zip(
+            conjunto["externas"][nombre]["Lote"],
+            conjunto["externas"][nombre][COLUMNA_FECHA],
+        )
+    }
+    con_fecha = sugerencias[sugerencias[Columnas.LOTE] != ""]
+    combinadas = con_fecha[con_fecha[Columnas.FUENTE].str.contains("/", regex=False)]
+    assert not combinadas.empty
+    for fuente, lote, fecha in zip(
+        con_fecha[Columnas.FUENTE],
+        con_fecha[Columnas.LOTE],
+        con_fecha[Columnas.FECHA_CADUCIDAD],
+    ):
+        assert fecha == esperadas[(fuente.split("/")[-1], lote)], (fuente, lote)
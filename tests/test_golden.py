@@ -0,0 +1,52 @@
+"""
+Reportes del motor actual contra los del motor original (tests/golden, ver
+generar_golden.py) sobre el conjunto sintético de benchmarks.generador.
+"""
+
+import pandas as pd
+import pytest
+
+import motor
+from conftest import leer_golden
+from generar_golden import FECHA_CORTE, REPORTES
+
+
+@pytest.fixture(scope="module")
+def reportes(entradas_sinteticas):
+    return motor.generar_reportes(
+        entradas_sinteticas["pedidos"],
+        entradas_sinteticas["inventario"],
+        entradas_sinteticas["externas"],
+        motor.FUENTES_DISPONIBLES,
+        entradas_sinteticas["facturacion"],
+        generar_consumo=True,
+        fecha_corte=FECHA_CORTE,
+    )
+
+
+@pytest.mark.parametrize("nombre", REPORTES)
+def test_reporte_igual_al_motor_original(reportes, como_golden, nombre):
+    pd.testing.assert_frame_equal(
+        como_golden(reportes[nombre], nombre), leer_golden(nombre), check_dtype=False
+    )
+
+
+def test_exportacion_conserva_los_reportes(reportes):
+    """El libro combinado trae los mismos valores que los reportes."""
+    libro = pd.read_excel(
+        motor.io.BytesIO(
+            motor.exportar_a_excel(
+                motor.formato_ancho(reportes["sugerencias"]),
+                reportes["resumen"],
+                reportes["consumo"],
+            )
+        ),
+        sheet_name=None,
+    )
+    assert list(libro) == [
+        "Todas las Sugerencias",
+        "Resumen Sin Sugerencias",
+        "Reporte de Consumo",
+    ]
+    for hoja, nombre in zip(libro.values(), REPORTES):
+        assert hoja.shape == leer_golden(nombre).shape
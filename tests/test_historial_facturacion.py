@@ -0,0 +1,40 @@
+import os
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import motor
+from generar_golden import FECHA_CORTE
+from historial_facturacion import HistorialFacturacion
+
+
+def _consumo(cubo):
+    reporte = motor.generar_reporte_consumo(None, cubo=cubo, fecha_corte=FECHA_CORTE)
+    return reporte.sort_values(motor.CLAVE_CLIENTE).reset_index(drop=True)
+
+
+def test_archivos_nuevos_reemplazan_solo_sus_meses(entradas_sinteticas, tmp_path):
+    facturacion = entradas_sinteticas["facturacion"]
+    meses = motor.clave_mes(facturacion["Fecha"])
+    corte = sorted(meses.unique())[len(meses.unique()) // 2]
+    anterior = facturacion[meses <= corte]
+    # El archivo nuevo repite el mes de corte con otras cantidades
+    nuevo = facturacion[meses >= corte].assign(Cantidad=lambda df: df["Cantidad"] * 2)
+
+    ruta = str(tmp_path / "historial")
+    for df in (anterior, nuevo):
+        motor.actualizar_historial_facturacion(
+            ruta, motor.FacturacionCube.desde_facturacion(df)
+        )
+
+    historial = HistorialFacturacion(ruta)
+    assert historial.meses() == sorted(meses.unique())
+    assert os.path.exists(
+        os.path.join(ruta, "facturacion_cliente", f"mes={corte}", "datos.parquet")
+    )
+
+    esperado = pd.concat([facturacion[meses < corte], nuevo])
+    assert_frame_equal(
+        _consumo(motor.FacturacionCube(historial.leer())),
+        _consumo(motor.FacturacionCube.desde_facturacion(esperado)),
+    )
@@ -0,0 +1,73 @@
+"""Ingesta de una carpeta de libros y lectura de sus artefactos."""
+
+import os
+
+import pandas as pd
+import pytest
+
+import ingesta
+import motor
+
+
+def _por_parquet(df: pd.DataFrame, ruta) -> pd.DataFrame:
+    ingesta.guardar_parquet(df, str(ruta))
+    return pd.read_parquet(ruta)
+
+
+@pytest.fixture(scope="module")
+def version(libros_sinteticos, tmp_path_factory):
+    entrada = os.path.dirname(libros_sinteticos["pedidos"])
+    salida = str(tmp_path_factory.mktemp("artefactos"))
+    vigilante = ingesta.VigilanteIngesta(entrada, salida)
+
+    # Primera revisión: los libros podrían estar copiándose todavía
+    assert vigilante.revisar() is None
+    ruta = vigilante.revisar()
+    assert ruta == ingesta.ultima_version(salida)
+    # El mismo juego de libros no se vuelve a procesar, tampoco al reiniciar
+    assert vigilante.revisar() is None
+    assert ingesta.VigilanteIngesta(entrada, salida).revisar() is None
+    return ruta
+
+
+def test_manifiesto(version, libros_sinteticos):
+    manifiesto = ingesta.leer_manifiesto(version)
+    assert manifiesto["version"] == os.path.basename(version)
+    assert manifiesto["libros"] == {
+        tipo: os.path.basename(ruta) for tipo, ruta in libros_sinteticos.items()
+    }
+    assert manifiesto["reportes"] == ["consumo", "sugerencias", "resumen"]
+    assert manifiesto["filas"]["pedidos.parquet"] == 200
+    assert not [n for n in os.listdir(os.path.dirname(version)) if n.endswith(".tmp")]
+
+
+def test_artefactos_iguales_a_los_reportes(
+    version, libros_sinteticos, tmp_path, cache_limpia
+):
+    artefactos = ingesta.cargar_artefactos(version)
+    assert artefactos.version == os.path.basename(version)
+    assert set(artefactos.hojas_externas) == set(motor.FUENTES_DISPONIBLES)
+
+    reportes = motor.generar_reportes(
+        motor.cargar_pedidos(libros_sinteticos["pedidos"]),
+        motor.cargar_inventario(libros_sinteticos["inventario"]),
+        motor.cargar_hojas_externas(libros_sinteticos["externas"]),
+        motor.FUENTES_DISPONIBLES,
+        motor.cargar_facturacion(libros_sinteticos["facturacion"]),
+        generar_consumo=True,
+    )
+    assert set(artefactos.reportes) == set(reportes)
+
+    pd.testing.assert_frame_equal(
+        motor.formato_ancho(artefactos.reportes["sugerencias"]),
+        _por_parquet(
+            motor.formato_ancho(reportes["sugerencias"]),
+            tmp_path / "sugerencias.parquet",
+        ),
+    )
+    for nombre in ("resumen", "consumo"):
+        pd.testing.assert_frame_equal(
+            artefactos.reportes[nombre],
+            _por_parquet(reportes[nombre], tmp_path / f"{nombre}.parquet"),
+            obj=nombre,
+        )
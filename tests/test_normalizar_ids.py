@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor
+
+
+@pytest.mark.parametrize(
+    "serie, esperado",
+    [
+        (pd.Series([1001, 7]), ["1001", "7"]),
+        (
+            pd.Series([1001.0, np.nan, 1.5, -0.0, 1e16]),
+            ["1001", "nan", "1.5", "-0", "1e+16"],
+        ),
+        # float32: los enteros como enteros aunque su str sea exponencial
+        (
+            pd.Series([123456792.0, 1001.0, 2.5, np.nan], dtype="float32"),
+            ["123456792", "1001", "2.5", "nan"],
+        ),
+        (pd.Series([1, None], dtype="Int64"), ["1", "<NA>"]),
+        (pd.Series([True, False]), ["True", "False"]),
+        (
+            pd.Series([" 1001.0 ", 1001.0, 5, None, "a.00", "x\t", "1.0.0", "　z"]),
+            ["1001", "1001", "5", "None", "a", "x", "1.0", "z"],
+        ),
+        (pd.Series([" A1.0", "B "], dtype="string"), ["A1", "B"]),
+    ],
+)
+def test_normalizar_ids(serie, esperado):
+    serie.index = serie.index * 2
+    serie.name = "Material"
+    resultado = motor.normalizar_ids(serie)
+    assert resultado.tolist() == esperado
+    assert resultado.dtype == object
+    assert resultado.index.equals(serie.index)
+    assert resultado.name == "Material"
+
+
+def test_texto_que_arrow_no_admite():
+    # Un carácter sustituto suelto no es UTF-8 válido: se usa pandas
+    resultado = motor.normalizar_ids(pd.Series([" \ud800.0 ", "7.0"]))
+    assert resultado.tolist() == ["\ud800", "7"]
@@ -0,0 +1,51 @@
+import tracemalloc
+
+from rendimiento import RegistroRendimiento, medir, sesion_rendimiento
+
+
+def _etapas(registro):
+    return {fila["Etapa"]: fila for fila in registro.resumen()}
+
+
+def test_memoria_de_una_sesion():
+    registro = RegistroRendimiento(memoria=True)
+    with sesion_rendimiento(registro):
+        assert tracemalloc.is_tracing()
+        with medir("asignar"):
+            datos = bytearray(8 * 1024 * 1024)
+        del datos
+    assert not tracemalloc.is_tracing()
+    assert _etapas(registro)["asignar"]["Memoria pico (MB)"] >= 8
+
+
+def test_sesiones_solapadas_comparten_tracemalloc():
+    primero = RegistroRendimiento(memoria=True)
+    segundo = RegistroRendimiento(memoria=True)
+
+    primero.iniciar()
+    with primero.medir("antes"):
+        segundo.iniciar()
+        with segundo.medir("solapada"):
+            pass
+        segundo.detener()
+        # La primera sesión sigue midiendo aunque la segunda terminó
+        assert tracemalloc.is_tracing()
+    with primero.medir("despues"):
+        pass
+    primero.detener()
+    assert not tracemalloc.is_tracing()
+
+    # El pico de tracemalloc no se puede atribuir mientras hubo solapamiento
+    assert _etapas(primero)["antes"]["Memoria pico (MB)"] is None
+    assert _etapas(segundo)["solapada"]["Memoria pico (MB)"] is None
+    assert _etapas(primero)["despues"]["Memoria pico (MB)"] is not None
+
+
+def test_no_detiene_tracemalloc_ajeno():
+    tracemalloc.start()
+    try:
+        with sesion_rendimiento(RegistroRendimiento(memoria=True)):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,108 @@
+"""Los fragmentos y las líneas reutilizadas de la caché dan el mismo resultado
+que una ejecución desde cero."""
+
+import pandas as pd
+import pytest
+
+import motor
+from motor import Columnas
+
+PENDIENTE = "Pendiente"
+
+
+def _pedidos_modificados(pedidos: pd.DataFrame) -> pd.DataFrame:
+    """Archivo de pedidos actualizado: cambian cantidades, se quitan y se
+    repiten líneas."""
+    pedidos = pedidos.copy()
+    pedidos.loc[pedidos.index[::7], PENDIENTE] += 5
+    pedidos = pedidos.drop(pedidos.index[1::11])
+    return pd.concat([pedidos, pedidos.head(20)], ignore_index=True)
+
+
+def _reportes(entradas, pedidos, fuentes, avisos=None):
+    reportes = motor.generar_reportes(
+        pedidos,
+        entradas["inventario"],
+        entradas["externas"],
+        fuentes,
+        avisar=None if avisos is None else avisos.append,
+    )
+    return {
+        "sugerencias": motor.formato_ancho(reportes["sugerencias"]),
+        "resumen": reportes["resumen"],
+    }
+
+
+@pytest.fixture(scope="module")
+def ejecuciones(entradas_sinteticas):
+    pedidos = entradas_sinteticas["pedidos"].head(400)
+    todas = motor.FUENTES_DISPONIBLES
+    return [
+        (pedidos, todas),
+        (pedidos, ["Lento mov", "Sustituto"]),
+        (pedidos, ["Corta caducidad", "Sustituto", "Caduco"]),
+        (pedidos, todas),
+        (_pedidos_modificados(pedidos), todas),
+        (_pedidos_modificados(pedidos), ["Cosmopark", "PNC"]),
+    ]
+
+
+def test_reutilizar_cache_igual_que_desde_cero(
+    entradas_sinteticas, ejecuciones, cache_limpia
+):
+    # Ejecuciones seguidas: cada una reutiliza lo calculado por las anteriores
+    avisos = []
+    con_cache = [
+        _reportes(entradas_sinteticas, pedidos, fuentes, avisos)
+        for pedidos, fuentes in ejecuciones
+    ]
+    reutilizadas = [a for a in avisos if a.startswith("♻️")]
+    assert len(reutilizadas) == len(ejecuciones) - 1
+
+    for (pedidos, fuentes), reutilizados in zip(ejecuciones, con_cache):
+        cache_limpia.limpiar()
+        desde_cero = _reportes(entradas_sinteticas, pedidos, fuentes)
+        for nombre, df in desde_cero.items():
+            pd.testing.assert_frame_equal(
+                reutilizados[nombre].reset_index(drop=True),
+                df.reset_index(drop=True),
+                obj=f"{nombre} con {fuentes}",
+            )
+
+
+def test_fuentes_desactivadas_no_aparecen(entradas_sinteticas, cache_limpia):
+    pedidos = entradas_sinteticas["pedidos"]
+    _reportes(entradas_sinteticas, pedidos, motor.FUENTES_DISPONIBLES)
+    sugerencias = _reportes(entradas_sinteticas, pedidos, ["Sustituto"])["sugerencias"]
+    fuentes = set(sugerencias[Columnas.FUENTE]) - {""}
+    assert fuentes and all(f.startswith("Sustituto") for f in fuentes)
+
+
+def test_cambios_respecto_a_la_corrida_del_mismo_llamador(
+    entradas_sinteticas, cache_limpia
+):
+    pedidos = entradas_sinteticas["pedidos"].head(100)
+    modificados = pedidos.copy()
+    modificados.loc[modificados.index[:3], PENDIENTE] += 5
+
+    def cambios(pedidos_df, corrida_anterior):
+        avisos = []
+        motor.generar_sugerencias_compactas(
+            pedidos_df,
+            entradas_sinteticas["externas"],
+            motor.FUENTES_DISPONIBLES,
+            entradas_sinteticas["inventario"],
+            avisar=avisos.append,
+            corrida_anterior=corrida_anterior,
+        )
+        return [a for a in avisos if a.startswith("🔁")]
+
+    primero, segundo = {}, {}
+    assert cambios(pedidos, primero) == []
+    # Otro usuario con las mismas fuentes no es la corrida anterior del primero
+    assert cambios(modificados, segundo) == []
+    assert cambios(pedidos, None) == []
+    (aviso,) = cambios(modificados, primero)
+    assert "3 modificadas" in aviso and "0 nuevas" in aviso
+    (aviso,) = cambios(modificados, segundo)
+    assert "0 modificadas" in aviso
@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+import motor
+import servicio
+from motor import Columnas
+
+
+@pytest.fixture
+def servidor(libros_sinteticos, cache_limpia):
+    sugeridor = servicio.ServicioSugerencias(
+        os.path.dirname(libros_sinteticos["inventario"])
+    )
+    sugeridor.recargar()
+    http = servicio.crear_servidor(sugeridor, puerto=0)
+    hilo = threading.Thread(target=http.serve_forever, daemon=True)
+    hilo.start()
+    yield sugeridor, f"http://127.0.0.1:{http.server_address[1]}"
+    http.shutdown()
+    http.server_close()
+
+
+def _pedir(url, cuerpo=None):
+    datos = None if cuerpo is None else json.dumps(cuerpo).encode("utf-8")
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=datos)) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_sugerencias_por_http(servidor, libros_sinteticos):
+    sugeridor, url = servidor
+    lineas = json.loads(
+        pd.read_excel(libros_sinteticos["pedidos"])
+        .head(30)
+        .to_json(orient="records", date_format="iso")
+    )
+
+    codigo, estado = _pedir(f"{url}/estado")
+    assert codigo == 200 and estado["version"] == 1
+
+    codigo, respuesta = _pedir(f"{url}/sugerencias", {"lineas": lineas})
+    assert codigo == 200
+    assert [r["linea"] for r in respuesta["resultados"]] == list(range(len(lineas)))
+
+    # Las mismas sugerencias que el motor en lote sobre la misma instantánea
+    ancho = motor.generar_todas_sugerencias(
+        motor.procesar_hoja_pedidos(pd.DataFrame.from_records(lineas)),
+        sugeridor.instantanea.hojas_externas,
+        motor.FUENTES_DISPONIBLES,
+        sugeridor.instantanea.inventario_df,
+    )
+    candidatos = ancho[ancho[Columnas.FUENTE] != ""]
+    recibidas = [s for r in respuesta["resultados"] for s in r["sugerencias"]]
+    assert [s[Columnas.MATERIAL_SUGERIDO] for s in recibidas] == candidatos[
+        Columnas.MATERIAL_SUGERIDO
+    ].tolist()
+    assert [s[Columnas.CANTIDAD_OFERTAR] for s in recibidas] == candidatos[
+        Columnas.CANTIDAD_OFERTAR
+    ].tolist()
+
+    # Una sola línea, con límite de candidatos
+    codigo, respuesta = _pedir(
+        f"{url}/sugerencias", {"lineas": lineas[:1], "max_candidatos": 1}
+    )
+    assert codigo == 200
+    por_fuente = pd.Series(
+        [s[Columnas.FUENTE] for s in respuesta["resultados"][0]["sugerencias"]]
+    )
+    assert (por_fuente.value_counts() <= 1).all()
+
+
+@pytest.mark.parametrize(
+    "consulta",
+    [
+        {"lineas": [{"Material": "1"}]},
+        {"lineas": [{"Material": "1", "Centro": "1001"}], "fuentes": ["X"]},
+        {"lineas": [{"Material": "1", "Centro": "1001"}], "fuentes": "Sustituto"},
+        {"lineas": [{"Material": "1", "Centro": "1001"}], "max_candidatos": True},
+        {"lineas": [{"Material": "1", "Centro": "1001"}], "max_candidatos": 0},
+        {"lineas": [{"Material": "1", "Centro": "1001"}], "max_candidatos": 1.5},
+        [],
+    ],
+)
+def test_consultas_no_validas(servidor, consulta):
+    _, url = servidor
+    codigo, respuesta = _pedir(f"{url}/sugerencias", consulta)
+    assert codigo == 400
+    assert respuesta["error"]
+
+
+def test_ruta_desconocida(servidor):
+    _, url = servidor
+    assert _pedir(f"{url}/otra", {})[0] == 404
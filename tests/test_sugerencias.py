@@ -0,0 +1,163 @@
+"""Casos puntuales de "Todas las Sugerencias"."""
+
+import pandas as pd
+
+import motor
+from motor import Columnas
+
+
+def _pedidos(materiales):
+    return motor.procesar_hoja_pedidos(
+        pd.DataFrame(
+            {
+                "Pedido": [40000001 + i for i in range(len(materiales))],
+                "Solicitante": 100001,
+                "Destinatario": 100001,
+                "Centro": 1001.0,
+                "Almacen": 1030.0,
+                "Material": [float(m) for m in materiales],
+                "Texto Material": "TABLETA 10MG",
+                "Cantidad": 300,
+                "Pendiente": 236,
+                "Precio": 10.0,
+                "Bloqueo Ent.": "",
+            }
+        )
+    )
+
+
+def _inventario(materiales):
+    return motor.procesar_hoja_inventario_ajustada(
+        pd.DataFrame(
+            {
+                "Centro": 1001.0,
+                "Material": [float(m) for m in materiales],
+                "Almacen": 1030.0,
+                "Texto breve de material": "TABLETA 10MG",
+                "Libre utilización": 1000.0,
+                "Cant. en tránsito": 0.0,
+                "Entrega a cliente": 0.0,
+            }
+        )
+    )
+
+
+def _corta_caducidad(material, cantidad):
+    return motor.procesar_hoja_externa(
+        pd.DataFrame(
+            {
+                "Material": [float(material)],
+                "Centro": [1003.0],
+                "Almacén": [1031.0],
+                "Cantidad": [cantidad],
+                "Lote": ["L0000001"],
+                "Fecha caducidad": ["15/03/2027"],
+            }
+        ),
+        "Corta caducidad",
+    )
+
+
+def test_corta_caducidad_sin_filas_de_inventario():
+    """
+    El disponible de Corta caducidad sale de la hoja externa aunque el
+    material no tenga filas en el inventario.
+    """
+    sugerencias = motor.generar_todas_sugerencias(
+        _pedidos(["5000001"]),
+        {"Corta caducidad": _corta_caducidad("5000001", 509)},
+        ["Corta caducidad"],
+        _inventario(["5000002"]),
+    )
+
+    linea = sugerencias[sugerencias[Columnas.FUENTE] == "Corta caducidad"]
+    assert len(linea) == 1
+    assert linea[Columnas.DISPONIBLE].iloc[0] == 509
+    assert linea[Columnas.CANTIDAD_OFERTAR].iloc[0] == 236
+
+
+def test_pedidos_sin_material_en_las_fuentes():
+    """
+    Los pedidos cuyo material no está en ninguna fuente no se buscan en ellas,
+    pero conservan su línea sin sugerencia y su lugar en el reporte.
+    """
+    materiales = ["5000003", "5000001", "5000004"]
+    sugerencias = motor.generar_todas_sugerencias(
+        _pedidos(materiales),
+        {"Corta caducidad": _corta_caducidad("5000001", 509)},
+        ["Corta caducidad"],
+        _inventario(materiales),
+    )
+
+    assert sugerencias[Columnas.MATERIAL_SOLICITADO].tolist() == [
+        "5000003",
+        "5000001",
+        "5000001",
+        "5000004",
+    ]
+    assert sugerencias[Columnas.FUENTE].tolist() == ["", "", "Corta caducidad", ""]
+
+
+def test_centros_y_almacenes_configurados():
+    centros = motor.CentrosAlmacenes(
+        centros=["1001", "2001"],
+        almacenes=["1030", "2030"],
+        almacenes_inv_centro=["1030"],
+        centro_disponible="1001",
+        almacenes_disponible=["1030"],
+    )
+    sugerencias = motor.generar_todas_sugerencias(
+        _pedidos(["5000001"]),
+        {"Corta caducidad": _corta_caducidad("5000001", 509)},
+        ["Corta caducidad"],
+        _inventario(["5000001"]),
+        centros=centros,
+    )
+
+    assert list(sugerencias.columns) == motor.columnas_sugerencias(centros)
+    assert "Inv 1030" in sugerencias.columns and "Inv 1031" not in sugerencias.columns
+    sin_sugerencia = sugerencias.iloc[0]
+    assert sin_sugerencia["Inv 1001"] == 1000
+    assert sin_sugerencia["Inv 2001"] == 0
+
+    assert motor.get_inventory_by_all_centers_filtered(
+        _inventario(["5000001"]), "5000001", ["1030"]
+    ) == {"1001": 1000.0}
+    assert (
+        motor.get_inventory_by_all_centers_filtered(
+            _inventario(["5000001"]), "5000001", ["2030"]
+        )
+        == {}
+    )
+
+
+def test_centros_del_entorno_una_vez_por_corrida(
+    entradas_sinteticas, monkeypatch, cache_limpia
+):
+    """Las funciones por línea de pedido reciben los centros ya resueltos."""
+    llamadas = []
+    desde_entorno = motor.CentrosAlmacenes.desde_entorno
+
+    def contar(*args, **kwargs):
+        llamadas.append(1)
+        return desde_entorno(*args, **kwargs)
+
+    monkeypatch.setattr(motor.CentrosAlmacenes, "desde_entorno", contar)
+    pedidos = entradas_sinteticas["pedidos"].head(200)
+
+    motor.generar_reportes(
+        pedidos,
+        entradas_sinteticas["inventario"],
+        entradas_sinteticas["externas"],
+        motor.FUENTES_DISPONIBLES,
+        centros=desde_entorno(),
+    )
+    assert llamadas == []
+
+    motor.generar_reportes(
+        pedidos,
+        entradas_sinteticas["inventario"],
+        entradas_sinteticas["externas"],
+        motor.FUENTES_DISPONIBLES,
+    )
+    assert len(llamadas) == 1
@@ -0,0 +1,48 @@
+import time
+
+import motor
+from trabajos import TERMINADO, GestorTrabajos, huella_trabajo
+
+
+def _esperar(trabajo, segundos: float = 120):
+    limite = time.time() + segundos
+    while trabajo.activo and time.time() < limite:
+        time.sleep(0.05)
+    assert trabajo.estado == TERMINADO, trabajo.error
+
+
+def test_depuracion_llega_al_pipeline(libros_sinteticos, cache_limpia):
+    with open(libros_sinteticos["pedidos"], "rb") as f:
+        contenidos = [f.read()]
+    archivos = [libros_sinteticos["inventario"], libros_sinteticos["externas"]]
+
+    gestor = GestorTrabajos(max_trabajadores=1)
+    try:
+        trabajos = {}
+        # La corrida en depuración llega con la caché ya cargada por la normal
+        for depuracion in (False, True):
+            huella = huella_trabajo(contenidos, {"depuracion": depuracion})
+            trabajos[depuracion] = gestor.enviar(
+                huella,
+                motor.ejecutar_pipeline,
+                *contenidos,
+                *archivos,
+                generar_resumen=False,
+                depuracion=depuracion,
+            )
+            _esperar(trabajos[depuracion])
+            # La misma huella reutiliza el trabajo
+            assert (
+                gestor.enviar(huella, motor.ejecutar_pipeline) is trabajos[depuracion]
+            )
+    finally:
+        gestor.cerrar()
+
+    def columnas(trabajo):
+        return [m for m in trabajo.avisos if m.startswith("Columnas: ")]
+
+    assert not columnas(trabajos[False])
+    assert columnas(trabajos[True])
+    assert len(trabajos[True].resultados["sugerencias"]) == len(
+        trabajos[False].resultados["sugerencias"]
+    )
@@ -0,0 +1,186 @@
+"""
+Ejecución de trabajos en segundo plano.
+
+El pipeline completo puede tardar minutos. Si se ejecuta dentro del script de
+Streamlit, cualquier clic en un widget reinicia todo y recargar el navegador
+pierde el trabajo. `GestorTrabajos` ejecuta cada corrida en un hilo de un pool
+compartido por todo el proceso y la identifica por una huella de los archivos
+de entrada y las opciones: volver a pedir la misma huella devuelve el trabajo
+existente (en curso o terminado) en lugar de recalcularlo.
+
+Los trabajos terminados se conservan `ttl_segundos` y luego se descartan. Se
+usan hilos (no procesos) para que los resultados se compartan sin copiarlos;
+pandas libera el GIL en buena parte de sus operaciones.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from rendimiento import RegistroRendimiento, sesion_rendimiento
+
+logger = logging.getLogger(__name__)
+
+EN_COLA = "en_cola"
+EJECUTANDO = "ejecutando"
+TERMINADO = "terminado"
+ERROR = "error"
+
+
+def huella_trabajo(contenidos: Iterable[Optional[bytes]], opciones: Dict) -> str:
+    """Huella de los archivos de entrada (bytes) y de las opciones de la corrida."""
+    h = hashlib.blake2b(digest_size=16)
+    for contenido in contenidos:
+        if contenido is None:
+            h.update(b"\x00")
+        else:
+            h.update(len(contenido).to_bytes(8, "little"))
+            h.update(contenido)
+    h.update(json.dumps(opciones, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class Trabajo:
+    """Estado observable de una corrida en segundo plano."""
+
+    def __init__(
+        self,
+        huella: str,
+        descripcion: str = "",
+        rendimiento: Optional[RegistroRendimiento] = None,
+    ):
+        self.huella = huella
+        self.descripcion = descripcion
+        self.rendimiento = rendimiento
+        self.estado = EN_COLA
+        self.fraccion = 0.0
+        self.texto = "En cola..."
+        self.avisos: List[str] = []
+        self.resultados: Dict[str, object] = {}
+        self.error: Optional[str] = None
+        self.creado = time.time()
+        self.terminado: Optional[float] = None
+        self._lock = threading.Lock()
+
+    # Callbacks que recibe la función del trabajo
+    def avisar(self, mensaje: str) -> None:
+        with self._lock:
+            self.avisos.append(mensaje)
+
+    def progreso(self, fraccion: float, texto: str) -> None:
+        with self._lock:
+            self.fraccion = fraccion
+            if texto:
+                self.texto = texto
+
+    def publicar(self, clave: str, valor: object) -> None:
+        """Publica un resultado parcial (visible antes de que termine el trabajo)."""
+        with self._lock:
+            self.resultados[clave] = valor
+
+    @property
+    def activo(self) -> bool:
+        return self.estado in (EN_COLA, EJECUTANDO)
+
+    @property
+    def duracion(self) -> float:
+        return (self.terminado or time.time()) - self.creado
+
+    def expirado(self, ttl_segundos: float) -> bool:
+        return (
+            self.terminado is not None and time.time() - self.terminado > ttl_segundos
+        )
+
+
+class GestorTrabajos:
+    """Pool de trabajos en segundo plano compartido por todas las sesiones."""
+
+    def __init__(self, max_trabajadores: int = 2, ttl_segundos: float = 3600):
+        self.ttl_segundos = ttl_segundos
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_trabajadores, thread_name_prefix="trabajo"
+        )
+        self._trabajos: Dict[str, Trabajo] = {}
+        self._lock = threading.Lock()
+
+    def enviar(
+        self,
+        huella: str,
+        funcion: Callable[..., Dict[str, object]],
+        *args,
+        descripcion: str = "",
+        rendimiento: Optional[RegistroRendimiento] = None,
+        **kwargs,
+    ) -> Trabajo:
+        """
+        Lanza `funcion(*args, avisar=..., progreso=..., al_generar=..., **kwargs)`
+        si no hay ya un trabajo vigente con la misma huella. Un trabajo con error
+        se reintenta; uno en curso o terminado se reutiliza.
+        """
+        self.purgar()
+        with self._lock:
+            trabajo = self._trabajos.get(huella)
+            if trabajo is not None and trabajo.estado != ERROR:
+                return trabajo
+            trabajo = Trabajo(huella, descripcion, rendimiento)
+            self._trabajos[huella] = trabajo
+
+        self._pool.submit(self._ejecutar, trabajo, funcion, args, kwargs)
+        return trabajo
+
+    def _ejecutar(self, trabajo: Trabajo, funcion, args, kwargs) -> None:
+        trabajo.estado = EJECUTANDO
+        trabajo.texto = "Procesando..."
+        try:
+            with sesion_rendimiento(trabajo.rendimiento):
+                resultados = funcion(
+                    *args,
+                    avisar=trabajo.avisar,
+                    progreso=trabajo.progreso,
+                    al_generar=trabajo.publicar,
+                    **kwargs,
+                )
+            for clave, valor in (resultados or {}).items():
+                trabajo.publicar(clave, valor)
+            trabajo.fraccion = 1.0
+            trabajo.estado = TERMINADO
+        except Exception as e:
+            logger.error(f"Error en trabajo {trabajo.huella}: {str(e)}", exc_info=True)
+            trabajo.error = f"{str(e)}\n{traceback.format_exc()}"
+            trabajo.estado = ERROR
+        finally:
+            trabajo.terminado = time.time()
+
+    def obtener(self, huella: str) -> Optional[Trabajo]:
+        with self._lock:
+            trabajo = self._trabajos.get(huella)
+        if trabajo is not None and trabajo.expirado(self.ttl_segundos):
+            self.purgar()
+            return None
+        return trabajo
+
+    def trabajos(self) -> List[Trabajo]:
+        """Trabajos vigentes, del más reciente al más antiguo."""
+        self.purgar()
+        with self._lock:
+            return sorted(self._trabajos.values(), key=lambda t: -t.creado)
+
+    def purgar(self) -> int:
+        """Descarta los trabajos terminados hace más de `ttl_segundos`."""
+        with self._lock:
+            expirados = [
+                huella
+                for huella, trabajo in self._trabajos.items()
+                if trabajo.expirado(self.ttl_segundos)
+            ]
+            for huella in expirados:
+                del self._trabajos[huella]
+        return len(expirados)
+
+    def cerrar(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)